@@ -0,0 +1,260 @@
+"""
+Benchmark suite for card loading, rendering and battle resolution. This is not a test suite: it times the hot
+paths and reports throughput and p50/p99 latencies, so changes to the battle loop or the renderer can be measured.
+
+    python -m benchmarks.bench                          # Run every benchmark
+    python -m benchmarks.bench --save baseline.json     # Store the results as a baseline
+    python -m benchmarks.bench --compare baseline.json  # Compare against a baseline and flag regressions
+
+Every benchmark uses fixed OCs and seeds, so runs on the same machine are comparable. The comparison exits with
+status 1 if any benchmark's p50 latency is slower than the baseline by more than the threshold.
+"""
+from typing import List, Set, Dict, Tuple, Optional, Callable
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+import bot
+from benchmarks import fake_discord
+from modules.mechanics.oc import OC
+from modules.mechanics.party import Party
+from modules.mechanics.battlefield import Battlefield
+from modules.mechanics.action import Action
+from modules.mechanics.rng import BattleRNG
+from modules.processing import data_processing
+from modules.processing import dynamics
+from modules.processing import outbox
+
+
+BASELINE_VERSION = 1
+DEFAULT_THRESHOLD = 0.15  # Allowed p50 slowdown against the baseline before it counts as a regression
+DATA_PATH = 'data/oc_data.json'
+PARTY_A = (5, 8, 2)       # The lineups of the sample battle in bot.py
+PARTY_B = (4, 3, 0)
+BATTLE_SEED = 1234
+
+
+def time_calls(func: Callable, iterations: int, setup: Callable = None, warmup: int = 2) -> List[float]:
+    """Times a function call repeatedly. Garbage collection is paused while timing.
+
+    :param func: The function to time. It is passed the return value of setup, if given.
+    :param iterations: How many timed calls to make.
+    :param setup: Untimed function run before every call, e.g. to reset a cache.
+    :param warmup: How many untimed calls to make first.
+    :return: A list of the call times in seconds.
+    """
+    times = []
+    for i in range(warmup + iterations):
+        args = (setup(),) if setup is not None else ()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func(*args)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if i >= warmup:
+            times.append(elapsed)
+    return times
+
+
+def summarize(times: List[float]) -> Dict[str, float]:
+    """Summarizes call times.
+    :return: A dictionary of iterations, mean, p50 and p99 (in seconds) and throughput (calls per second).
+    """
+    values = np.array(times)
+    return {
+        'iterations': len(times),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p99': float(np.percentile(values, 99)),
+        'throughput': float(len(times) / values.sum()) if values.sum() > 0 else 0.0
+    }
+
+
+def _new_field(table: 'data_processing.OCTable', seed: int = BATTLE_SEED) -> Battlefield:
+    """Builds the sample battle from bot.py with a fixed seed."""
+    player_party = Party([OC(table, ID) for ID in PARTY_A], 'Player', '1')
+    AI_party = Party([OC(table, ID) for ID in PARTY_B], 'AI', 'AI')
+    return Battlefield(table, player_party, AI_party, BattleRNG(seed))
+
+
+def _queued_field(table: 'data_processing.OCTable') -> Battlefield:
+    """Builds the sample battle with every OC's action for the first turn queued, like the battle loop does."""
+    field = _new_field(table)
+    turn_order = field.calculate_turns()
+    for oc in field.get_party(0).get_OCs():
+        oc.set_target(0)
+    for oc in field.get_party(1).get_OCs():
+        oc.set_target(field.get_party(0).get_random())
+    for oc in turn_order:
+        field.add(Action(field, oc, oc.target))
+    return field
+
+
+def bench_load_json(scale: float) -> List[float]:
+    """Reads and parses the OC JSON database."""
+    return time_calls(lambda: data_processing.load_json(DATA_PATH), int(50 * scale))
+
+
+def bench_party_image_cold(scale: float) -> List[float]:
+    """Renders a party lineup with empty card art and lineup caches."""
+    table = data_processing.load_catalogue(DATA_PATH).table
+    party = [OC(table, ID) for ID in PARTY_A]
+    return time_calls(lambda _: dynamics.create_party_image(party, in_memory=True), int(20 * scale),
+                      setup=dynamics.clear_caches)
+
+
+def bench_party_image_warm(scale: float) -> List[float]:
+    """Renders a party lineup that is already cached."""
+    table = data_processing.load_catalogue(DATA_PATH).table
+    party = [OC(table, ID) for ID in PARTY_A]
+    return time_calls(lambda: dynamics.create_party_image(party, in_memory=True), int(500 * scale))
+
+
+def bench_calculate_turns(scale: float) -> List[float]:
+    """Orders the turns of a new battle."""
+    table = data_processing.load_catalogue(DATA_PATH).table
+    return time_calls(lambda field: field.calculate_turns(), int(2000 * scale), setup=lambda: _new_field(table))
+
+
+def bench_evaluate(scale: float) -> List[float]:
+    """Resolves the first turn of the sample battle, including the Discord text."""
+    table = data_processing.load_catalogue(DATA_PATH).table
+    return time_calls(lambda field: field.evaluate(), int(2000 * scale), setup=lambda: _queued_field(table))
+
+
+def bench_AI_battle(scale: float) -> List[float]:
+    """Plays the scripted sample battle through the bot's command handling, against a fake channel."""
+    client = fake_discord.FakeClient()
+    author = fake_discord.FakeUser('Player')
+    snapshot_dir = tempfile.TemporaryDirectory()
+    bot.SNAPSHOT_DIR = snapshot_dir.name
+
+    async def run() -> List[float]:
+        times = []
+        for i in range(2 + max(1, int(5 * scale))):
+            channel = fake_discord.FakeChannel()
+            outbox.get_limiter(channel.id).messages = 10 ** 9  # Time the bot's own work, not Discord's pacing
+            start = time.perf_counter()
+            await fake_discord.play_battle(client, channel, author, BATTLE_SEED)
+            if i >= 2:
+                times.append(time.perf_counter() - start)
+        return times
+
+    try:
+        return asyncio.run(run())
+    finally:
+        snapshot_dir.cleanup()
+
+
+# Benchmark name -> function taking an iteration scale and returning call times
+BENCHMARKS = {
+    'load_json': bench_load_json,
+    'create_party_image_cold': bench_party_image_cold,
+    'create_party_image_warm': bench_party_image_warm,
+    'calculate_turns': bench_calculate_turns,
+    'evaluate': bench_evaluate,
+    'AI_battle': bench_AI_battle
+}
+
+
+def run_benchmarks(names: List[str] = None, scale: float = 1.0) -> Dict[str, Dict[str, float]]:
+    """Runs benchmarks and prints a line for each.
+
+    :param names: The benchmarks to run. Defaults to every benchmark.
+    :param scale: Multiplies the number of iterations of every benchmark.
+    :return: A dictionary of benchmark name -> summary.
+    """
+    results = {}
+    for name in names or list(BENCHMARKS):
+        results[name] = summarize(BENCHMARKS[name](scale))
+        print(_format_result(name, results[name]))
+    return results
+
+
+def _format_time(seconds: float) -> str:
+    """Formats a duration with a sensible unit."""
+    if seconds >= 1:
+        return format(seconds, '.3f') + ' s'
+    elif seconds >= 1e-3:
+        return format(seconds * 1e3, '.3f') + ' ms'
+    return format(seconds * 1e6, '.1f') + ' us'
+
+
+def _format_result(name: str, result: Dict[str, float]) -> str:
+    """Formats one benchmark summary as a line."""
+    return name.ljust(26) + ' p50 ' + _format_time(result['p50']).rjust(11) + '   p99 ' + _format_time(result['p99']).rjust(11) + \
+           '   ' + format(result['throughput'], ',.1f').rjust(12) + ' /s   (n=' + str(result['iterations']) + ')'
+
+
+def get_environment() -> Dict[str, str]:
+    """Describes the machine and versions, stored with a baseline so comparisons across machines can be spotted."""
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(), 'date': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], file_path: str):
+    """Writes results as a JSON baseline.
+    :param file_path: The path to write to.
+    """
+    with open(file_path, 'w') as f:
+        json.dump({'v': BASELINE_VERSION, 'environment': get_environment(), 'results': results}, f, indent=2)
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Compares results against a baseline and prints the change of each benchmark.
+
+    :param results: The results from run_benchmarks.
+    :param baseline: The baseline written by save_baseline.
+    :param threshold: Allowed relative p50 slowdown, e.g. 0.15 for 15%.
+    :return: A list of the names of the benchmarks that regressed.
+    """
+    regressions = []
+    print('\nCompared to the baseline from ' + baseline.get('environment', {}).get('date', 'an unknown date') + ':')
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(name.ljust(26) + ' (not in baseline)')
+            continue
+        p50_change = result['p50'] / base['p50'] - 1 if base['p50'] > 0 else 0.0
+        p99_change = result['p99'] / base['p99'] - 1 if base['p99'] > 0 else 0.0
+        flag = ''
+        if p50_change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif p50_change < -threshold:
+            flag = '  improved'
+        print(name.ljust(26) + ' p50 ' + format(p50_change, '+.1%').rjust(8) + '   p99 ' + format(p99_change, '+.1%').rjust(8) + flag)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark card loading, rendering and battle resolution.')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run: ' + ', '.join(BENCHMARKS) + '. Defaults to every benchmark.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplies the number of iterations.')
+    parser.add_argument('--save', default=None, help='Write the results as a JSON baseline to this file.')
+    parser.add_argument('--compare', default=None, help='Compare the results against this JSON baseline.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed p50 slowdown, e.g. 0.15 for 15%%.')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmark ' + ', '.join(unknown))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    results = run_benchmarks(args.names, args.scale)
+    if args.save:
+        save_baseline(results, args.save)
+        print('Wrote the baseline to ' + args.save + '.')
+    if baseline is not None and compare(results, baseline, args.threshold):
+        sys.exit(1)
@@ -0,0 +1,143 @@
+"""
+Stand-ins for the Discord objects the bot uses, so OC_Client can be driven locally without connecting to Discord.
+Only the attributes and methods that bot.py uses are provided. Files are real discord.File objects, which work
+without a connection; the fake channel measures and closes them instead of uploading them.
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import asyncio
+import itertools
+
+import bot
+
+
+_IDs = itertools.count(10 ** 17)  # Discord style snowflake IDs
+
+
+class FakeUser:
+    """Class to represent a Discord user."""
+
+
+    def __init__(self, name: str, ID: int = None):
+        self.id = ID if ID is not None else next(_IDs)
+        self.name = name
+        self.avatar_url = 'https://cdn.discordapp.com/embed/avatars/0.png'
+
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeChannel:
+    """Class to represent a Discord text channel. Sent messages are recorded instead of delivered."""
+
+
+    def __init__(self, ID: int = None, record: bool = True):
+        """Initializes the channel.
+        :param record: Whether to keep every sent message. Counters are always kept.
+        """
+        self.id = ID if ID is not None else next(_IDs)
+        self.record = record
+        self.sent = []           # (content, number of files) of every message, if recording
+        self.messages = 0        # Number of messages sent
+        self.uploaded_bytes = 0  # Total size of the attached files
+        self._prompts = {}       # Player name -> event set when the player's battle asks for their attack commands
+
+
+    async def send(self, content: str = None, file: 'discord.File' = None, files: List['discord.File'] = None):
+        """Records a message."""
+        attachments = [file] if file is not None else (files or [])
+        for attachment in attachments:
+            self.uploaded_bytes += _get_size(attachment)
+            attachment.close()
+        self.messages += 1
+        if self.record:
+            self.sent.append((content, len(attachments)))
+        if content and 'Input your attack commands' in content:
+            for name, prompt in self._prompts.items():
+                if '**' + name + '\'s Party**' in content:  # The board heading names the player of the battle
+                    prompt.set()
+
+
+    def watch_prompts(self, author: 'FakeUser') -> asyncio.Event:
+        """Getter function for the event that is set whenever a player's battle in this channel asks for their attack
+        commands. The event stays set until it is cleared, so a prompt is never missed while the player is busy.
+        Prompts in a channel can come from any player's battle, so each player watches only their own."""
+        return self._prompts.setdefault(author.name, asyncio.Event())
+
+
+    def unwatch_prompts(self, author: 'FakeUser'):
+        """Stops watching a player's prompts."""
+        self._prompts.pop(author.name, None)
+
+
+def _get_size(file: 'discord.File') -> int:
+    """Finds the size of an attached file without reading it."""
+    fp = file.fp
+    if hasattr(fp, 'getbuffer'):
+        return fp.getbuffer().nbytes
+    position = fp.tell()
+    size = fp.seek(0, 2)
+    fp.seek(position)
+    return size
+
+
+class FakeMessage:
+    """Class to represent a Discord message."""
+
+
+    def __init__(self, content: str, author: FakeUser, channel: FakeChannel):
+        self.id = next(_IDs)
+        self.content = content
+        self.author = author
+        self.channel = channel
+
+
+class FakeClient(bot.OC_Client):
+    """The bot client without a Discord connection. Messages are delivered by calling on_message."""
+
+
+    def __init__(self):
+        # The Discord client is not initialized, since nothing here talks to Discord.
+        self._fake_user = FakeUser('OC Bot')
+
+
+    @property
+    def user(self) -> FakeUser:
+        return self._fake_user
+
+
+    async def deliver(self, message: FakeMessage):
+        """Delivers a message like the gateway would. Prompts are answered through the battle sessions of on_message."""
+        await self.on_message(message)
+
+
+async def play_battle(client: FakeClient, channel: FakeChannel, author: FakeUser, seed: int = None,
+                      targets: Tuple[str, str, str] = ('front', 'front', 'back')):
+    """Plays a whole battle against the AI through on_message, answering every prompt with the same targets.
+
+    :param client: The client to deliver the messages to.
+    :param channel: The channel to play in.
+    :param author: The player.
+    :param seed: The battle seed, so the battle is the same every time. None picks a fresh seed.
+    :param targets: The target (front or back) for each of the player's OCs.
+    """
+    content = '!oc battle' if seed is None else '!oc battle ' + str(seed)
+    prompt = channel.watch_prompts(author)
+    battle = asyncio.ensure_future(client.deliver(FakeMessage(content, author, channel)))
+    try:
+        while not battle.done():
+            waiter = asyncio.ensure_future(prompt.wait())
+            await asyncio.wait([battle, waiter], return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if prompt.is_set():
+                prompt.clear()
+                await send_targets(client, channel, author, targets)
+    finally:
+        channel.unwatch_prompts(author)
+    battle.result()  # Raises anything the battle raised
+
+
+async def send_targets(client: FakeClient, channel: FakeChannel, author: FakeUser, targets: Tuple[str, str, str]):
+    """Sends a player's attack commands for one turn."""
+    for i, target in enumerate(targets):
+        await client.deliver(FakeMessage('!oc ' + str(i + 1) + ' ' + target, author, channel))
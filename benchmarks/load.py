@@ -0,0 +1,268 @@
+"""
+Load generator for OC_Client. Thousands of synthetic users send commands to one bot process through the fake
+Discord objects in fake_discord.py, and the bot's latency, event loop lag and upload volume are recorded.
+
+    python -m benchmarks.load --users 2000 --channels 100 --rate 0.05 --duration 60
+
+Each user repeatedly waits a random think time (exponential, averaging 1 / rate seconds) and then sends one of
+!oc dex, !hello or !oc battle, picked by --mix. Battles are played to the end, answering every prompt with
+!oc 1|2|3 front|back after a random think time averaging --think seconds. Recorded latencies:
+    - dex, hello: until the command handler has returned.
+    - battle: from !oc battle until the first prompt for the player's commands.
+    - turn: from a player's last command of a turn until the prompt for their next turn (or the end of the battle).
+Event loop lag is how late a timer that should fire every --lag-interval seconds actually fires.
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+import numpy as np
+
+import bot
+from benchmarks import fake_discord
+from modules.processing import outbox
+from modules.processing import metrics
+
+
+DEFAULT_MIX = 'dex=5,hello=2,battle=3'
+
+
+class LoadStats:
+    """Class to represent everything recorded during a load run."""
+
+
+    def __init__(self):
+        self.latencies = {}   # Command name -> list of latencies in seconds
+        self.errors = {}      # Command name -> number of commands that raised
+        self.loop_lag = []    # Event loop lag samples in seconds
+        self.sessions = []    # Active battle session counts, sampled with the loop lag
+        self.commands = 0     # Number of commands sent
+
+
+    def record(self, command: str, latency: float):
+        """Records the latency of a command."""
+        self.latencies.setdefault(command, []).append(latency)
+
+
+    def record_error(self, command: str):
+        """Records a command that raised."""
+        self.errors[command] = self.errors.get(command, 0) + 1
+
+
+    def summarize(self, channels: List[fake_discord.FakeChannel], elapsed: float) -> Dict:
+        """Summarizes the run.
+        :param channels: The channels of the run, for the message and upload counts.
+        :param elapsed: How long the run took in seconds.
+        :return: A dictionary of the results, ready to be written as JSON.
+        """
+        commands = {}
+        for command, latencies in sorted(self.latencies.items()):
+            values = np.array(latencies)
+            commands[command] = {'count': len(latencies), 'p50': float(np.percentile(values, 50)),
+                                 'p99': float(np.percentile(values, 99)), 'max': float(values.max()),
+                                 'errors': self.errors.get(command, 0)}
+        for command, errors in self.errors.items():
+            commands.setdefault(command, {'count': 0, 'errors': errors})
+        lag = np.array(self.loop_lag) if self.loop_lag else np.zeros(1)
+        uploaded = sum(channel.uploaded_bytes for channel in channels)
+        return {
+            'elapsed': elapsed,
+            'commands_sent': self.commands,
+            'commands_per_second': self.commands / elapsed if elapsed > 0 else 0.0,
+            'commands': commands,
+            'loop_lag': {'p50': float(np.percentile(lag, 50)), 'p99': float(np.percentile(lag, 99)), 'max': float(lag.max())},
+            'peak_sessions': max(self.sessions) if self.sessions else 0,
+            'messages_sent': sum(channel.messages for channel in channels),
+            'uploaded_bytes': uploaded,
+            'uploaded_bytes_per_second': uploaded / elapsed if elapsed > 0 else 0.0
+        }
+
+
+async def monitor_loop(stats: LoadStats, interval: float, stop: asyncio.Event):
+    """Samples the event loop lag and the number of active battles until stopped."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(0.0, loop.time() - expected))
+        stats.sessions.append(len(bot.SESSIONS))
+
+
+async def timed(stats: LoadStats, command: str, coroutine):
+    """Awaits a command and records its latency."""
+    stats.commands += 1
+    start = time.perf_counter()
+    try:
+        await coroutine
+    except Exception:
+        stats.record_error(command)
+        return
+    stats.record(command, time.perf_counter() - start)
+
+
+async def play_battle(client: fake_discord.FakeClient, channel: fake_discord.FakeChannel, author: fake_discord.FakeUser,
+                      stats: LoadStats, think: float, rng: random.Random):
+    """Plays a battle like fake_discord.play_battle, picking random targets and recording the battle and turn latencies."""
+    stats.commands += 1
+    start = time.perf_counter()
+    prompt = channel.watch_prompts(author)
+    battle = asyncio.ensure_future(client.deliver(fake_discord.FakeMessage('!oc battle', author, channel)))
+    turn_start = None
+    try:
+        while not battle.done():
+            waiter = asyncio.ensure_future(prompt.wait())
+            await asyncio.wait([battle, waiter], return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if not prompt.is_set():
+                continue
+            prompt.clear()
+            now = time.perf_counter()
+            if turn_start is None:
+                stats.record('battle', now - start)
+            else:
+                stats.record('turn', now - turn_start)
+            await asyncio.sleep(rng.expovariate(1 / think) if think > 0 else 0)
+            targets = tuple(rng.choice(('front', 'back')) for _ in range(3))
+            stats.commands += 3
+            await fake_discord.send_targets(client, channel, author, targets)
+            turn_start = time.perf_counter()
+    except asyncio.CancelledError:
+        battle.cancel()  # The run is over, so the battle is abandoned
+        raise
+    finally:
+        channel.unwatch_prompts(author)
+    try:
+        battle.result()
+    except Exception:
+        stats.record_error('battle')
+        return
+    if turn_start is not None:
+        stats.record('turn', time.perf_counter() - turn_start)
+
+
+async def run_user(client: fake_discord.FakeClient, channel: fake_discord.FakeChannel, author: fake_discord.FakeUser,
+                   stats: LoadStats, rate: float, think: float, mix: Dict[str, float], deadline: float, rng: random.Random):
+    """Sends commands as one user until the deadline."""
+    dex_IDs = bot.OC_CATALOGUE.get().get_IDs()
+    commands, weights = list(mix), list(mix.values())
+    while True:
+        delay = rng.expovariate(rate)
+        if time.perf_counter() + delay >= deadline:
+            return
+        await asyncio.sleep(delay)
+        command = rng.choices(commands, weights)[0]
+        if command == 'dex':
+            message = fake_discord.FakeMessage('!oc dex ' + str(rng.choice(dex_IDs)), author, channel)
+            await timed(stats, 'dex', client.deliver(message))
+        elif command == 'hello':
+            await timed(stats, 'hello', client.deliver(fake_discord.FakeMessage('!hello', author, channel)))
+        elif command == 'battle':
+            await play_battle(client, channel, author, stats, think, rng)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parses a command mix such as 'dex=5,hello=2,battle=3'.
+    :return: A dictionary of command -> weight.
+    """
+    weights = {}
+    for part in mix.split(','):
+        command, weight = part.split('=')
+        if command not in ('dex', 'hello', 'battle'):
+            raise ValueError('Unknown command ' + command + ' in the command mix!')
+        weights[command] = float(weight)
+    return weights
+
+
+async def run_load(users: int, channels: int, rate: float, duration: float, mix: Dict[str, float], think: float = 2.0,
+                   grace: float = 30.0, rate_limit: bool = True, lag_interval: float = 0.05, seed: int = 0) -> Dict:
+    """Runs the load, then waits for the commands in progress to finish.
+
+    :param users: Number of synthetic users.
+    :param channels: Number of channels the users are spread across.
+    :param rate: Commands per second that each user starts, on average.
+    :param duration: For how many seconds new commands are started.
+    :param mix: Relative weights of the commands, from parse_mix.
+    :param think: Average seconds a player takes to answer a battle prompt.
+    :param grace: How many seconds to wait for commands still in progress after the duration. The rest are abandoned.
+    :param rate_limit: Whether the bot paces its sends to each channel like it would against Discord.
+    :param lag_interval: How often the event loop lag is sampled, in seconds.
+    :param seed: Seed for the users' choices.
+    :return: The summary from LoadStats.summarize, with the bot's own metrics under 'bot_metrics'.
+    """
+    client = fake_discord.FakeClient()
+    stats = LoadStats()
+    metrics.reset()
+    fake_channels = [fake_discord.FakeChannel(record=False) for _ in range(channels)]
+    if not rate_limit:
+        for channel in fake_channels:
+            outbox.get_limiter(channel.id).messages = 10 ** 9
+    stop = asyncio.Event()
+    monitor = asyncio.ensure_future(monitor_loop(stats, lag_interval, stop))
+
+    start = time.perf_counter()
+    deadline = start + duration
+    tasks = [asyncio.ensure_future(run_user(client, fake_channels[i % channels], fake_discord.FakeUser('user' + str(i)),
+                                            stats, rate, think, mix, deadline, random.Random(seed * 1000003 + i)))
+             for i in range(users)]
+    _, pending = await asyncio.wait(tasks, timeout=duration + grace)
+    elapsed = time.perf_counter() - start
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    stop.set()
+    await monitor
+    summary = stats.summarize(fake_channels, elapsed)
+    summary['unfinished'] = len(pending)
+    summary['bot_metrics'] = metrics.get_summary()  # The bot's own render, upload and turn timings
+    return summary
+
+
+def _format_summary(summary: Dict) -> str:
+    """Formats a summary as a table."""
+    lines = ['Ran ' + format(summary['elapsed'], '.1f') + ' s, ' + str(summary['commands_sent']) + ' commands (' +
+             format(summary['commands_per_second'], '.1f') + ' /s), peak ' + str(summary['peak_sessions']) + ' battles, ' +
+             str(summary['unfinished']) + ' users still busy at the end']
+    for command, result in summary['commands'].items():
+        if result['count'] == 0:
+            lines.append('  ' + command.ljust(8) + ' errors ' + str(result['errors']))
+            continue
+        lines.append('  ' + command.ljust(8) + ' n=' + str(result['count']).ljust(7) +
+                     ' p50 ' + format(result['p50'] * 1e3, '9.2f') + ' ms   p99 ' + format(result['p99'] * 1e3, '9.2f') +
+                     ' ms   max ' + format(result['max'] * 1e3, '9.2f') + ' ms   errors ' + str(result['errors']))
+    lag = summary['loop_lag']
+    lines.append('  Event loop lag: p50 ' + format(lag['p50'] * 1e3, '.2f') + ' ms   p99 ' + format(lag['p99'] * 1e3, '.2f') +
+                 ' ms   max ' + format(lag['max'] * 1e3, '.2f') + ' ms')
+    lines.append('  Sent ' + str(summary['messages_sent']) + ' messages, ' + format(summary['uploaded_bytes'] / 1e6, '.1f') +
+                 ' MB uploaded (' + format(summary['uploaded_bytes_per_second'] / 1e6, '.2f') + ' MB/s)')
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the bot with synthetic users and a fake Discord.')
+    parser.add_argument('--users', type=int, default=1000, help='Number of synthetic users.')
+    parser.add_argument('--channels', type=int, default=50, help='Number of channels the users are spread across.')
+    parser.add_argument('--rate', type=float, default=0.05, help='Commands per second per user, on average.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to start new commands for.')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Relative command weights, e.g. ' + DEFAULT_MIX + '.')
+    parser.add_argument('--think', type=float, default=2.0, help='Average seconds a player takes to answer a battle prompt.')
+    parser.add_argument('--grace', type=float, default=30.0, help='Seconds to wait for commands in progress after the duration.')
+    parser.add_argument('--no-rate-limit', action='store_true', help='Do not pace sends to each channel.')
+    parser.add_argument('--lag-interval', type=float, default=0.05, help='Seconds between event loop lag samples.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the users\' choices.')
+    parser.add_argument('--json', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    snapshot_dir = tempfile.TemporaryDirectory()
+    bot.SNAPSHOT_DIR = snapshot_dir.name  # Battle snapshots are written, but not kept
+    try:
+        summary = asyncio.run(run_load(args.users, args.channels, args.rate, args.duration, parse_mix(args.mix),
+                                       args.think, args.grace, not args.no_rate_limit, args.lag_interval, args.seed))
+    finally:
+        snapshot_dir.cleanup()
+    print(_format_summary(summary))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -2,9 +2,18 @@ from modules.mechanics.oc import OC
 from modules.mechanics.battlefield import Battlefield
 from modules.mechanics.party import Party
 from modules.mechanics.action import Action
+from modules.mechanics import sessions
+from modules.mechanics import snapshot
+from modules.mechanics.rng import BattleRNG
+from modules.mechanics import ai
 
 from modules.processing import data_processing
 from modules.processing import dynamics
+from modules.processing import render_pool
+from modules.processing import user_store
+from modules.processing import outbox
+from modules.processing import metrics
+from modules.processing import logs
 
 from typing import List, Set, Dict, Tuple, Optional
 import os
@@ -13,6 +22,8 @@ from dotenv import load_dotenv
 import asyncio
 import random
 import re
+import time
+import logging
 
 import json
 
@@ -22,14 +33,75 @@ load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 GUILD = os.getenv('DISCORD_GUILD')
 
-# Load OC data from the filepath.
-OC_DATA = data_processing.load_json()
+# Set up structured logging (LOG_FORMAT is either 'text' or 'json'). Battle debugging output needs LOG_LEVEL=DEBUG.
+logs.configure(os.getenv('LOG_LEVEL', 'INFO'), os.getenv('LOG_FORMAT', 'text'))
+log = logging.getLogger(__name__)
+
+# Metrics are served in the Prometheus text format on METRICS_PORT (local only) if it is set,
+# and logged every METRICS_LOG_INTERVAL seconds if it is above zero.
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_LOG_INTERVAL = float(os.getenv('METRICS_LOG_INTERVAL', '0'))
+
+# Set up the worker pool used for battle rendering (RENDER_POOL is either 'thread' or 'process').
+RENDER_WORKERS = os.getenv('RENDER_WORKERS')
+RENDER_POOL = os.getenv('RENDER_POOL', 'thread')
+render_pool.configure(int(RENDER_WORKERS) if RENDER_WORKERS else None, RENDER_POOL == 'process')
+
+# Load the user store once (USER_STORE is either 'json' or 'sqlite'). Changes are saved every USER_FLUSH_INTERVAL seconds.
+USERS = user_store.open_store(os.getenv('USER_STORE', 'json'), os.getenv('USER_STORE_PATH'))
+USER_FLUSH_INTERVAL = float(os.getenv('USER_FLUSH_INTERVAL', '5'))
+
+# Registry of active battles. A battle is abandoned if the player sends no command for BATTLE_TIMEOUT seconds.
+SESSIONS = sessions.SessionManager(timeout=float(os.getenv('BATTLE_TIMEOUT', '300')))
+metrics.register_gauge('oc_battle_sessions', lambda: len(SESSIONS))
+
+# In-progress battles are snapshotted here after every turn and resumed when the bot starts.
+SNAPSHOT_DIR = os.getenv('BATTLE_SNAPSHOT_DIR', 'cache/battles')
+
+# Battle text written while waiting on the player is merged and sent after this many idle seconds.
+OUTBOX_LINGER = float(os.getenv('OUTBOX_LINGER', '0.5'))
+
+# How many turns the AI opponent searches ahead, and the most time in seconds it spends on each decision.
+AI_DEPTH = int(os.getenv('AI_DEPTH', str(ai.DEFAULT_DEPTH)))
+AI_TIME_BUDGET = float(os.getenv('AI_TIME_BUDGET', str(ai.DEFAULT_TIME_BUDGET)))
+
+# Load OC data from the filepath into the indexed catalogue. The catalogue is reloaded when the file changes,
+# so always retrieve the current one with OC_CATALOGUE.get().
+OC_CATALOGUE = data_processing.CatalogueLoader()
+
+
+def parse_command(content: str) -> Optional[str]:
+    """Parses the command token from a message, which is used to look up the handler in OC_Client.COMMANDS.
+
+    :param content: The message text.
+    :return: The command after "!oc" (e.g. "dex" for "!oc dex 5"), the first word for any other message,
+             or None for an empty message.
+    """
+    split_message = content.split(maxsplit=2)
+    if not split_message:
+        return None
+    if split_message[0] == '!oc':
+        return split_message[1] if len(split_message) > 1 else None
+    return split_message[0]
 
 
 class OC_Client(discord.Client):
     """This class represents the client object and the method and callbacks used to
     read in and respond to user input.
     """
+
+    # Every message that is a bot command starts with one of these prefixes.
+    COMMAND_PREFIXES = ('!oc', '!hello')
+
+    # Dispatch table from the command token to the name of the handler method.
+    # For "!oc <command> ..." the token is the command, and "!hello" is its own token.
+    COMMANDS = {
+        'dex': 'check_dex_func',
+        'battle': 'AI_battle_func',
+        'help': 'help_func',
+        'tally': 'tally_count',
+        '!hello': 'hello_func'
+    }
     
 
     async def on_ready(self):
@@ -40,34 +112,117 @@ class OC_Client(discord.Client):
         discord_activity = discord.Activity(name=discord_status, type=discord.ActivityType.watching)
         await self.change_presence(activity=discord_activity)
         
-        # Print out potentially important information to the console.
-        print('\nInitiating OC Battle Bot.\n\nBot credentials:')
-        print('------------------------------------')
-        print('USERNAME: ' + self.user.name)
-        print('USER ID: ' + str(self.user.id))
-        print('BOT TOKEN: ' + str(TOKEN))
-        print('GUILD ID: ' + str(GUILD))  # This is just the token for the discord server.
-        print('------------------------------------\n')
-        print('Bot is ready to run!\n')
+        # Log potentially important information. The bot token is a secret, so it is never logged.
+        log.info('Bot is ready to run', extra={'username': self.user.name, 'user_ID': self.user.id, 'guild_ID': GUILD})
+
+        # Start saving user changes in the background. on_ready can be called again after a reconnect.
+        if getattr(self, 'user_flush_task', None) is None:
+            self.user_flush_task = asyncio.create_task(USERS.run_periodic_flush(USER_FLUSH_INTERVAL))
+
+        # Start the metrics tasks: event loop lag sampling, the scrape endpoint and the periodic metrics log.
+        if getattr(self, 'metrics_tasks', None) is None:
+            self.metrics_tasks = [asyncio.create_task(metrics.monitor_loop_lag())]
+            if METRICS_LOG_INTERVAL > 0:
+                self.metrics_tasks.append(asyncio.create_task(metrics.run_periodic_log(METRICS_LOG_INTERVAL)))
+            if METRICS_PORT:
+                self.metrics_server = await metrics.serve(int(METRICS_PORT))
+
+        # Resume the battles that were in progress when the bot last stopped.
+        if not getattr(self, 'battles_resumed', False):
+            self.battles_resumed = True
+            await self.resume_battles()
+
+
+    async def resume_battles(self) -> int:
+        """Restores every snapshotted battle and continues it in its channel.
+        :return: The number of battles resumed.
+        """
+        resumed = 0
+        for state in snapshot.load_snapshots(SNAPSHOT_DIR):
+            channel = self.get_channel(state['channel'])
+            try:
+                author = self.get_user(state['player']) or await self.fetch_user(state['player'])
+                field = snapshot.restore_battle(state, OC_CATALOGUE.get().table)
+            except Exception as e:
+                log.warning('Unable to resume battle', extra={'channel': state['channel'], 'error': str(e)})
+                author = None
+            if channel is None or author is None:
+                snapshot.delete_snapshot(SNAPSHOT_DIR, state['channel'], state['player'])
+                continue
+            session = SESSIONS.start(channel.id, author.id)
+            if session is None:
+                continue
+            asyncio.create_task(self.play_AI_battle(channel, author, session, field))
+            resumed += 1
+        if resumed:
+            log.info('Resumed battles', extra={'battles': resumed})
+        return resumed
+
+
+    async def close(self):
+        """Saves any unsaved user changes before the client shuts down."""
+        if getattr(self, 'user_flush_task', None) is not None:
+            self.user_flush_task.cancel()
+            self.user_flush_task = None
+        for task in getattr(self, 'metrics_tasks', None) or []:
+            task.cancel()
+        self.metrics_tasks = None
+        if getattr(self, 'metrics_server', None) is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        await USERS.flush_async()
+        USERS.close()
+        await super().close()
 
 
     async def on_message(self, message: discord.Message):
         """This function represents an asynchronous call every time a message is sent.
         This is run and checked every time a message is sent on the server.
         """
+        # Most messages are not bot commands, so reject them before doing any other work.
+        content = message.content
+        if not content.startswith(self.COMMAND_PREFIXES):
+            return
+
         # We do not want the bot to reply to itself. This will protect against infinite loops.
         if message.author.id == self.user.id:
             return
 
-        # Temporary. Prints message and author in console.
-        print('"{0}" has sent "{1}"!'.format(message.author, message.content))
-      
-        # Then check if message is relevant to the OC game and pick the correct response.
-        await self.check_dex_func(message)
-        await self.AI_battle_func(message)
-        await self.help_func(message)
-        await self.tally_count(message)
-        await self.hello_func(message)
+        # Parse the command token once. Battle commands (!oc 1|2|3 ...) go to the author's battle in this channel,
+        # and everything else is routed to the matching handler.
+        command = parse_command(content)
+        if command is not None and command.isnumeric():
+            SESSIONS.route(message)
+            return
+        command = self.resolve_command(content, command)
+        if command is not None:
+            handler_name = self.COMMANDS[command]
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('Command', extra={'command': command, 'channel': message.channel.id, 'player': message.author.id})
+            start = time.perf_counter()
+            try:
+                await getattr(self, handler_name)(message)
+            except Exception:
+                metrics.increment('oc_command_errors_total', command=command)
+                raise
+            finally:
+                metrics.observe('oc_command_seconds', time.perf_counter() - start, command=command)
+
+    @classmethod
+    def resolve_command(cls, content: str, command: Optional[str]) -> Optional[str]:
+        """Looks up the command of a message in COMMANDS. Like the original handlers, a command also matches when the
+        message merely starts with it, e.g. "!hello!" or "!oc helpme". The handlers check the rest of the message.
+
+        :param content: The message text.
+        :param command: The command token from parse_command.
+        :return: The key of the command in COMMANDS, or None if the message is not a command.
+        """
+        if command in cls.COMMANDS:
+            return command
+        for token in cls.COMMANDS:
+            if content.startswith(token if token.startswith('!') else '!oc ' + token):
+                return token
+        return None
 
     async def on_reaction_add(self, reaction, user):
         """
@@ -75,8 +230,8 @@ class OC_Client(discord.Client):
         the author, ID, and contents of the message being reacted to.
         """
         channel = reaction.message.channel
-        await channel.send('Reaction added by {0} to {1}\'s message.\nMessage: {2}\nMessage ID: {3}'
-                           .format(user, reaction.message.author, reaction.message.content, reaction.message.id))
+        await outbox.ChannelOutbox(channel).send('Reaction added by {0} to {1}\'s message.\nMessage: {2}\nMessage ID: {3}'
+                                                 .format(user, reaction.message.author, reaction.message.content, reaction.message.id))
 
 
     async def check_dex_func(self, message: discord.Message) -> bool:
@@ -87,21 +242,24 @@ class OC_Client(discord.Client):
         :return: True if a valid OC is printed out. False if an invalid input was given and nothing was printed.
         """
         if message.content.startswith('!oc dex'):
-            split_message = str(message.content).split()
+            split_message = str(message.content).split(maxsplit=2)
             
             # Check if message is a valid command with at least one parameter
-            # Format: !oc dex [INT] - check oc info
-            if len(split_message) > 1 and split_message[1] == 'dex' and split_message[2].isnumeric():
-                oc_ID = int(split_message[2])
+            # Format: !oc dex [INT|NAME] - check oc info
+            if len(split_message) > 2 and split_message[1] == 'dex':
+                query = split_message[2]
+                catalogue = OC_CATALOGUE.get()
+                oc_ID = catalogue.find(query)
                 
-                # Catch if index is invalid and print out an appropriate error message.
-                try:
-                    dex_OC = oc.OC(OC_DATA, oc_ID)
-                    img_path, text = dex_OC.generate_dex_string()
-                    await message.channel.send(file=discord.File(img_path))
-                    await message.channel.send(text)
-                except IndexError:
-                    await message.channel.send('No OC found for index ' + str(oc_ID) + ', try a different number (0 - ' + str(len(OC_DATA)) + ')!')
+                # Print out an appropriate error message if no OC matches.
+                out = outbox.ChannelOutbox(message.channel)
+                if oc_ID is None:
+                    await out.send('No OC found for ' + query + ', try a different name or number (0 - ' + str(max(catalogue.get_IDs())) + ')!')
+                    return False
+                dex_OC = OC(catalogue.table, oc_ID)
+                img_path, text = dex_OC.generate_dex_string()
+                await out.send(file=discord.File(img_path))
+                await out.send(text)
                 return True
         return False
 
@@ -115,12 +273,84 @@ class OC_Client(discord.Client):
         
         If you are not actively working on the battle system, you can safely ignore this portion of the code.
         
+        A battle seed can be given to replay a battle, e.g. from a bug report: !oc battle SEED
+        
         :return: True if the call was successful, False otherwise or if invalid input is given.
         """
-        
+        if message.content.startswith('!oc battle'):
+            split_message = message.content.split()
+            seed = None
+            if len(split_message) > 2:
+                if not split_message[2].isdigit():
+                    await outbox.ChannelOutbox(message.channel).send('The battle seed must be a number, ' + message.author.name + '!')
+                    return False
+                seed = int(split_message[2])
+
+            # Each player can only have one battle at a time. Their battle commands are routed to this session.
+            session = SESSIONS.start(message.channel.id, message.author.id)
+            if session is None:
+                await outbox.ChannelOutbox(message.channel).send('You already have a battle in progress, ' + message.author.name + '!')
+                return False
+            return await self.play_AI_battle(message.channel, message.author, session, seed=seed)
+        return False
+
+
+    async def play_AI_battle(self, channel: discord.TextChannel, author: discord.User, session: sessions.BattleSession,
+                             field: Battlefield = None, seed: int = None) -> bool:
+        """Plays out a battle session, and releases the session once the battle is over or has timed out.
+
+        :param channel: The channel the battle is in.
+        :param author: The player.
+        :param session: The battle session that the player's commands are delivered to.
+        :param field: The battlefield of a battle restored from a snapshot. None starts a new battle.
+        :param seed: The seed of a new battle. None picks a fresh seed.
+        :return: True if the battle finished, False if it timed out.
+        """
+        metrics.add_gauge('oc_battles_active', 1)
+        result = 'failed'
+        try:
+            finished = await self.run_AI_battle(channel, author, session, field, seed)
+            result = 'finished'
+            return finished
+        except asyncio.TimeoutError:
+            result = 'timed_out'
+            await outbox.ChannelOutbox(channel).send('The battle against ' + author.name + ' has timed out.')
+            return False
+        except asyncio.CancelledError:
+            result = 'cancelled'
+            raise
+        finally:
+            # A battle cancelled by a shutdown keeps its snapshot so it resumes on the next start. Any other ending,
+            # including an error, removes it so a broken battle is not resumed on every restart.
+            if result != 'cancelled':
+                snapshot.delete_snapshot(SNAPSHOT_DIR, channel.id, author.id)
+            SESSIONS.end(session)
+            metrics.add_gauge('oc_battles_active', -1)
+            metrics.increment('oc_battles_total', result=result)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('Battle ended', extra={'channel': channel.id, 'player': author.id, 'result': result})
+
+
+    async def run_AI_battle(self, channel: discord.TextChannel, author: discord.User, session: sessions.BattleSession,
+                            field: Battlefield = None, seed: int = None) -> bool:
+        """Runs a sample player vs. AI game until one side wins. The battle state is snapshotted after every turn.
+        Every random choice is drawn from the battle's seeded stream, so replaying the seed with the same commands
+        replays the battle.
+
+        :param channel: The channel the battle is in.
+        :param author: The player.
+        :param session: The battle session that the player's commands are delivered to.
+        :param field: The battlefield of a battle restored from a snapshot. None starts a new battle.
+        :param seed: The seed of a new battle. None picks a fresh seed.
+        :return: True once the battle has finished.
+        :raises asyncio.TimeoutError: If the player stops sending commands.
+        """
+        # TODO: Parts of this code should probably be split up into a different module just for conducting
+        # the battle system to ensure code cleanliness.
+
         # Constant text strings to help format the message board.
-        player_name = message.author.name
-        player_ID = str(message.author.id)
+        player_name = author.name
+        player_ID = str(author.id)
         AI_name = 'AI'
         AI_ID = 'AI'
         divider_emoji = ':black_small_square:' * 14 + '\n'
@@ -129,125 +359,133 @@ class OC_Client(discord.Client):
                      ':vs:' + ':black_small_square:' * 3 + '\n' + ':black_small_square:' * 7 + '\n'
         ai_text = ':blue_circle::blue_circle: **AI Party** :blue_circle::blue_circle:'
         turn_order_text = ':timer: **TURN ORDER:**'
-        spacing = ' ' * 28
-        
-        # TODO: Currently the function can have multiple simultaneous calls, which normally isn't an issue
-        # since multiple games can occur, but multiple games can be called by the same person and clutter the
-        # text. This is currently a minor issue since this bug needs to be deliberately triggered, and is unlikely to
-        # occur accidentally. 
-        # Additionally, parts of this code should probably be split up into a different module just for conducting
-        # the battle system to ensure code cleanliness.
-        if message.content.startswith('!oc battle'):
 
-            # Here, we set up the battlefield with some preset battle parameters
-            await message.channel.send('Initializing a fight against an AI!')
-            _party_A = [OC(OC_DATA, 5), OC(OC_DATA, 8), OC(OC_DATA, 2)]  # A hardcoded list of IDs to help test functionality. This will be changed later.
-            _party_B = [OC(OC_DATA, 4), OC(OC_DATA, 3), OC(OC_DATA, 0)]
+        # Outgoing text is merged into as few messages as possible. Text written while waiting on the player
+        # (such as target confirmations) is sent once the battle has been idle for OUTBOX_LINGER seconds.
+        out = outbox.ChannelOutbox(channel, linger=OUTBOX_LINGER)
+
+        # Here, we set up the battlefield with some preset battle parameters, unless a battle is being resumed.
+        if field is None:
+            rng = BattleRNG(seed)
+            out.write('Initializing a fight against an AI! (Battle seed: ' + str(rng.seed) + ')')
+            oc_table = OC_CATALOGUE.get().table  # The battle keeps this table even if the catalogue is reloaded
+            _party_A = [OC(oc_table, 5), OC(oc_table, 8), OC(oc_table, 2)]  # A hardcoded list of IDs to help test functionality. This will be changed later.
+            _party_B = [OC(oc_table, 4), OC(oc_table, 3), OC(oc_table, 0)]
             player_party = Party(_party_A, player_name, player_ID)
             AI_party = Party(_party_B, AI_name, AI_ID)
-            field = Battlefield(OC_DATA, player_party, AI_party)
-
-            # Create a loop that continues the battle until a victory condition is reached.
-            battle_loop_on = True
-            while battle_loop_on:
-
-                # Calculate the new party order and turn order (these are lists of OC objects)
-                player_OCs = player_party.get_OCs()
-                AI_OCs = AI_party.get_OCs()
-                turn_order = field.calculate_turns()
-
-                # Dynamically generate the party images and stats for both players here and print out the HP stats in the Discord channel.
-                player_party_img_path = dynamics.create_party_image(player_OCs)
-                await message.channel.send(user_text, file=discord.File(player_party_img_path))
-                AI_party_img_path = dynamics.create_party_image(AI_OCs)
-                await message.channel.send(player_party.get_HP_string() + vs_divider + ai_text, file=discord.File(AI_party_img_path))
-                turn_order_img_path = dynamics.create_party_image(turn_order)
-                await message.channel.send(AI_party.get_HP_string() + divider_emoji + turn_order_text, file=discord.File(turn_order_img_path))
-
-                # Here, the bot reads in user response mid-round, and acts accordingly based on input
-                await message.channel.send('Input your attack commands [!oc 1|2|3 front|back].')
-                while not player_party.is_selection_done():  # Repeat while there are still OCs that still need to move.
-                    print('1 - DEBUG: Waiting for message.')
-                    
-                    response = await self.wait_for('message')
+            field = Battlefield(oc_table, player_party, AI_party, rng)
+        else:
+            out.write('Resuming the fight against the AI, ' + player_name + '!')
+            player_party = field.get_party(0)
+            AI_party = field.get_party(1)
+        AI_player = ai.ExpectimaxAI(field.table, AI_DEPTH, AI_TIME_BUDGET)
+
+        # Create a loop that continues the battle until a victory condition is reached.
+        battle_loop_on = True
+        while battle_loop_on:
+
+            # Calculate the new party order and turn order (these are lists of OC objects)
+            player_OCs = player_party.get_OCs()
+            AI_OCs = AI_party.get_OCs()
+            turn_order = field.calculate_turns()
+
+            # Render the whole battle board (both parties with HP bars, then the turn order) as a single image
+            # on the render pool, so each turn is one encode and one upload and the event loop is never blocked.
+            board_img = await render_pool.render_board_image(player_OCs, AI_OCs, turn_order)
+            board_text = user_text + '\n' + vs_divider + ai_text + '\n' + divider_emoji + turn_order_text
+            out.write(board_text)
+            out.attach(discord.File(board_img, filename='battle_board.png'))
+
+            # Here, the bot reads in user response mid-round, and acts accordingly based on input
+            out.write('Input your attack commands [!oc 1|2|3 front|back].')
+            await out.flush()
+            while not player_party.is_selection_done():  # Repeat while there are still OCs that still need to move.
+                response = await session.next_command()  # Only the player's commands in this channel arrive here
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('Battle command', extra={'channel': channel.id, 'player': author.id, 'content': response.content})
+
+                # Preprocess and check if the command is in proper format
+                split_message = str(response.content).split()
+
+                # Prompt input from the user and set the targets based on the user response.
+                # Format: !oc 1|2|3 front|back
+                if response.content.startswith('!oc ') and len(split_message) == 3 and split_message[1].isnumeric() and int(split_message[1]) in [1, 2, 3]:
+                    card_index = int(split_message[1]) - 1       # Offset -1 here since indexing starts at zero.
+                    attack_string = split_message[2]             # String (front or back)
+                    current_OC = player_OCs[card_index]
+                    if not current_OC.is_defeated():
+                        target_string = '**' + current_OC.get_owner_nickname() + ':** ' + current_OC.get_name() + ' is set to attack ' 
+                        if attack_string == 'front':
+                            current_OC.set_target(0)
+                            target_string += 'the frontline!'
+                            out.write(target_string)
+                        elif attack_string == 'back':
+                            current_OC.set_target(AI_party.get_random_backline())
+                            target_string += 'the backline!'
+                            out.write(target_string)
+            turn_start = time.perf_counter()
+
+            # Have the AI pick front or back for each OC by searching ahead, knowing the player's targets.
+            AI_attack_pattern = []
+            # The search runs in a worker thread so it doesn't hold up the other channels' battles.
+            state, player_targets = AI_player.get_position(field, 1)
+            with metrics.timer('oc_ai_decision_seconds'):
+                AI_choices = await asyncio.get_running_loop().run_in_executor(None, AI_player.search, state,
+                                                                              player_targets, 1)
+            for AI_OC, choice in zip(AI_OCs, AI_choices):
+                if choice is None:  # Defeated
+                    continue
+                AI_attack_string = '**AI:** ' + AI_OC.get_name() + ' is set to attack the '
+                if choice == ai.FRONT:
+                    AI_OC.set_target(0)
+                    AI_attack_string += ('frontline!\n')
+                else:
+                    AI_OC.set_target(player_party.get_random_backline())
+                    AI_attack_string += ('backline!\n')
+                AI_attack_pattern.append(AI_attack_string)
+            out.write('-----------------------------------------\n' + ''.join(AI_attack_pattern))
+
+            # When the bot reaches this point, it does the actual attacking and calculation here.
+            # Once the attacks are done, the results are then calculated and printed.
+            out.write('-----------------------------------------\n**ATTACK RESULTS:**')
+            for oc in turn_order:
+                if not oc.is_defeated():
+                    act = Action(field, oc, oc.target)
+                    field.add(act)
                     
-                    print('2 - DEBUG: Received user message.')
-                    print(str(response.content))
+            action_strings = field.evaluate()
+            out.write(action_strings)
+
+            # If all of player A's OCs have been defeated, print out the victory condition for B.
+            if player_party.is_defeated():
+                battle_loop_on = False  # End the game if one player has been defeated.
+                out.write('AI :blue_circle: **WINS!**')
+                out.attach(discord.File('assets/AI/bot.png'))
                     
-                    # If the user sents in a valid response, set the card to attack their target shortly.
-                    # Check if the bot is checking against itself to avoid infinite loops.
-                    if response.author.id == self.user.id:  
-                        return False
-
-                    # Preprocess and check if the command is in proper format
-                    split_message = str(response.content).split()
-
-                    # Prompt input from the user and set the targets based on the user response.
-                    # Format: !oc 1|2|3 front|back
-                    print('3 - DEBUG: Checking response content.')
-                    if response.content.startswith('!oc ') and len(split_message) == 3 and split_message[1].isnumeric() and int(split_message[1]) in [1, 2, 3]:
-                        card_index = int(split_message[1]) - 1       # Offset -1 here since indexing starts at zero.
-                        attack_string = split_message[2]             # String (front or back)
-                        current_OC = player_OCs[card_index]
-                        if not current_OC.is_defeated():
-                            target_string = '**' + current_OC.get_owner_nickname() + ':** ' + current_OC.get_name() + ' is set to attack ' 
-                            if attack_string == 'front':
-                                current_OC.set_target(0)
-                                target_string += 'the frontline!'
-                                await message.channel.send(target_string)
-                            elif attack_string == 'back':
-                                current_OC.set_target(AI_party.get_random_backline())
-                                target_string += 'the backline!'
-                                await message.channel.send(target_string)
-                    print('4 - DEBUG: Response content checked.')
-                print('5 - DEBUG: All party members have selected a target.')
+            # Check if all of player B / AI's OCs have been defeated.
+            elif AI_party.is_defeated():
+                battle_loop_on = False  # End the game if one player has been defeated.
+                out.write(':trophy:' * 3 + ' ' + author.name + ' :red_circle: **WINS!** ' + ':trophy:' * 3)
+                out.write(str(author.avatar_url))
                 
-                # Have the AI randomly attack targets.
-                AI_attack_pattern = []
-                for AI_OC in AI_OCs:
-                    attack_index = player_party.get_random()
-                    AI_OC.set_target(attack_index)
-                    AI_attack_string = '**AI:** ' + AI_OC.get_name() + ' is set to attack the '
-                    if attack_index is 0:
-                        AI_attack_string += ('frontline!\n')
-                    else:
-                        AI_attack_string += ('backline!\n')
-                    if not AI_OC.is_defeated():
-                        AI_attack_pattern.append(AI_attack_string)
-                await message.channel.send('-----------------------------------------\n' + ''.join(AI_attack_pattern))
-
-                # When the bot reaches this point, it does the actual attacking and calculation here.
-                # Once the attacks are done, the results are then calculated and printed.
-                await message.channel.send('-----------------------------------------\n**ATTACK RESULTS:**')
-                for oc in turn_order:
-                    if not oc.is_defeated():
-                        act = Action(field, oc, oc.target)
-                        field.add(act)
-                        
-                action_strings = field.evaluate()
-                await message.channel.send(action_strings)
-
-                # If all of player A's OCs have been defeated, print out the victory condition for B.
-                if player_party.is_defeated():
-                    battle_loop_on = False  # End the game if one player has been defeated.
-                    await message.channel.send('AI :blue_circle: **WINS!**', file=discord.File('assets/AI/bot.png'))
-                        
-                # Check if all of player B / AI's OCs have been defeated.
-                elif AI_party.is_defeated():
-                    battle_loop_on = False  # End the game if one player has been defeated.
-                    await message.channel.send(':trophy:' * 3 + ' ' + message.author.name + ' :red_circle: **WINS!** ' + ':trophy:' * 3)
-                    await message.channel.send(message.author.avatar_url)
-                    
-                # Continue the battle loop if the game has not ended yet (both players are still alive).
-                if battle_loop_on:
-                    await message.channel.send(divider_emoji + '__**NEW TURN**__\n' + divider_emoji)
-                    
-                # Update the party status after a round has passed.
-                player_party.update()
-                AI_party.update()
+            # Continue the battle loop if the game has not ended yet (both players are still alive).
+            if battle_loop_on:
+                out.write(divider_emoji + '__**NEW TURN**__\n' + divider_emoji)
 
-            return True
-        return False
+            # Send the targeting, the results and the end of turn as one message.
+            await out.flush()
+            metrics.observe('oc_battle_turn_seconds', time.perf_counter() - turn_start)
+                
+            # Update the party status after a round has passed.
+            player_party.update()
+            AI_party.update()
+
+            # Save the resolved turn so the battle can be resumed after a restart. play_AI_battle clears it at the end.
+            if battle_loop_on:
+                state = snapshot.snapshot_battle(field, channel.id, author.id)
+                await asyncio.get_running_loop().run_in_executor(None, snapshot.save_snapshot, state, SNAPSHOT_DIR)
+
+        return True
     
     
     async def help_func(self, message: discord.Message) -> bool:
@@ -256,11 +494,11 @@ class OC_Client(discord.Client):
         """
         if message.content.startswith('!oc help'):
             OC_help_string = 'Welcome to OC Battle! Below you can find the list of commands:\n'
-            OC_dex = '> !oc dex ID - Check the OCdex for the specific OC ID number.\n'
-            OC_battle = '> !oc battle - Try a sample test battle against the AI.\n'
+            OC_dex = '> !oc dex ID|NAME - Check the OCdex for the specific OC ID number or name.\n'
+            OC_battle = '> !oc battle [SEED] - Try a sample test battle against the AI. Give a battle seed to replay a battle.\n'
             OC_tally = '> !oc tally - (UNFINISHED) See how many gacha points you have.\n'
             help_string = OC_help_string + OC_dex + OC_battle + OC_tally
-            await message.channel.send(help_string)
+            await outbox.ChannelOutbox(message.channel).send(help_string)
             return True
         return False
 
@@ -268,18 +506,11 @@ class OC_Client(discord.Client):
     async def tally_count(self, message: discord.Message):
         """This function will eventually print out how many points you have."""
         if message.content.startswith('!oc tally'):
-            await message.channel.send('Functioning point system coming soon.')
+            await outbox.ChannelOutbox(message.channel).send('Functioning point system coming soon.')
             
     async def hello_func(self, message: discord.Message):
         """This function adds a new user."""
-
-        # load users
-        with open('users.json') as f:
-            user_data = json.load(f)            
         if message.content.startswith('!hello'):
-            if str(message.author.id) not in user_data:
-                user_data[str(message.author.id)] = {'name': str(message.author), 'deck':[], 'points':0}
-                with open('users.json', 'w') as f: # ToDo: use temp file, and rename for security
-                    json.dump(user_data, f, indent=4)
-                await message.channel.send('New user detected. Welcome {name}!'.format(name = user_data[str(message.author.id)]['name']))
-
+            user = await USERS.add_async(str(message.author.id), str(message.author))  # Saved on the next flush
+            if user is not None:
+                await outbox.ChannelOutbox(message.channel).send('New user detected. Welcome {name}!'.format(name = user['name']))
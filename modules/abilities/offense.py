@@ -13,13 +13,16 @@ def __init__(self, field: 'Battlefield', user: 'OC', target_index: int, ability
         self.user = user
         self.target = None
         self.target_index = target_index
-        self.action_string = ''  # String used to output information about the specific ability into Discord
+        self.events = []  # Events emitted by the ability, rendered into Discord text on request
         if ability is None:
             self.ability = self.offense.attack
         else:
             self.ability = ability
         self.num_turns = None  # How many turns the action lasts. Remove from the action queue when it hits 0.
+
+Abilities report what they did with self.emit(kind, target, amount, HP_before), see events.py.
 """
+from modules.mechanics import events
 
 
 class Offense():
@@ -28,9 +31,6 @@ class Offense():
         if not self.user.is_defeated():
             self.num_turns = 0
             
-            # String to return and display
-            self.action_string = '**' + self.user.get_owner_nickname() + ':** ' + self.user.get_name() + ' (' + self.user.get_HP_string() + ')'
-            
             # Determine which party to retrieve to attack
             user_ID = self.user.get_owner_ID()
             party_A = self.field.get_party(0)
@@ -47,20 +47,16 @@ class Offense():
             if self.target.is_defeated():
                 random_index = enemy_party.get_random()
                 if not random_index:  # If all enemies are defeated, stop.
-                    self.action_string = ''
                     return
                 self.target = enemy_OCs[random_index]
                 
             # Calculate the damage
-            user_atk = self.user.attributes['ATK']
-            target_HP = self.target.attributes['HP']
+            user_atk = self.user.ATK
+            target_HP = self.target.HP
             new_target_HP = max(0, target_HP - user_atk)
             self.target.set('HP', new_target_HP)
             
             # Set to defeated if user deals finishing blow.
             if self.target.is_defeated():
                 self.target.set_defeated(True)
-                self.action_string += ' defeats ' 
-            else:
-                self.action_string += ' strikes ' 
-            self.action_string += self.target.get_name() + ' (' + self.target.get_HP_string() + ') with ' + str(user_atk) + ' damage!\n'
\ No newline at end of file
+            self.emit(events.ATTACK, self.target, user_atk, target_HP)
\ No newline at end of file
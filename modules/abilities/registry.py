@@ -0,0 +1,89 @@
+"""
+Registry of every ability, keyed by the ability IDs used in oc_data.json (ability1 / ability2).
+
+Abilities are defined as data in ABILITY_SPECS. Each spec names an effect from EFFECTS plus its parameters,
+and is compiled once into a plain function that takes the Action being run. The OC table resolves every
+card's abilities when the catalogue loads, so running an action is a single table lookup and call.
+
+To add an ability, add a spec here, or add a new effect to the matching ability class (Offense, Support,
+Status_Effect or Technical) and to EFFECTS.
+"""
+from typing import List, Set, Dict, Tuple, Optional, Callable
+import functools
+import logging
+
+from modules.abilities.offense import Offense
+from modules.abilities.support import Support
+
+
+log = logging.getLogger(__name__)
+
+# Effect name -> function taking (action, **params)
+EFFECTS = {
+    'attack': Offense.attack,
+    'heal': Support.heal
+}
+
+# Ability ID -> ability spec
+ABILITY_SPECS = {
+    0: {'name': 'Strike', 'description': 'Strike an enemy.', 'effect': 'attack'}
+}
+
+DEFAULT_ABILITY_ID = 0  # Used for ability IDs that have no spec
+
+
+class Ability:
+    """Class to represent a compiled ability."""
+    __slots__ = ('ID', 'name', 'description', 'effect', 'params', 'priority', 'func')
+
+
+    def __init__(self, ID: int, spec: Dict):
+        """Compiles an ability from its spec.
+
+        :param ID: The ability ID.
+        :param spec: The ability spec, see ABILITY_SPECS.
+        """
+        self.ID = ID
+        self.name = spec['name']
+        self.description = spec.get('description', '')
+        self.effect = spec['effect']
+        self.params = spec.get('params', {})
+        self.priority = spec.get('priority', 0)  # Higher priority abilities go first in the turn order
+        if self.effect not in EFFECTS:
+            raise Exception('ERROR: Unknown effect ' + str(self.effect) + ' for ability ' + str(ID) + '!')
+        effect = EFFECTS[self.effect]
+        self.func = functools.partial(effect, **self.params) if self.params else effect
+
+
+    def __call__(self, action: 'Action'):
+        """Runs the ability for an action."""
+        self.func(action)
+
+
+# Compiled abilities, keyed by ability ID
+_abilities = {ability_ID: Ability(ability_ID, spec) for ability_ID, spec in ABILITY_SPECS.items()}
+
+
+def register(ability_ID: int, spec: Dict) -> Ability:
+    """Adds or replaces an ability. Cards only pick up the change when the catalogue is next loaded.
+
+    :param ability_ID: The ability ID.
+    :param spec: The ability spec, see ABILITY_SPECS.
+    :return: The compiled ability.
+    """
+    ability = Ability(ability_ID, spec)
+    _abilities[ability_ID] = ability
+    return ability
+
+
+def resolve(ability_ID: int) -> Ability:
+    """Looks up the compiled ability for an ability ID.
+
+    :param ability_ID: The ability ID.
+    :return: The ability. Unknown IDs resolve to the default ability.
+    """
+    ability = _abilities.get(ability_ID)
+    if ability is None:
+        log.warning('No ability with this ID, using the default ability', extra={'ability_ID': ability_ID, 'default': _abilities[DEFAULT_ABILITY_ID].name})
+        ability = _abilities[DEFAULT_ABILITY_ID]
+    return ability
@@ -13,7 +13,7 @@ def __init__(self, field: 'Battlefield', user: 'OC', target_index: int, ability
         self.user = user
         self.target = None
         self.target_index = target_index
-        self.action_string = ''  # String used to output information about the specific ability into Discord
+        self.events = []  # Events emitted by the ability, rendered into Discord text on request
         if ability is None:
             self.ability = self.offense.attack
         else:
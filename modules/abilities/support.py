@@ -13,13 +13,16 @@ def __init__(self, field: 'Battlefield', user: 'OC', target_index: int, ability
         self.user = user
         self.target = None
         self.target_index = target_index
-        self.action_string = ''  # String used to output information about the specific ability into Discord
+        self.events = []  # Events emitted by the ability, rendered into Discord text on request
         if ability is None:
             self.ability = self.offense.attack
         else:
             self.ability = ability
         self.num_turns = None  # How many turns the action lasts. Remove from the action queue when it hits 0.
+
+Abilities report what they did with self.emit(kind, target, amount, HP_before), see events.py.
 """
+from modules.mechanics import events
 
 
 class Support():
@@ -27,4 +30,24 @@ class Support():
         """Standard template."""
         if not self.user.is_defeated():
             self.num_turns = 0
-            pass
\ No newline at end of file
+            pass
+
+
+    def heal(self, amount: int):
+        """Heal the most injured ally.
+        :param amount: How much HP to restore.
+        """
+        if not self.user.is_defeated():
+            self.num_turns = 0
+            
+            # Determine which party the user belongs to, and pick the ally with the lowest share of their HP left
+            party_A = self.field.get_party(0)
+            ally_party = party_A if self.user.get_owner_ID() == party_A.get_owner_ID() else self.field.get_party(1)
+            allies = [oc for oc in ally_party.get_OCs() if not oc.is_defeated()]
+            self.target = min(allies, key=lambda x: x.HP / x.max_HP)
+            
+            # Restore HP, up to the maximum
+            HP_before = self.target.HP
+            new_HP = min(self.target.max_HP, HP_before + amount)
+            self.target.set('HP', new_HP)
+            self.emit(events.HEAL, self.target, new_HP - HP_before, HP_before)
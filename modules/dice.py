@@ -1,41 +1,105 @@
-from typing import List, Set, Dict, Tuple, Optional
-import random
+from typing import List, Set, Dict, Tuple, Optional, Union
+import functools
+import numpy as np
+
+from modules.mechanics.rng import BattleRNG
+
+
+@functools.lru_cache(maxsize=None)
+def get_probability_table(n: int) -> np.ndarray:
+    """Builds the exact success probabilities of an n-sided dice check.
+    A check succeeds if roll + modifier >= threshold, so it only depends on the roll needed, threshold - modifier.
+
+    :param n: How many sides the dice has.
+    :return: An array where index k is the chance of rolling at least k, for k from 0 to n + 1.
+    """
+    needed = np.arange(n + 2)
+    table = (n - np.clip(needed, 1, n + 1) + 1) / n
+    table.setflags(write=False)
+    return table
+
+
+def success_probability(n: int, threshold: Union[int, np.ndarray], roll_modifier: Union[int, np.ndarray] = 0) -> Union[float, np.ndarray]:
+    """Looks up the exact chance of passing a check with an n-sided dice, without rolling.
+
+    :param n: How many sides the dice has.
+    :param threshold: What dice roll threshold the roll has to go over to pass the check. Can be an array.
+    :param roll_modifier: A positive or negative numerical value added to the roll. Can be an array.
+    :return: The chance of success, as an array if any input is an array.
+    """
+    needed = np.clip(np.subtract(threshold, roll_modifier), 0, n + 1)
+    result = get_probability_table(n)[needed]
+    return float(result) if np.ndim(result) == 0 else result
 
 
 class Dice:
-	"""Class to represent an n-sided dice roll. This will work very similar to DnD dice rolls."""
-    
-    
-	def __init__(self, n: int):
+    """Class to represent an n-sided dice roll. This will work very similar to DnD dice rolls."""
+
+
+    def __init__(self, n: int, rng: Union[BattleRNG, np.random.Generator] = None):
         """Initialize the dice class.
-        :param n: How many sides the dice has."""
-		self.n = n
-		
-        
-	def roll(self, threshold: int, roll_modifier: int = 0) -> bool:
-		"""Roll the dice against a given threshold. 
+        :param n: How many sides the dice has.
+        :param rng: The random stream of the battle the dice is rolled in, or a NumPy generator for simulations.
+                    Defaults to a freshly seeded stream."""
+        self.n = n
+        self.rng = rng if rng is not None else BattleRNG()
+
+
+    def roll(self, threshold: int, roll_modifier: int = 0) -> bool:
+        """Roll the dice against a given threshold.
 
         :param threshold: What dice roll threshold the roll has to go over to pass the check.
         :param roll_modifier: A positive or negative numerical value that either benefits or penalizes the input roll.
         :return: A success is returned as True, else it returns False."""
-		result = self.generate()
-		if result + roll_modifier >= threshold:
-			return True
-		else:
-			return False
-		
-        
-	def generate(self) -> int:
-		"""Generate an integer value between 1 and n.
-        
+        result = self.generate()
+        if result + roll_modifier >= threshold:
+            return True
+        else:
+            return False
+
+
+    def roll_many(self, count: int, threshold: Union[int, np.ndarray], roll_modifier: Union[int, np.ndarray] = 0) -> np.ndarray:
+        """Roll many checks at once. Draws the same numbers from the stream as calling roll count times.
+
+        :param count: How many checks to roll.
+        :param threshold: What dice roll threshold the rolls have to go over. Can be an array with one value per check.
+        :param roll_modifier: A value added to the rolls. Can be an array with one value per check.
+        :return: A boolean array with True for every check that succeeded.
+        """
+        return self.generate_many(count) + roll_modifier >= threshold
+
+
+    def probability(self, threshold: Union[int, np.ndarray], roll_modifier: Union[int, np.ndarray] = 0) -> Union[float, np.ndarray]:
+        """Exact chance that roll succeeds, without rolling. See success_probability.
+        :return: The chance of success, as an array if any input is an array.
+        """
+        return success_probability(self.n, threshold, roll_modifier)
+
+
+    def generate(self) -> int:
+        """Generate an integer value between 1 and n.
+
         :return: A randomly generated int value between 1 and the n-side, inclusive.
         """
-		return random.randint(1, self.n)
-		
-        
-	def setN(self, n: int):
-		"""Setter function to change the number of sides for the dice.
-        
+        if isinstance(self.rng, np.random.Generator):
+            return int(self.rng.integers(1, self.n + 1))
+        return self.rng.randint(1, self.n)
+
+
+    def generate_many(self, count: int) -> np.ndarray:
+        """Generate many integer values between 1 and n at once.
+
+        :param count: How many values to generate.
+        :return: An int array of values between 1 and the n-side, inclusive.
+        """
+        if isinstance(self.rng, np.random.Generator):
+            return self.rng.integers(1, self.n + 1, size=count)
+        return 1 + (self.rng.random_many(count) * self.n).astype(np.int64)
+
+
+    def setN(self, n: int):
+        """Setter function to change the number of sides for the dice.
+
         :param n: Number of sides to change the dice to.
         """
-		self.n = n
\ No newline at end of file
+        self.n = n
@@ -3,6 +3,8 @@ from modules.abilities.offense import Offense
 from modules.abilities.support import Support
 from modules.abilities.status_effect import Status_Effect
 from modules.abilities.technical import Technical
+from modules.abilities import registry
+from modules.mechanics import events
 
 
 class Action(Offense, Support, Status_Effect, Technical):  # Put inheritances here.
@@ -14,36 +16,57 @@ class Action(Offense, Support, Status_Effect, Technical):  # Put inheritances he
         :param field: The battlefield object for the current game.
         :param user: The OC object representing the user of the ability.
         :param target_index: The index of the target for this ability (0: frontline, 1: back1, 2: back2)
-        :param ability: The ability function object.
+        :param ability: The ability to use: an Ability from the registry, an ability ID, or None for the user's first ability.
         """
-        # Ability information (TODO: make use of later)
-        self.ability_name = ''
-        self.ability_ID = -1
-        self.description = ''
+        # Ability information, resolved from the ability registry
+        if ability is None:
+            ability = user.get_ability(1)
+        elif not isinstance(ability, registry.Ability):
+            ability = registry.resolve(ability)
+        self.ability_name = ability.name
+        self.ability_ID = ability.ID
+        self.description = ability.description
         
         # Resources
         self.field = field
         self.user = user
         self.target = None
         self.target_index = target_index
-        self.action_string = ''  # String used to output information about the specific ability into Discord
-        if ability is None:
-            self.ability = self.attack
-        else:
-            self.ability = ability
+        self.events = []  # Events emitted by the last evaluation, rendered into Discord text on request
+        self.ability = ability.func  # Precompiled function that takes this action
         self.num_turns = None  # How many turns the action lasts. Remove from the action queue when it hits 0.
+        self.priority = ability.priority  # Actions with a higher priority go first in the turn order, regardless of speed.
 
 
     def evaluate(self):
-        """Runs the selected ability."""
-        self.ability()
+        """Runs the selected ability. Its events are added to the battle log."""
+        self.events = []
+        self.action_number = self.field.log.next_action()
+        self.ability(self)
+
+
+    def emit(self, kind: str, target: 'OC', amount: int, HP_before: int):
+        """Records an event of this action in the battle log. Called by the ability functions.
+
+        :param kind: The event kind (see events.py).
+        :param target: The OC affected, with its state already updated.
+        :param amount: The damage dealt or HP restored.
+        :param HP_before: The HP of the target before the event.
+        """
+        log = self.field.log
+        event = events.Event(log.turn, self.action_number, kind,
+                             self.field.get_party_index(self.user), self.user.ID, self.user.HP, self.user.max_HP,
+                             self.field.get_party_index(target), target.ID, target.max_HP,
+                             amount, HP_before, target.HP, target.is_defeated() and HP_before > 0)
+        log.append(event)
+        self.events.append(event)
 
 
     def get_string(self) -> str:
-        """Retrieves the string to be printed out into the Discord channel.
+        """Retrieves the string to be printed out into the Discord channel, rendered from the events of the last evaluation.
         :return: String object to be fed into a channel message.
         """
-        return self.action_string
+        return events.render_events(self.events, self.field)
         
         
     def get_num_turns(self) -> int:
@@ -0,0 +1,338 @@
+"""
+Search-based AI opponent.
+
+The AI picks front or back for each of its OCs, the same choices a player has, by expectimax search over a compact
+model of the battle rules (Battlefield.calculate_turns, the ability effects, Offense.attack and Party.update):
+    - Its own choices are max nodes. A 'back' choice and every retarget of an attack on a defeated OC are chance
+      nodes, weighted by the probability of each outcome, like Party.get_random_backline and Party.get_random.
+    - The player has already picked this turn's targets when the AI decides. On later turns the player is assumed
+      to pick front or back at random for each OC.
+    - Positions beyond the search depth are scored by how much HP and Attack each side has left.
+
+The search deepens one turn at a time until it reaches the configured depth or runs out of its time budget, and
+uses the choice from the deepest finished search, so a decision never takes much longer than the budget.
+Positions are memoized in a transposition table keyed by the compact state tuple, shared across the decisions
+of one battle.
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import time
+
+
+FRONT = 'front'
+BACK = 'back'
+
+DEFAULT_DEPTH = 2           # How many turns to search ahead
+DEFAULT_TIME_BUDGET = 0.05  # Seconds per decision
+MAX_TABLE_SIZE = 200000     # The transposition table is cleared when it grows past this many positions
+
+WIN_VALUE = 1.0
+HEURISTIC_SCALE = 0.9       # Keeps heuristic scores below a certain win or loss
+
+# Fields of an OC in the compact state
+ID, HP, MAX_HP, ATK, SPD, LUCK, COIN = range(7)
+
+
+class _Timeout(Exception):
+    """Raised inside the search when the time budget is used up."""
+
+
+def get_state(field: 'Battlefield') -> Tuple:
+    """Builds the compact state of a battle: for each party, for each position, the tuple
+    (OC ID, HP, max HP, ATK, SPD, LUCK, turn order coin flip).
+
+    :param field: The battlefield.
+    :return: The state as nested tuples.
+    """
+    state = []
+    for party_index in range(2):
+        ocs = field.get_party(party_index).get_OCs()
+        state.append(tuple((oc.ID, oc.HP if not oc.is_defeated() else 0, oc.max_HP, oc.ATK, oc.SPD, oc.LUCK, coin)
+                           for oc, coin in zip(ocs, field.scheduler.get_coins(ocs))))
+    return tuple(state)
+
+
+def _backline_targets(enemy: Tuple) -> Dict[int, float]:
+    """Target distribution of a 'back' choice, like Party.get_random_backline."""
+    back1_up = enemy[1][HP] > 0
+    back2_up = enemy[2][HP] > 0
+    if back1_up and back2_up:
+        return {1: 0.5, 2: 0.5}
+    elif back1_up:
+        return {1: 1.0}
+    elif back2_up:
+        return {2: 1.0}
+    return {0: 1.0}
+
+
+def _joint_targets(per_OC: List[Optional[Dict[int, float]]]) -> Dict[Tuple, float]:
+    """Combines the target distributions of each OC of a party into a distribution of target tuples.
+    :param per_OC: A target distribution per position, None for defeated OCs.
+    :return: A dictionary of (target, target, target) -> probability.
+    """
+    joint = {(): 1.0}
+    for dist in per_OC:
+        combined = {}
+        for targets, p in joint.items():
+            if dist is None:
+                combined[targets + (None,)] = combined.get(targets + (None,), 0.0) + p
+                continue
+            for target, q in dist.items():
+                key = targets + (target,)
+                combined[key] = combined.get(key, 0.0) + p * q
+        joint = combined
+    return joint
+
+
+class ExpectimaxAI:
+    """Class to represent the AI opponent of one battle."""
+
+
+    def __init__(self, table: 'data_processing.OCTable', depth: int = DEFAULT_DEPTH,
+                 time_budget: float = DEFAULT_TIME_BUDGET, max_table_size: int = MAX_TABLE_SIZE):
+        """Initializes the AI.
+
+        :param table: The OC table of the battle, to look up abilities.
+        :param depth: How many turns to search ahead, at least 1.
+        :param time_budget: The most time in seconds a decision should take.
+        :param max_table_size: How many positions the transposition table holds before it is cleared.
+        """
+        self.table = table
+        self.depth = max(1, depth)
+        self.time_budget = time_budget
+        self.max_table_size = max_table_size
+        self.transpositions = {}  # (state, depth) -> expected value for the AI
+        self.me = 1               # Party index of the AI
+        self._deadline = None
+        self.last_depth = 0       # Depth of the search the last decision came from
+
+
+    def choose_targets(self, field: 'Battlefield', party_index: int = 1) -> List[Optional[str]]:
+        """Picks front or back for each OC of the AI's party. The opponent's targets for this turn must already be set.
+
+        :param field: The battlefield, after calculate_turns for this turn.
+        :param party_index: The party index of the AI, 0 or 1.
+        :return: FRONT or BACK per position, None for defeated OCs.
+        """
+        return self.search(*self.get_position(field, party_index), party_index)
+
+
+    def get_position(self, field: 'Battlefield', party_index: int = 1) -> Tuple[Tuple, Tuple]:
+        """Reads what the search needs from the battlefield, so the search itself never touches the live battle
+        and can run in another thread.
+
+        :param field: The battlefield, after calculate_turns for this turn.
+        :param party_index: The party index of the AI, 0 or 1.
+        :return: The compact state, and the opponent's target per position (None for defeated OCs).
+        """
+        state = get_state(field)
+        opponent = field.get_party(1 - party_index).get_OCs()
+        opponent_targets = tuple(oc.target if state[1 - party_index][i][HP] > 0 else None for i, oc in enumerate(opponent))
+        return state, opponent_targets
+
+
+    def search(self, state: Tuple, opponent_targets: Tuple, party_index: int = 1) -> List[Optional[str]]:
+        """Picks front or back for each OC of the AI's party by searching from a position from get_position.
+
+        :param state: The compact state.
+        :param opponent_targets: The opponent's target per position, None for defeated OCs.
+        :param party_index: The party index of the AI, 0 or 1.
+        :return: FRONT or BACK per position, None for defeated OCs.
+        """
+        self.me = party_index
+        self._deadline = time.perf_counter() + self.time_budget
+        options = self._get_options(state[party_index])
+
+        best = options[0]
+        self.last_depth = 0
+        if len(options) == 1:
+            return list(best)
+        for depth in range(1, self.depth + 1):
+            try:
+                values = [self._option_value(state, option, opponent_targets, depth) for option in options]
+            except _Timeout:
+                break
+            best = options[max(range(len(options)), key=lambda i: values[i])]
+            self.last_depth = depth
+        if len(self.transpositions) > self.max_table_size:
+            self.transpositions.clear()
+        return list(best)
+
+
+    def _get_options(self, party: Tuple) -> List[Tuple]:
+        """Lists every combination of front and back for the party's non-defeated OCs."""
+        options = [()]
+        for oc in party:
+            if oc[HP] > 0:
+                options = [option + (choice,) for option in options for choice in (FRONT, BACK)]
+            else:
+                options = [option + (None,) for option in options]
+        return options
+
+
+    def _option_targets(self, enemy: Tuple, option: Tuple) -> Dict[Tuple, float]:
+        """Target distribution of a party's front/back choices."""
+        backline = None
+        per_OC = []
+        for choice in option:
+            if choice is None:
+                per_OC.append(None)
+            elif choice == FRONT:
+                per_OC.append({0: 1.0})
+            else:
+                if backline is None:
+                    backline = _backline_targets(enemy)
+                per_OC.append(backline)
+        return _joint_targets(per_OC)
+
+
+    def _option_value(self, state: Tuple, option: Tuple, opponent_targets: Tuple, depth: int) -> float:
+        """Expected value of one of the AI's choices, given the opponent's targets for this turn."""
+        value = 0.0
+        for my_targets, p in self._option_targets(state[1 - self.me], option).items():
+            targets = (my_targets, opponent_targets) if self.me == 0 else (opponent_targets, my_targets)
+            value += p * self._turn_value(state, targets, depth)
+        return value
+
+
+    def _turn_value(self, state: Tuple, targets: Tuple, depth: int) -> float:
+        """Expected value of resolving a turn with the given targets, then searching depth - 1 more turns."""
+        if time.perf_counter() > self._deadline:
+            raise _Timeout()
+        value = 0.0
+        for p, next_state, winner in self._resolve(state, targets):
+            if winner is not None:
+                value += p * (WIN_VALUE if winner == self.me else -WIN_VALUE)
+            elif depth > 1:
+                value += p * self._chance_value(next_state, depth - 1)
+            else:
+                value += p * self._evaluate(next_state)
+        return value
+
+
+    def _chance_value(self, state: Tuple, depth: int) -> float:
+        """Expected value of a new turn where the opponent picks front or back at random, then the AI picks its best."""
+        key = (state, depth)
+        value = self.transpositions.get(key)
+        if value is not None:
+            return value
+        opponent = 1 - self.me
+        backline = _backline_targets(state[self.me])
+        per_OC = []
+        for oc in state[opponent]:
+            if oc[HP] > 0:
+                dist = {0: 0.5}
+                for target, q in backline.items():
+                    dist[target] = dist.get(target, 0.0) + 0.5 * q
+                per_OC.append(dist)
+            else:
+                per_OC.append(None)
+
+        options = self._get_options(state[self.me])
+        value = 0.0
+        for opponent_targets, p in _joint_targets(per_OC).items():
+            value += p * max(self._option_value(state, option, opponent_targets, depth) for option in options)
+        self.transpositions[key] = value
+        return value
+
+
+    def _evaluate(self, state: Tuple) -> float:
+        """Scores a position for the AI from the HP and Attack each side has left, between -1 and 1."""
+        scores = [sum(oc[HP] * oc[ATK] for oc in party if oc[HP] > 0) for party in state]
+        total = scores[0] + scores[1]
+        if total == 0:
+            return 0.0
+        return HEURISTIC_SCALE * (scores[self.me] - scores[1 - self.me]) / total
+
+
+    def _resolve(self, state: Tuple, targets: Tuple) -> List[Tuple[float, Tuple, Optional[int]]]:
+        """Plays out one turn with every random outcome, following Battlefield.evaluate and Party.update.
+
+        :param state: The state at the start of the turn.
+        :param targets: The target index of each OC, per party and position.
+        :return: A list of (probability, state after the turn, winning party or None).
+        """
+        # Turn order: every non-defeated OC by highest ability priority, then highest SPD, then highest LUCK,
+        # then the coin flip, like the TurnScheduler.
+        abilities = self.table.abilities
+        order = sorted(((p, pos) for p in range(2) for pos in range(3) if state[p][pos][HP] > 0),
+                       key=lambda x: (-abilities[state[x[0]][x[1]][ID]][0].priority, -state[x[0]][x[1]][SPD],
+                                      -state[x[0]][x[1]][LUCK], state[x[0]][x[1]][COIN]))
+
+        branches = {state: 1.0}
+        for p, pos in order:
+            effect = abilities[state[p][pos][ID]][0]
+            next_branches = {}
+            for branch, prob in branches.items():
+                for q, result in self._act(branch, p, pos, targets[p][pos], effect):
+                    next_branches[result] = next_branches.get(result, 0.0) + prob * q
+            branches = next_branches
+
+        outcomes = []
+        for branch, prob in branches.items():
+
+            # The player's party (party A) is checked for defeat first, like the battle loop.
+            if not any(oc[HP] > 0 for oc in branch[0]):
+                outcomes.append((prob, branch, 1))
+            elif not any(oc[HP] > 0 for oc in branch[1]):
+                outcomes.append((prob, branch, 0))
+            else:
+                outcomes.append((prob, tuple(self._update(party) for party in branch), None))
+        return outcomes
+
+
+    def _act(self, state: Tuple, p: int, pos: int, target: Optional[int], ability: 'registry.Ability') -> List[Tuple[float, Tuple]]:
+        """Runs one OC's ability with every random outcome.
+        :return: A list of (probability, state afterwards).
+        """
+        user = state[p][pos]
+        if user[HP] <= 0:
+            return [(1.0, state)]
+        params = ability.params
+        if ability.effect == 'attack':
+            enemy = state[1 - p]
+            if target is None:
+                return [(1.0, state)]
+            if enemy[target][HP] > 0:
+                return [(1.0, self._damage(state, 1 - p, target, user[ATK]))]
+
+            # Retarget a random non-defeated enemy. Like Offense.attack, a retarget to the frontline is dropped.
+            alive = [i for i in range(3) if enemy[i][HP] > 0]
+            if not alive:
+                return [(1.0, state)]
+            q = 1.0 / len(alive)
+            return [(q, state if i == 0 else self._damage(state, 1 - p, i, user[ATK])) for i in alive]
+        elif ability.effect == 'heal':
+            alive = [i for i in range(3) if state[p][i][HP] > 0]
+            i = min(alive, key=lambda x: state[p][x][HP] / state[p][x][MAX_HP])
+            oc = list(state[p][i])
+            oc[HP] = min(oc[MAX_HP], oc[HP] + params['amount'])
+            return [(1.0, self._replace_OC(state, p, i, tuple(oc)))]
+        return [(1.0, state)]  # Effects the model does not know are treated as doing nothing
+
+
+    def _damage(self, state: Tuple, p: int, pos: int, amount: int) -> Tuple:
+        """Lowers the HP of an OC."""
+        oc = list(state[p][pos])
+        oc[HP] = max(0, oc[HP] - amount)
+        return self._replace_OC(state, p, pos, tuple(oc))
+
+
+    def _replace_OC(self, state: Tuple, p: int, pos: int, oc: Tuple) -> Tuple:
+        """Builds a new state with one OC replaced."""
+        party = state[p][:pos] + (oc,) + state[p][pos + 1:]
+        return self._replace_party(state, p, party)
+
+
+    def _replace_party(self, state: Tuple, p: int, party: Tuple) -> Tuple:
+        """Builds a new state with one party replaced."""
+        return (party, state[1]) if p == 0 else (state[0], party)
+
+
+    def _update(self, party: Tuple) -> Tuple:
+        """Swaps a defeated frontline with back1, or with back2 if back1 is also defeated, like Party.update."""
+        front, back1, back2 = party
+        if front[HP] <= 0 and back1[HP] > 0:
+            return (back1, front, back2)
+        elif front[HP] <= 0 and back2[HP] > 0:
+            return (back2, back1, front)
+        return party
@@ -0,0 +1,272 @@
+"""
+Balance analysis: win rates of every ordered 3-OC party against every other, for balancing the roster.
+
+Every matchup is a batch of seeded Monte Carlo battles run by the vectorized simulator (the same rules as
+Battlefield.evaluate and Party.update for cards that attack on their turn, see simulator.check_abilities), spread
+across a process pool. Results are cached on disk per matchup, keyed by a hash of the stats and ability IDs of the
+six cards involved, so changing one card only recomputes the matchups that include it. Each matchup is seeded from
+its own key, so its result does not depend on which other matchups were cached. Run it with:
+    python -m modules.mechanics.balance [--battles N] [--seed SEED] [--workers N] [--out FILE.npz]
+"""
+from typing import List, Set, Dict, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import hashlib
+import itertools
+import os
+import sqlite3
+import numpy as np
+
+from modules.mechanics import simulator
+
+
+CACHE_PATH = 'cache/balance.db'
+CACHE_VERSION = 2        # Bump when the battle rules change, so cached results are not reused
+BATTLES_PER_MATCHUP = 100
+BATTLES_PER_TASK = 50000  # Battles simulated in one call by a worker, which bounds worker memory use
+
+
+def get_lineups(IDs: List[int]) -> np.ndarray:
+    """Enumerates every ordered party of three different OCs (front, back1, back2).
+    :param IDs: The OC IDs to build parties from.
+    :return: An array of shape (L, 3) of OC IDs.
+    """
+    return np.array(list(itertools.permutations(IDs, 3)), dtype=np.int64).reshape(-1, 3)
+
+
+def get_card_hashes(table: 'data_processing.OCTable', stats: Dict[str, np.ndarray]) -> List[str]:
+    """Hashes the battle stats and ability IDs of every card. Cards with the same stats and abilities get the same hash.
+    :param table: The OC table built from the loaded in JSON file.
+    :param stats: The base stat columns from simulator.get_stat_columns.
+    :return: A list of hashes indexed by OC ID.
+    """
+    columns = zip(stats['HP'].tolist(), stats['ATK'].tolist(), stats['SPD'].tolist(), stats['LUCK'].tolist(),
+                  table.ability1, table.ability2)
+    return [hashlib.sha1(repr(card).encode()).hexdigest()[:16] for card in columns]
+
+
+def get_matchup_key(card_hashes: List[str], party_A: Tuple[int, int, int], party_B: Tuple[int, int, int], settings: str) -> str:
+    """Builds the cache key of one matchup.
+
+    :param card_hashes: The card hashes from get_card_hashes.
+    :param party_A: The OC IDs of party A.
+    :param party_B: The OC IDs of party B.
+    :param settings: The simulation settings the result depends on, see _get_settings.
+    :return: The cache key.
+    """
+    parts = [settings] + [card_hashes[ID] for ID in party_A] + [card_hashes[ID] for ID in party_B]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:24]
+
+
+def _get_settings(battles: int, seed: int, policy_A: str, policy_B: str, max_turns: int) -> str:
+    """Combines the simulation settings into one string for the cache keys."""
+    return '|'.join([str(CACHE_VERSION), str(battles), str(seed), policy_A, policy_B, str(max_turns)])
+
+
+@contextlib.contextmanager
+def _connect(cache_path: str):
+    """Opens the result cache, creating it if needed. Commits on success and closes it afterwards.
+    :return: The connection.
+    """
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    connection = sqlite3.connect(cache_path)
+    try:
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS matchups (key TEXT PRIMARY KEY, wins_A INTEGER, wins_B INTEGER, draws INTEGER)')
+            yield connection
+    finally:
+        connection.close()
+
+
+def get_battle_seeds(key: str, battles: int) -> np.ndarray:
+    """Derives the seed of every battle of a matchup from the matchup's cache key, which includes the root seed.
+    :param key: The cache key from get_matchup_key.
+    :param battles: How many battles the matchup has.
+    :return: Array of shape (battles,) of 64-bit seeds.
+    """
+    return np.uint64(int(key[:16], 16)) ^ np.arange(battles, dtype=np.uint64)
+
+
+def _simulate_task(stats: Dict[str, np.ndarray], pairs: np.ndarray, battles: int, seeds: np.ndarray,
+                   policy_A: str, policy_B: str, max_turns: int) -> np.ndarray:
+    """Runs the battles of a group of matchups in one simulator call. Runs in a worker process.
+
+    :param pairs: Array of shape (M, 2, 3) with the OC IDs of party A and party B of each matchup.
+    :param seeds: Array of shape (M * battles,) with the seed of every battle, from get_battle_seeds.
+    :return: Array of shape (M, 3) with party A wins, party B wins and draws of each matchup.
+    """
+    party_A = np.repeat(pairs[:, 0], battles, axis=0)
+    party_B = np.repeat(pairs[:, 1], battles, axis=0)
+    result = simulator.simulate(stats, party_A, party_B, policy_A=policy_A, policy_B=policy_B, max_turns=max_turns,
+                                rng=simulator.BattleStreams(seeds))
+    winners = result.winners.reshape(len(pairs), battles)
+    return np.stack([(winners == simulator.WINNER_A).sum(axis=1),
+                     (winners == simulator.WINNER_B).sum(axis=1),
+                     (winners == simulator.NO_WINNER).sum(axis=1)], axis=1)
+
+
+class BalanceReport:
+    """Class to represent the win rates of every lineup against every other lineup."""
+
+
+    def __init__(self, lineups: np.ndarray, wins_A: np.ndarray, wins_B: np.ndarray, draws: np.ndarray):
+        """Initializes the report.
+
+        :param lineups: Array of shape (L, 3) with the OC IDs of each lineup.
+        :param wins_A: Array of shape (L, L), how often the row lineup (as party A) beat the column lineup.
+        :param wins_B: Array of shape (L, L), how often the column lineup (as party B) won.
+        :param draws: Array of shape (L, L), how often the turn limit was hit.
+        """
+        self.lineups = lineups
+        self.wins_A = wins_A
+        self.wins_B = wins_B
+        self.draws = draws
+
+
+    def get_win_rates(self) -> np.ndarray:
+        """Calculates the win rate matrix.
+        :return: Array of shape (L, L) with the win rate of the row lineup against the column lineup.
+        """
+        total = self.wins_A + self.wins_B + self.draws
+        return self.wins_A / np.maximum(total, 1)
+
+
+    def get_lineup_win_rates(self) -> np.ndarray:
+        """Calculates how well each lineup does against the whole field, playing as either party.
+        :return: Array of shape (L,) of win rates.
+        """
+        wins = self.wins_A.sum(axis=1) + self.wins_B.sum(axis=0)
+        total = (self.wins_A + self.wins_B + self.draws).sum(axis=1) + (self.wins_A + self.wins_B + self.draws).sum(axis=0)
+        return wins / np.maximum(total, 1)
+
+
+    def get_card_win_rates(self) -> Dict[int, float]:
+        """Calculates the average win rate of the lineups each card appears in.
+        :return: A dictionary of OC ID -> win rate.
+        """
+        lineup_rates = self.get_lineup_win_rates()
+        return {int(ID): float(lineup_rates[(self.lineups == ID).any(axis=1)].mean()) for ID in np.unique(self.lineups)}
+
+
+    def save(self, file_path: str):
+        """Writes the report as a NumPy .npz file.
+        :param file_path: The path to write to.
+        """
+        np.savez_compressed(file_path, lineups=self.lineups, wins_A=self.wins_A, wins_B=self.wins_B, draws=self.draws)
+
+
+def analyze(table: 'data_processing.OCTable', IDs: List[int] = None, battles: int = BATTLES_PER_MATCHUP, seed: int = 0,
+            policy_A: str = simulator.POLICY_RANDOM, policy_B: str = simulator.POLICY_RANDOM, max_turns: int = 100,
+            workers: Optional[int] = None, cache_path: Optional[str] = CACHE_PATH) -> BalanceReport:
+    """Simulates every ordered lineup against every other, reusing cached matchups.
+
+    :param table: The OC table built from the loaded in JSON file.
+    :param IDs: The OC IDs to build lineups from. Defaults to every valid card.
+    :param battles: How many battles to simulate per matchup.
+    :param seed: The root seed. Every matchup is reproducible from its seed, whether or not other matchups are cached.
+    :param policy_A: The targeting policy for party A, see simulator.POLICIES.
+    :param policy_B: The targeting policy for party B.
+    :param max_turns: Battles still running after this many turns count as draws.
+    :param workers: How many worker processes to use. Defaults to the number of CPUs, 1 runs in this process.
+    :param cache_path: The SQLite file that matchup results are cached in. None disables the cache.
+    :return: The report.
+    """
+    if IDs is None:
+        IDs = [ID for ID in range(len(table.valid)) if table.valid[ID]]
+    simulator.check_abilities(table, IDs)
+    stats = simulator.get_stat_columns(table)
+    lineups = get_lineups(IDs)
+    card_hashes = get_card_hashes(table, stats)
+    settings = _get_settings(battles, seed, policy_A, policy_B, max_turns)
+    L = len(lineups)
+    lineup_tuples = [tuple(lineup) for lineup in lineups.tolist()]
+    keys = [get_matchup_key(card_hashes, lineup_tuples[i], lineup_tuples[j], settings) for i in range(L) for j in range(L)]
+
+    # Look up every matchup that has already been simulated.
+    cached = {}
+    if cache_path is not None and os.path.exists(cache_path):
+        with _connect(cache_path) as connection:
+            cached = {row[0]: row[1:] for row in connection.execute('SELECT key, wins_A, wins_B, draws FROM matchups')}
+    counts = np.zeros((L * L, 3), dtype=np.int64)
+    missing = []
+    for index, key in enumerate(keys):
+        result = cached.get(key)
+        if result is None:
+            missing.append(index)
+        else:
+            counts[index] = result
+
+    # Simulate the rest in groups. Every battle is seeded from its own matchup's key, not from the group.
+    if missing:
+        per_task = max(1, BATTLES_PER_TASK // battles)
+        groups = [missing[i:i + per_task] for i in range(0, len(missing), per_task)]
+        tasks = []
+        for group in groups:
+            group_indices = np.array(group)
+            pairs = np.stack([lineups[group_indices // L], lineups[group_indices % L]], axis=1)
+            seeds = np.concatenate([get_battle_seeds(keys[index], battles) for index in group])
+            tasks.append((stats, pairs, battles, seeds, policy_A, policy_B, max_turns))
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers == 1:
+            results = (_simulate_task(*task) for task in tasks)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(_simulate_task, *zip(*tasks))
+        try:
+            for group, group_counts in zip(groups, results):
+                counts[group] = group_counts
+                if cache_path is not None:
+                    with _connect(cache_path) as connection:
+                        connection.executemany('INSERT OR REPLACE INTO matchups VALUES (?, ?, ?, ?)',
+                                               [(keys[index],) + tuple(row) for index, row in zip(group, group_counts.tolist())])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    counts = counts.reshape(L, L, 3)
+    return BalanceReport(lineups, counts[:, :, 0], counts[:, :, 1], counts[:, :, 2])
+
+
+def _format_lineup(table: 'data_processing.OCTable', lineup: np.ndarray) -> str:
+    """Formats a lineup as its OC names, front first."""
+    return ' / '.join([table.name[ID] for ID in lineup.tolist()])
+
+
+if __name__ == "__main__":
+    from modules.processing import data_processing
+
+    parser = argparse.ArgumentParser(description='Simulate every ordered 3-OC lineup against every other.')
+    parser.add_argument('--data', default='data/oc_data.json', help='The OC JSON database.')
+    parser.add_argument('--battles', type=int, default=BATTLES_PER_MATCHUP, help='Battles per matchup.')
+    parser.add_argument('--seed', type=int, default=0, help='Root seed of the simulations.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes. Defaults to the number of CPUs.')
+    parser.add_argument('--cards', default=None, help='Comma separated OC IDs to build lineups from. Defaults to every card.')
+    parser.add_argument('--policy-A', default=simulator.POLICY_RANDOM, choices=simulator.POLICIES)
+    parser.add_argument('--policy-B', default=simulator.POLICY_RANDOM, choices=simulator.POLICIES)
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the result cache.')
+    parser.add_argument('--out', default=None, help='Write the full win count matrices to this .npz file.')
+    args = parser.parse_args()
+
+    table = data_processing.load_catalogue(args.data).table
+    IDs = [int(ID) for ID in args.cards.split(',')] if args.cards else None
+    report = analyze(table, IDs, args.battles, args.seed, args.policy_A, args.policy_B,
+                     workers=args.workers, cache_path=None if args.no_cache else CACHE_PATH)
+
+    print('Card win rates (' + str(len(report.lineups)) + ' lineups):')
+    for ID, rate in sorted(report.get_card_win_rates().items(), key=lambda x: -x[1]):
+        print('  ' + str(ID).rjust(3) + '  ' + format(rate, '.3f') + '  ' + table.name[ID])
+    lineup_rates = report.get_lineup_win_rates()
+    ranking = np.argsort(-lineup_rates)
+    print('Strongest lineups:')
+    for index in ranking[:5]:
+        print('  ' + format(lineup_rates[index], '.3f') + '  ' + _format_lineup(table, report.lineups[index]))
+    print('Weakest lineups:')
+    for index in ranking[-5:]:
+        print('  ' + format(lineup_rates[index], '.3f') + '  ' + _format_lineup(table, report.lineups[index]))
+    if args.out:
+        report.save(args.out)
+        print('Wrote the win count matrices to ' + args.out + '.')
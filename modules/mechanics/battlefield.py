@@ -1,23 +1,42 @@
 from typing import List, Set, Dict, Tuple, Optional
 from modules.mechanics import oc
+from modules.mechanics.rng import BattleRNG, TURN_ORDER_STREAM
+from modules.mechanics.events import BattleLog, render_events
+from modules.mechanics.scheduler import TurnScheduler, get_turn_priority
 
 
 class Battlefield:
     """Class to represent the battlefield game arena."""
     
     
-    def __init__(self, data: Dict, party_A: 'Party', party_B: 'Party'):
+    def __init__(self, data: 'data_processing.OCTable', party_A: 'Party', party_B: 'Party', rng: BattleRNG = None,
+                 coins: List[float] = None):
         """Initializes the battlefield.
         
-        :param data: The data file read from the OC JSON database
+        :param data: The OC table built from the OC JSON database
         :param party_A: The party object for player A
         :param party_B: The party object for player B
+        :param rng: The random stream of the battle. Every random choice in the battle is drawn from it,
+                    so the battle can be replayed from its seed. Defaults to a freshly seeded stream.
+        :param coins: The turn order coin flip of every OC, party A then party B in position order, e.g. from a
+                      snapshot. Defaults to coins derived from the battle seed, which leave the main stream untouched.
         """
+        self.table = data
         self.party_A = party_A
         self.party_B = party_B
+        self.rng = rng if rng is not None else BattleRNG()
+        party_A.rng = self.rng
+        party_B.rng = self.rng
         
         self.turn_queue = None  # Queue for turn order (6 OCs ordered from going first to going last)
         self.action_queue = []  # Queue for actions and abilities
+        self.log = BattleLog()  # Structured record of every event in the battle
+
+        # Turn scheduler. Each OC's tie-breaking coin flip is fixed here for the whole battle.
+        all_OCs = party_A.get_OCs() + party_B.get_OCs()
+        if coins is None:
+            coins = self.rng.derive(TURN_ORDER_STREAM, len(all_OCs))
+        self.scheduler = TurnScheduler(all_OCs, coins, get_turn_priority)
 
     
     def add(self, action: 'Action'):
@@ -27,43 +46,63 @@ class Battlefield:
         self.action_queue.append(action)
     
     
-    def evaluate(self) -> str:
-        """Evaluates every action object within the action queue and returns a string to output to Discord.
-        :return: string object to return as output to Discord.
+    def evaluate(self, render: bool = True) -> Optional[str]:
+        """Evaluates every action object within the action queue as one turn. The events are added to the battle log.
+
+        :param render: Whether to render the turn as Discord text. Simulations skip this.
+        :return: string object to return as output to Discord, or None if render is False.
         """
-        action_strings = []
+        self.log.next_turn()
+        first_event = len(self.log)
         for action in self.action_queue:
             action.evaluate()
-            action_strings.append(action.get_string())
 
         # Remove action from action queue if number of turns have expired.
         for i in reversed(range(len(self.action_queue))):
             action = self.action_queue[i]
             if action.get_num_turns() is 0:
                 self.action_queue.pop(i)
-        return ''.join(action_strings)
+        if not render:
+            return None
+        return render_events(self.log.events[first_event:], self)
 
     
     def calculate_turns(self) -> List[oc.OC]:
         """Function to calculate which OCs go first. 
         :return: A queue ordering of which OCs turns go first based on speed.
         """
-        # First check the action queue; fast actions take priority over slow actions.
-        
-        # Order by OCs with fast actions in order of highest to lowest speed
-        # TODO: Break same speed tiebreakers by looking at luck
-        # Break same luck tiebreakers with a 50% roll.
-        turn_order = self.party_A.get_OCs() + self.party_B.get_OCs()
-        turn_order.sort(key=lambda x: x.attributes['SPD'], reverse=True)  # Basic sorting, no tiebreaker
-        for oc in turn_order[::-1]:
-            if oc.is_defeated():  # If OC is defeated, remove it from the queue.
-                turn_order.remove(oc)
+        # Fast actions take priority over slow actions. The turn order is calculated before the turn's actions are
+        # queued, so the priority comes from the ability each OC's turn uses rather than from the action queue.
+        # Order by OCs with fast actions in order of highest to lowest speed.
+        # Break same speed tiebreakers by looking at luck, and same luck tiebreakers with a 50% roll.
+        # Defeated OCs are removed from the queue.
+        all_OCs = self.party_A.get_OCs() + self.party_B.get_OCs()
+        self.scheduler.refresh(all_OCs, get_turn_priority)
+        turn_order = self.scheduler.get_order()
         self.turn_queue = turn_order
         
         # Return a list of the OCs ordered from first turn order to last turn order.
         return turn_order
     
     
+    def get_coins(self) -> List[float]:
+        """Getter function for the turn order coin flips, e.g. to snapshot them.
+        :return: The coin flip of every OC, party A then party B in their current position order.
+        """
+        return self.scheduler.get_coins(self.party_A.get_OCs() + self.party_B.get_OCs())
+
+
+    def get_party_index(self, oc: 'OC') -> int:
+        """Getter function for which party an OC belongs to.
+        :param oc: The OC object.
+        :return: 0 for party A or 1 for party B
+        """
+        for member in self.party_A.get_OCs():
+            if member is oc:
+                return 0
+        return 1
+
+
     def get_party(self, party: int) -> 'Party':
         """Getter function to retrieve a list of a user's party
         
@@ -0,0 +1,131 @@
+"""
+Structured record of what happens in a battle.
+
+Abilities emit compact events into the battlefield's append-only BattleLog instead of building Discord text.
+Text is only rendered from the events when someone reads it (render_events), so simulations can run battles
+without formatting any strings, and the log can be used for replays and analytics.
+"""
+from typing import List, Set, Dict, Tuple, Optional, NamedTuple, Iterator
+
+
+# Event kinds
+ATTACK = 'attack'  # amount is the attacker's ATK
+HEAL = 'heal'      # amount is the HP restored
+
+
+class Event(NamedTuple):
+    """One thing that happened in a battle. OCs are referenced by party index (0 or 1) and OC ID."""
+    turn: int            # Turn number, starting at 1
+    action: int          # Action number within the battle, shared by every event of one action
+    kind: str            # ATTACK or HEAL
+    actor_party: int
+    actor_ID: int
+    actor_HP: int        # HP of the actor when it acted
+    actor_max_HP: int
+    target_party: int
+    target_ID: int
+    target_max_HP: int
+    amount: int
+    HP_before: int       # HP of the target before the event
+    HP_after: int        # HP of the target after the event
+    defeated: bool       # True if the event defeated the target
+
+
+class BattleLog:
+    """Class to represent the append-only event log of one battle."""
+
+
+    def __init__(self):
+        """Initializes an empty log."""
+        self.events = []   # Every event so far, in order
+        self.turn = 0      # Current turn number
+        self.action = 0    # Number of the last action started
+
+
+    def next_turn(self) -> int:
+        """Starts a new turn.
+        :return: The new turn number.
+        """
+        self.turn += 1
+        return self.turn
+
+
+    def next_action(self) -> int:
+        """Starts a new action. Events emitted until the next call belong to this action.
+        :return: The new action number.
+        """
+        self.action += 1
+        return self.action
+
+
+    def append(self, event: Event):
+        """Adds an event to the end of the log.
+        :param event: The event to add.
+        """
+        self.events.append(event)
+
+
+    def get_turn(self, turn: int) -> List[Event]:
+        """Getter function for the events of one turn.
+        :param turn: The turn number.
+        :return: A list of the events of that turn.
+        """
+        return [event for event in self.events if event.turn == turn]
+
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+
+    def __iter__(self) -> Iterator[Event]:
+        return iter(self.events)
+
+
+    def get_state(self) -> Dict:
+        """Getter function for what is needed to restore the log, e.g. in a battle snapshot.
+        :return: A dictionary with the turn and action numbers and every event as a list of its fields.
+        """
+        return {'turn': self.turn, 'action': self.action, 'events': [list(event) for event in self.events]}
+
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'BattleLog':
+        """Restores a log from get_state.
+        :param state: A dictionary with the turn and action numbers and the events.
+        :return: The restored log, continuing from the same turn.
+        """
+        battle_log = cls()
+        battle_log.turn = state['turn']
+        battle_log.action = state['action']
+        battle_log.events = [Event(*fields) for fields in state['events']]
+        return battle_log
+
+
+def _render_actor(event: Event, field: 'Battlefield') -> str:
+    """Formats the start of an event line, naming the actor and its HP."""
+    return '**' + field.get_party(event.actor_party).get_owner_nickname() + ':** ' + field.table.name[event.actor_ID] + \
+           ' (' + str(event.actor_HP) + '/' + str(event.actor_max_HP) + ')'
+
+
+def _render_target(event: Event, field: 'Battlefield') -> str:
+    """Formats the target of an event with its HP afterwards."""
+    return field.table.name[event.target_ID] + ' (' + str(event.HP_after) + '/' + str(event.target_max_HP) + ')'
+
+
+def render_events(events: List[Event], field: 'Battlefield') -> str:
+    """Renders events as Discord text, one line per action.
+
+    :param events: The events to render, in order.
+    :param field: The battlefield the events happened on, used to look up names.
+    :return: String object to return as output to Discord.
+    """
+    lines = []
+    for event in events:
+        if event.kind == ATTACK:
+            verb = ' defeats ' if event.defeated else ' strikes '
+            lines.append(_render_actor(event, field) + verb + _render_target(event, field) +
+                         ' with ' + str(event.amount) + ' damage!\n')
+        elif event.kind == HEAL:
+            lines.append(_render_actor(event, field) + ' heals ' + _render_target(event, field) +
+                         ' by ' + str(event.amount) + ' HP!\n')
+    return ''.join(lines)
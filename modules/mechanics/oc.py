@@ -1,44 +1,96 @@
 from typing import List, Set, Dict, Tuple, Optional
-import copy
 
 
 class OC:
-    """Class to represent an OC card instance in battle."""
+    """Class to represent an OC card instance in battle.
+    Base stats and information are read from the shared OC table, so an instance only holds its battle state.
+    """
+    __slots__ = ('table', 'ID', 'HP', 'active', 'target', 'position', 'owner_nickname', 'owner_ID', 'modifiers')
     
     
-    def __init__(self, data: Dict, id: int, owner_nickname: str = None, owner_ID: str = None):
+    def __init__(self, data: 'data_processing.OCTable', id: int, owner_nickname: str = None, owner_ID: str = None):
         """Initializes the OC card with some given data.
         
-        :param data: The OC data from the loaded in JSON file.
+        :param data: The OC table built from the loaded in JSON file.
         :param id: The ID for the OC.
         :owner: A string representing the name / owner of the OC card. Set when placed into a party
         """
-        # OC card stats and information
-        self.name = data[id]['name']          # String representation of OC name
+        data.check(id)
+        self.table = data
+        self.ID = id                          # ID number of OC in dex
         self.owner_nickname = owner_nickname  # Nickname of user that owns card
         self.owner_ID = str(owner_ID)
-        self.stars = data[id]['baseStars']	  # Number of stars / rarity
-        self.ID = id                          # ID number of OC in dex
         self.active = True                    # Can battle or is defeated
-        
-        # Quantitative stats, affected by modifiers
-        self.attributes = {
-            "HP":     data[id]['baseHP'],
-            "MaxHP":  data[id]['baseHP'],
-            "ATK":    data[id]['baseAttack'],
-            "SPD":    data[id]['baseSpeed'],
-            "LUCK":   data[id]['baseLuck']
-        }
-        self.baseAttributes = copy.deepcopy(self.attributes)
-        
-        # Qualitative information
-        self.art_path = data[id]['artPath']
-        self.lore = data[id]['lore']
-        
-        # Abilities are ID references to functions in a separate file
-        self.ability1 = data[id]['ability1']  # Generic attack
-        self.ability2 = data[id]['ability2']  # Special
+        self.HP = data.HP[id]                 # Current HP, the only stat that changes every turn
+        self.modifiers = None                 # Dictionary of stats changed from their base value, if any
         self.target = None
+        self.position = None
+
+
+    # Quantitative stats, affected by modifiers
+    @property
+    def max_HP(self) -> int:
+        return self.table.HP[self.ID] if self.modifiers is None else self.modifiers.get('MaxHP', self.table.HP[self.ID])
+
+    @property
+    def ATK(self) -> int:
+        return self.table.ATK[self.ID] if self.modifiers is None else self.modifiers.get('ATK', self.table.ATK[self.ID])
+
+    @property
+    def SPD(self) -> int:
+        return self.table.SPD[self.ID] if self.modifiers is None else self.modifiers.get('SPD', self.table.SPD[self.ID])
+
+    @property
+    def LUCK(self) -> int:
+        return self.table.LUCK[self.ID] if self.modifiers is None else self.modifiers.get('LUCK', self.table.LUCK[self.ID])
+
+
+    # Qualitative information
+    @property
+    def name(self) -> str:
+        return self.table.name[self.ID]
+
+    @property
+    def stars(self) -> int:
+        return self.table.stars[self.ID]  # Number of stars / rarity
+
+    @property
+    def art_path(self) -> str:
+        return self.table.art_path[self.ID]
+
+    @property
+    def lore(self) -> str:
+        return self.table.get_lore(self.ID)  # Read from the lore file on first use
+
+    # Abilities are ID references to functions in a separate file
+    @property
+    def ability1(self) -> int:
+        return self.table.ability1[self.ID]  # Generic attack
+
+    @property
+    def ability2(self) -> int:
+        return self.table.ability2[self.ID]  # Special
+
+
+    def get_ability(self, slot: int = 1) -> 'registry.Ability':
+        """Gets one of the OC's abilities, as resolved from the ability registry when the catalogue loaded.
+        :param slot: 1 for the first (generic) ability, 2 for the special ability.
+        :return: The compiled ability.
+        """
+        return self.table.abilities[self.ID][slot - 1]
+
+
+    @property
+    def attributes(self) -> Dict[str, int]:
+        """Snapshot of the current stats, keyed by attribute string. Prefer the stat properties in battle code."""
+        return {"HP": self.HP, "MaxHP": self.max_HP, "ATK": self.ATK, "SPD": self.SPD, "LUCK": self.LUCK}
+
+
+    @property
+    def baseAttributes(self) -> Dict[str, int]:
+        """Snapshot of the base stats, keyed by attribute string."""
+        table, id = self.table, self.ID
+        return {"HP": table.HP[id], "MaxHP": table.HP[id], "ATK": table.ATK[id], "SPD": table.SPD[id], "LUCK": table.LUCK[id]}
     
     
     def set(self, key: str, new_value: int):
@@ -46,7 +98,14 @@ class OC:
         :param key: The attribute string to set.
         :param new_value: The new value of the attribute.
         """
-        self.attributes[key] = new_value
+        if key == 'HP':
+            self.HP = new_value
+        elif key in ('MaxHP', 'ATK', 'SPD', 'LUCK'):
+            if self.modifiers is None:
+                self.modifiers = {}
+            self.modifiers[key] = new_value
+        else:  # Invalid input
+            raise Exception('ERROR: Invalid attribute ' + str(key) + '!')
 
     
     def set_target(self, oc_index: int):
@@ -94,7 +153,7 @@ class OC:
         """Return the HP ratio. Used for printing.
         :return: String version of the HP ratio.
         """
-        return str(self.attributes['HP']) + '/' + str(self.attributes['MaxHP'])
+        return str(self.HP) + '/' + str(self.max_HP)
         
         
     def get_art_path(self) -> str:
@@ -113,7 +172,7 @@ class OC:
         """Check if the OC is defeated.
         :return: True if defeated, False otherwise.
         """
-        if not self.active or self.attributes['HP'] <= 0:
+        if not self.active or self.HP <= 0:
             return True
         return False
         
@@ -124,10 +183,10 @@ class OC:
         """
         # Concatenate stats together
         stats_text = '**STATS**\n' + '```CSS\n'
-        stats_text += 'HP: ' + str(self.attributes['HP']) + ' / ' + str(self.attributes['MaxHP']) + '\n'
-        stats_text += 'Attack: ' + str(self.attributes['ATK']) + '\n'
-        stats_text += 'Speed: ' + str(self.attributes['SPD']) + '\n'
-        stats_text += 'Luck: ' + str(self.attributes['LUCK']) + '\n'
+        stats_text += 'HP: ' + str(self.HP) + ' / ' + str(self.max_HP) + '\n'
+        stats_text += 'Attack: ' + str(self.ATK) + '\n'
+        stats_text += 'Speed: ' + str(self.SPD) + '\n'
+        stats_text += 'Luck: ' + str(self.LUCK) + '\n'
         stats_text += '```\n'
 
         # Final raw string to be returned to Discord API
@@ -6,17 +6,19 @@ class Party:
     """Class to represent a user's party of OCs in battle."""
     
     
-    def __init__(self, ocs: List['OC'], owner_nickname: str, owner_ID: str):
+    def __init__(self, ocs: List['OC'], owner_nickname: str, owner_ID: str, rng: 'BattleRNG' = None):
         """Initializes the OC party with some given data.
         
         :param ocs: A list containing three OC objects.
         :param owner_nickname: A string representing the Discord nickname of the owner of the party.
         :param owner_ID: A string representing the numerical Discord ID of the owner of the party.
+        :param rng: The random stream used for random targets. The battlefield replaces it with the battle's stream.
         """
         # OC card stats and information
         self.owner_nickname = owner_nickname   # User nickname
         self.owner_ID = str(owner_ID)          # User ID
         self.party = ocs                       # List of OCs in the party
+        self.rng = rng if rng is not None else random  # Random stream for random targets
         
         # Party must consist of exactly three OCs
         if len(ocs) != 3:
@@ -118,7 +120,7 @@ class Party:
         if not self.back2.is_defeated():
             random_targets.append(2)
         if random_targets:
-            return random.choice(random_targets)
+            return self.rng.choice(random_targets)
         else:
             return None
 
@@ -135,7 +137,7 @@ class Party:
         elif self.back2.is_defeated():
             return 1
         else:
-            return random.randint(1, 2)
+            return self.rng.randint(1, 2)
         
     
     def get_OCs(self) -> List['OC']:
@@ -0,0 +1,141 @@
+from typing import List, Set, Dict, Tuple, Optional, Sequence
+import numpy as np
+
+
+BLOCK_SIZE = 256  # How many random numbers are drawn from the generator at a time
+
+# Keys of the side streams derived from a battle seed, which are drawn without consuming the main stream.
+TURN_ORDER_STREAM = 1
+
+
+class BattleRNG:
+    """Class to represent the random number stream of one battle.
+
+    Every random choice in a battle (dice, targeting and retargeting) is drawn from here, and the turn order coin
+    flips come from a side stream derived from the same seed, so a battle can be replayed exactly from its seed. Numbers are drawn from a NumPy generator in blocks ahead
+    of time, and the number of draws is recorded so the stream can be restored mid-battle.
+    The methods used by the battle mirror the standard random module: random, randint and choice.
+    """
+
+
+    def __init__(self, seed: Optional[int] = None, draws: int = 0, block_size: int = BLOCK_SIZE):
+        """Initializes the stream.
+
+        :param seed: The seed of the battle. None picks a fresh random seed.
+        :param draws: How many numbers have already been drawn, to resume a stream part way through.
+        :param block_size: How many random numbers are drawn from the generator at a time.
+        """
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])  # Short enough to quote in a bug report
+        self.seed = seed
+        self.block_size = block_size
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+        self.draws = 0
+        self._block = None
+        self._index = block_size
+
+        # Skip ahead to resume the stream. Each number uses one step of the generator.
+        if draws:
+            full_blocks = draws // block_size
+            self.generator.bit_generator.advance(full_blocks * block_size)
+            self.draws = full_blocks * block_size
+            self._refill()
+            self._index = draws % block_size
+            self.draws = draws
+
+
+    def _refill(self):
+        """Draws the next block of random numbers."""
+        self._block = self.generator.random(self.block_size).tolist()
+        self._index = 0
+
+
+    def random(self) -> float:
+        """Draws a random float in [0, 1).
+        :return: The random number.
+        """
+        if self._index >= self.block_size:
+            self._refill()
+        value = self._block[self._index]
+        self._index += 1
+        self.draws += 1
+        return value
+
+
+    def random_many(self, count: int) -> np.ndarray:
+        """Draws many random floats in [0, 1) at once, continuing the same stream as random.
+        :param count: How many numbers to draw.
+        :return: An array of the random numbers.
+        """
+        parts = []
+        available = min(count, self.block_size - self._index)
+        if available > 0:
+            parts.append(np.asarray(self._block[self._index:self._index + available]))
+            self._index += available
+        remaining = count - available
+
+        # Whole blocks are drawn straight from the generator, which keeps the stream aligned to blocks.
+        full_blocks = remaining // self.block_size
+        if full_blocks:
+            parts.append(self.generator.random(full_blocks * self.block_size))
+            remaining -= full_blocks * self.block_size
+        if remaining:
+            self._refill()
+            parts.append(np.asarray(self._block[:remaining]))
+            self._index = remaining
+        self.draws += count
+        return np.concatenate(parts) if parts else np.empty(0)
+
+
+    def randint(self, a: int, b: int) -> int:
+        """Draws a random integer between a and b, inclusive.
+        :return: The random integer.
+        """
+        return a + int(self.random() * (b - a + 1))
+
+
+    def choice(self, seq: Sequence):
+        """Picks a random element of a non-empty sequence.
+        :return: The picked element.
+        """
+        return seq[int(self.random() * len(seq))]
+
+
+    def derive(self, stream: int, count: int) -> List[float]:
+        """Draws random floats in [0, 1) from a side stream derived from the seed. The main stream is not consumed,
+        so the values only depend on the seed and the stream key, not on what has been drawn so far.
+
+        :param stream: The key of the side stream, e.g. TURN_ORDER_STREAM.
+        :param count: How many numbers to draw.
+        :return: A list of the random numbers, the same on every call with the same arguments.
+        """
+        generator = np.random.Generator(np.random.PCG64(np.random.SeedSequence([self.seed, stream])))
+        return generator.random(count).tolist()
+
+
+    def get_state(self) -> Dict[str, int]:
+        """Getter function for what is needed to restore the stream, e.g. in a battle snapshot.
+        :return: A dictionary with the seed and the number of draws so far.
+        """
+        return {'seed': self.seed, 'draws': self.draws}
+
+
+    @classmethod
+    def from_state(cls, state: Dict[str, int]) -> 'BattleRNG':
+        """Restores a stream from get_state.
+        :param state: A dictionary with the seed and the number of draws so far.
+        :return: The restored stream, continuing where it left off.
+        """
+        return cls(state['seed'], state['draws'])
+
+
+def spawn_seeds(seed: Optional[int], n: int) -> List[int]:
+    """Derives independent seeds for parallel battles or simulations from one root seed,
+    so that a whole batch can be reproduced from the root seed.
+
+    :param seed: The root seed. None picks a fresh random seed.
+    :param n: How many seeds to derive.
+    :return: A list of seeds.
+    """
+    children = np.random.SeedSequence(seed).spawn(n)
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in children]
@@ -0,0 +1,104 @@
+from typing import List, Set, Dict, Tuple, Optional, Callable
+import random
+
+
+def get_turn_priority(oc: 'OC') -> int:
+    """Getter function for the action priority of an OC's turn, which is the priority of the ability its turn uses.
+    :param oc: The OC.
+    :return: The priority from the ability spec. Higher priorities go first.
+    """
+    return oc.get_ability(1).priority
+
+
+class TurnScheduler:
+    """Class to represent the turn order of a battle.
+
+    OCs are ordered by (action priority, SPD, LUCK, coin flip), highest first. Each OC keeps the coin it is given
+    when it is added, so ties that come down to the coin are settled the same way for the whole battle.
+    The coins are passed in rather than drawn here, so the battle can derive and snapshot them.
+    Defeated OCs are dropped from the cached order without re-sorting, and the order is only re-sorted when an
+    OC's priority, SPD or LUCK changes.
+    """
+
+
+    def __init__(self, ocs: List['OC'], coins: List[float] = None, priority: Callable[['OC'], int] = None):
+        """Initializes the scheduler.
+
+        :param ocs: Every OC on the battlefield, from any number of parties.
+        :param coins: The coin flip of each OC, in the same order. Defaults to flips from the random module.
+        :param priority: Function returning the action priority of an OC. Defaults to 0 for every OC.
+        """
+        if coins is None:
+            coins = [random.random() for _ in ocs]
+        elif len(coins) != len(ocs):
+            raise Exception('ERROR: Expected ' + str(len(ocs)) + ' turn order coins, got ' + str(len(coins)) + '!')
+        self.coins = {}     # id(OC) -> coin flip
+        self.keys = {}      # id(OC) -> current sort key
+        self.ocs = {}       # id(OC) -> OC, for every scheduled OC
+        self._order = None  # Cached order of the live OCs, None if it has to be re-sorted
+        for oc, coin in zip(ocs, coins):
+            self.add(oc, coin, priority(oc) if priority is not None else 0)
+
+
+    def _make_key(self, oc: 'OC', priority: int) -> Tuple[int, int, int, float]:
+        """Builds the sort key of an OC. Smaller keys go first.
+        :return: The sort key.
+        """
+        return (-priority, -oc.SPD, -oc.LUCK, self.coins[id(oc)])
+
+
+    def add(self, oc: 'OC', coin: float = None, priority: int = 0):
+        """Adds an OC to the schedule, or updates its position if it is already scheduled.
+        :param oc: The OC to schedule.
+        :param coin: The coin flip of the OC. Required when the OC is first added, ignored afterwards.
+        :param priority: The priority of the OC's action. Higher priorities go first.
+        """
+        if id(oc) not in self.coins:
+            if coin is None:
+                raise Exception('ERROR: A coin flip is needed to schedule a new OC!')
+            self.coins[id(oc)] = coin
+        key = self._make_key(oc, priority)
+        if self.keys.get(id(oc)) == key:
+            return
+        self.keys[id(oc)] = key
+        self.ocs[id(oc)] = oc
+        self._order = None
+
+
+    def remove(self, oc: 'OC'):
+        """Removes an OC from the schedule.
+        :param oc: The OC to remove.
+        """
+        if self.keys.pop(id(oc), None) is not None:
+            del self.ocs[id(oc)]
+            if self._order is not None:
+                self._order = [other for other in self._order if other is not oc]
+
+
+    def refresh(self, ocs: List['OC'], priority: Callable[['OC'], int] = None):
+        """Re-checks the sort keys of the given OCs and reschedules any that changed.
+        :param ocs: The OCs to check.
+        :param priority: Function returning the action priority of an OC. Defaults to 0 for every OC.
+        """
+        for oc in ocs:
+            if id(oc) in self.keys:
+                self.add(oc, priority=priority(oc) if priority is not None else 0)
+
+
+    def get_coins(self, ocs: List['OC']) -> List[float]:
+        """Getter function for the coin flips of OCs, e.g. to snapshot them.
+        :param ocs: Scheduled OCs, including defeated ones.
+        :return: The coin flip of each OC, in the same order.
+        """
+        return [self.coins[id(oc)] for oc in ocs]
+
+
+    def get_order(self) -> List['OC']:
+        """Retrieves every non-defeated OC in turn order. Defeated OCs are removed from the schedule.
+        :return: A list of the OCs ordered from first turn to last turn.
+        """
+        if self._order is None:
+            self._order = sorted(self.ocs.values(), key=lambda oc: self.keys[id(oc)])
+        for oc in [oc for oc in self._order if oc.is_defeated()]:
+            self.remove(oc)
+        return list(self._order)
@@ -0,0 +1,115 @@
+from typing import List, Set, Dict, Tuple, Optional
+import asyncio
+
+
+class BattleSession:
+    """Class to represent one player's battle in one channel. Battle commands from the player
+    are delivered to the battle through the session queue.
+    """
+
+
+    def __init__(self, channel_ID: int, player_ID: int, timeout: float, max_queued: int):
+        """Initializes the session.
+
+        :param channel_ID: The Discord ID of the channel the battle is in.
+        :param player_ID: The Discord ID of the player.
+        :param timeout: How many seconds to wait for a command before the battle is abandoned.
+        :param max_queued: How many commands can wait in the queue. Extra commands are dropped.
+        """
+        self.channel_ID = channel_ID
+        self.player_ID = player_ID
+        self.timeout = timeout
+        self.queue = asyncio.Queue(maxsize=max_queued)
+
+
+    def get_key(self) -> Tuple[int, int]:
+        """Getter function for the registry key of the session.
+        :return: A (channel ID, player ID) tuple.
+        """
+        return (self.channel_ID, self.player_ID)
+
+
+    def put(self, message: 'discord.Message') -> bool:
+        """Queues a command for the battle.
+        :param message: The message holding the command.
+        :return: True if the command was queued, False if the queue is full.
+        """
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+
+    async def next_command(self) -> 'discord.Message':
+        """Waits for the next command from the player.
+        :return: The message holding the command.
+        :raises asyncio.TimeoutError: If the player does not send a command within the timeout.
+        """
+        return await asyncio.wait_for(self.queue.get(), self.timeout)
+
+
+class SessionManager:
+    """Class to represent the registry of active battle sessions, keyed by (channel, player).
+    Each player can only have one battle at a time.
+    """
+
+
+    def __init__(self, timeout: float = 300.0, max_queued: int = 16):
+        """Initializes the registry.
+
+        :param timeout: How many seconds a battle waits for a command before it is abandoned.
+        :param max_queued: How many commands can wait in each session queue.
+        """
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self.sessions = {}         # (channel ID, player ID) -> BattleSession
+        self.player_sessions = {}  # player ID -> BattleSession
+
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+
+    def start(self, channel_ID: int, player_ID: int) -> Optional[BattleSession]:
+        """Starts a new session for a player.
+
+        :param channel_ID: The Discord ID of the channel the battle is in.
+        :param player_ID: The Discord ID of the player.
+        :return: The new session, or None if the player already has a battle in progress.
+        """
+        if player_ID in self.player_sessions:
+            return None
+        session = BattleSession(channel_ID, player_ID, self.timeout, self.max_queued)
+        self.sessions[session.get_key()] = session
+        self.player_sessions[player_ID] = session
+        return session
+
+
+    def end(self, session: BattleSession):
+        """Removes a session from the registry.
+        :param session: The session to remove.
+        """
+        if self.sessions.get(session.get_key()) is session:
+            del self.sessions[session.get_key()]
+        if self.player_sessions.get(session.player_ID) is session:
+            del self.player_sessions[session.player_ID]
+
+
+    def get(self, channel_ID: int, player_ID: int) -> Optional[BattleSession]:
+        """Retrieves the session for a player in a channel.
+        :return: The session, or None if there is no battle there.
+        """
+        return self.sessions.get((channel_ID, player_ID))
+
+
+    def route(self, message: 'discord.Message') -> bool:
+        """Delivers a battle command to the battle of its author in its channel.
+        :param message: The message holding the command.
+        :return: True if the message belonged to an active battle, False otherwise.
+        """
+        session = self.sessions.get((message.channel.id, message.author.id))
+        if session is None:
+            return False
+        session.put(message)
+        return True
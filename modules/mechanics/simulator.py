@@ -0,0 +1,299 @@
+"""
+Headless battle engine that runs many battles at once as NumPy arrays, for balancing and analysis.
+
+It reproduces the rules of Battlefield, Party, Action and Offense.attack for cards whose turn ability is a plain
+attack, which check_abilities verifies:
+    - Turn order is every non-defeated OC sorted by SPD, then LUCK (highest first), then a coin flip made once
+      per OC per battle, like the TurnScheduler used by Battlefield.calculate_turns.
+    - Targets are picked at the start of the turn as positions (0: frontline, 1: back1, 2: back2) and resolved
+      against the enemy party when the attack happens.
+    - If the target is already defeated, a random non-defeated enemy is picked instead. Like Offense.attack,
+      the attack is dropped if that pick is the frontline (index 0) or if no enemy is left.
+    - Party A is checked for defeat before party B at the end of each turn.
+    - At the end of each turn a defeated frontline swaps with back1, or with back2 if back1 is also defeated.
+
+Every battle can draw from its own random stream (see BattleStreams), so its result does not depend on which other
+battles are in the same batch.
+
+State is stored in position order with shape (battles, 2 parties, 3 positions), and frontline promotion
+physically swaps the columns, so positions always match Party.get_OCs().
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import numpy as np
+
+
+# Targeting policies, matching the targeting choices available in a battle.
+POLICY_RANDOM = 'random'  # Party.get_random: any non-defeated enemy (what the AI does)
+POLICY_FRONT = 'front'    # Always attack the frontline (!oc N front)
+POLICY_BACK = 'back'      # Party.get_random_backline (!oc N back)
+POLICIES = (POLICY_RANDOM, POLICY_FRONT, POLICY_BACK)
+
+# Winner values.
+WINNER_A = 0
+WINNER_B = 1
+NO_WINNER = -1
+
+
+class SimulationResult:
+    """Class to represent the outcome of a batch of simulated battles."""
+
+
+    def __init__(self, winners: np.ndarray, turns: np.ndarray, HP: np.ndarray, IDs: np.ndarray):
+        """Initializes the result.
+
+        :param winners: Array of shape (N,) with WINNER_A, WINNER_B, or NO_WINNER if the turn limit was hit.
+        :param turns: Array of shape (N,) with how many turns each battle took.
+        :param HP: Array of shape (N, 2, 3) with the final HP of each party, in final position order.
+        :param IDs: Array of shape (N, 2, 3) with the OC IDs of each party, in final position order.
+        """
+        self.winners = winners
+        self.turns = turns
+        self.HP = HP
+        self.IDs = IDs
+
+
+    def win_rate(self, party: int = WINNER_A) -> float:
+        """Calculates the fraction of battles won by a party.
+        :param party: WINNER_A or WINNER_B.
+        :return: The win rate between 0 and 1.
+        """
+        if len(self.winners) == 0:
+            return 0.0
+        return float(np.mean(self.winners == party))
+
+
+# Constants of the SplitMix64 mixing function used by BattleStreams.
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """Scrambles 64-bit integers with the SplitMix64 finalizer.
+    :param x: Array of uint64.
+    :return: Array of uint64 of the same shape.
+    """
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * _MIX_1
+        x = (x ^ (x >> np.uint64(27))) * _MIX_2
+        return x ^ (x >> np.uint64(31))
+
+
+class BattleStreams:
+    """Class to represent one counter-based random stream per battle, so each battle's draws only depend on its own
+    seed and how many draws it has made. It can be used in place of a NumPy Generator for random and integers.
+
+    simulate makes every draw for every battle that is still running and narrows the streams with select once per
+    turn, so the selected battles have always made the same number of draws and share one counter.
+    """
+
+
+    def __init__(self, seeds: np.ndarray):
+        """Initializes the streams.
+        :param seeds: Array of shape (N,) with the 64-bit seed of each battle.
+        """
+        self.keys = _mix(np.asarray(seeds, dtype=np.uint64))
+        self.draws = 0  # Draws made so far by every selected battle
+        self.select(np.arange(len(self.keys)))
+
+
+    def select(self, rows: np.ndarray):
+        """Narrows the next draws to some battles, e.g. the ones still running.
+        :param rows: The indices of the battles, a subset of the previously selected ones.
+        """
+        self.rows = rows
+        self._row_keys = self.keys[rows, None]
+
+
+    def random(self, size) -> np.ndarray:
+        """Draws floats in [0, 1) for every selected battle.
+        :param size: The shape of the draw. The first dimension must be the number of selected battles.
+        :return: Array of floats of that shape.
+        """
+        shape = (size,) if isinstance(size, int) else tuple(size)
+        if shape[0] != len(self.rows):
+            raise Exception('ERROR: Expected a draw for ' + str(len(self.rows)) + ' battles, got ' + str(shape[0]) + '!')
+        per_row = int(np.prod(shape[1:], dtype=np.int64))
+        steps = np.arange(self.draws, self.draws + per_row, dtype=np.uint64)
+        self.draws += per_row
+        with np.errstate(over='ignore'):
+            bits = _mix(self._row_keys + steps * _GOLDEN_GAMMA)
+        return ((bits >> np.uint64(11)) * (1.0 / 2 ** 53)).reshape(shape)
+
+
+    def integers(self, low: int, high: int, size) -> np.ndarray:
+        """Draws integers in [low, high) for every battle in rows.
+        :return: Array of int64 of the given shape.
+        """
+        return low + (self.random(size) * (high - low)).astype(np.int64)
+
+
+def check_abilities(table: 'data_processing.OCTable', IDs: List[int]):
+    """Checks that the simulator can play the given cards. It only models the plain attack every card currently
+    uses on its turn, with no turn priority.
+
+    :param table: The OC table built from the loaded in JSON file.
+    :param IDs: The OC IDs to check.
+    """
+    for ID in IDs:
+        ability = table.abilities[ID][0]
+        if ability.effect != 'attack' or ability.params or ability.priority != 0:
+            raise Exception('ERROR: The simulator only supports plain attacks, but ' + table.name[ID] + ' uses '
+                            + ability.name + '!')
+
+
+def get_stat_columns(table: 'data_processing.OCTable') -> Dict[str, np.ndarray]:
+    """Builds arrays of the base stats indexed by OC ID.
+
+    :param table: The OC table built from the loaded in JSON file.
+    :return: A dictionary of 'HP', 'ATK', 'SPD' and 'LUCK' arrays.
+    """
+    return table.as_arrays()
+
+
+def _random_alive(alive: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Picks a random non-defeated position per battle, like Party.get_random.
+
+    :param alive: Boolean array of shape (M, 3).
+    :param rng: The random generator to draw from.
+    :return: Array of shape (M,) with the picked position, or -1 if every position is defeated.
+    """
+    counts = alive.sum(axis=1)
+    picks = (rng.random(len(alive)) * counts).astype(np.int64)
+    ranks = np.cumsum(alive, axis=1) - 1
+    chosen = np.argmax((ranks == picks[:, None]) & alive, axis=1)
+    return np.where(counts > 0, chosen, -1)
+
+
+def _random_backline(alive: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Picks a random backline position per battle, like Party.get_random_backline.
+
+    :param alive: Boolean array of shape (M, 3).
+    :param rng: The random generator to draw from.
+    :return: Array of shape (M,) with the picked position. Returns the frontline if the whole backline is defeated.
+    """
+    coin = rng.integers(1, 3, size=len(alive))
+    return np.select([~alive[:, 1] & ~alive[:, 2], ~alive[:, 1], ~alive[:, 2]], [0, 2, 1], default=coin)
+
+
+def _pick_targets(policy: str, enemy_alive: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Picks target positions for every OC of one party.
+
+    :param policy: One of POLICIES.
+    :param enemy_alive: Boolean array of shape (M, 3) for the enemy party.
+    :param rng: The random generator to draw from.
+    :return: Array of shape (M, 3) with a target position for each OC.
+    """
+    if policy == POLICY_FRONT:
+        return np.zeros(enemy_alive.shape, dtype=np.int64)
+    elif policy == POLICY_BACK:
+        return np.stack([_random_backline(enemy_alive, rng) for _ in range(3)], axis=1)
+    elif policy == POLICY_RANDOM:
+        return np.stack([_random_alive(enemy_alive, rng) for _ in range(3)], axis=1)
+    else:  # Invalid input
+        raise Exception('ERROR: Invalid targeting policy ' + str(policy) + '!')
+
+
+def simulate(stats: Dict[str, np.ndarray], party_A: np.ndarray, party_B: np.ndarray, n: Optional[int] = None,
+             policy_A: str = POLICY_RANDOM, policy_B: str = POLICY_RANDOM, max_turns: int = 100,
+             seed: Optional[int] = None, rng: Optional[np.random.Generator] = None) -> SimulationResult:
+    """Runs a batch of battles at once.
+
+    :param stats: The base stat columns from get_stat_columns.
+    :param party_A: The OC IDs of party A, either shape (3,) shared by every battle or shape (N, 3).
+    :param party_B: The OC IDs of party B, either shape (3,) shared by every battle or shape (N, 3).
+    :param n: The number of battles to run. Only needed if both parties have shape (3,).
+    :param policy_A: The targeting policy for party A.
+    :param policy_B: The targeting policy for party B.
+    :param max_turns: Battles still running after this many turns end with NO_WINNER.
+    :param seed: Seed for the random generator. Ignored if rng is given.
+    :param rng: The random generator to draw from, or BattleStreams with one stream per battle.
+    :return: The results of every battle.
+    """
+    if rng is None:
+        rng = np.random.default_rng(seed)
+    streams = rng if isinstance(rng, BattleStreams) else None
+    party_A = np.asarray(party_A, dtype=np.int64)
+    party_B = np.asarray(party_B, dtype=np.int64)
+    if n is None:
+        n = max(len(party_A) if party_A.ndim == 2 else 1, len(party_B) if party_B.ndim == 2 else 1)
+    IDs = np.stack([np.broadcast_to(party_A, (n, 3)), np.broadcast_to(party_B, (n, 3))], axis=1).copy()
+
+    # Per-battle state in position order (battles, party, position)
+    HP = stats['HP'][IDs].copy()
+    ATK = stats['ATK'][IDs].copy()
+    SPD = stats['SPD'][IDs].copy()
+    LUCK = stats['LUCK'][IDs].copy()
+    if streams is not None and (len(streams.keys) != n or streams.draws != 0):
+        raise Exception('ERROR: Expected ' + str(n) + ' unused battle streams!')
+    coins = rng.random((n, 2, 3))  # Turn order coin flips, fixed for the battle
+    winners = np.full(n, NO_WINNER, dtype=np.int8)
+    turns = np.zeros(n, dtype=np.int32)
+    rows = np.arange(n)
+    policies = (policy_A, policy_B)
+
+    for _ in range(max_turns):
+        running = np.flatnonzero(winners == NO_WINNER)
+        if len(running) == 0:
+            break
+        turns[running] += 1
+        if streams is not None:
+            streams.select(running)
+        run_HP = HP[running]
+        alive = run_HP > 0
+
+        # Pick targets at the start of the turn, as positions in the enemy party.
+        targets = np.stack([_pick_targets(policies[0], alive[:, 1], rng),
+                            _pick_targets(policies[1], alive[:, 0], rng)], axis=1)
+
+        # Turn order: highest SPD first, then highest LUCK, then the coin flip. OCs defeated before the turn don't act.
+        order = np.lexsort((coins[running].reshape(-1, 6), -LUCK[running].reshape(-1, 6), -SPD[running].reshape(-1, 6)))
+        acts = alive.reshape(-1, 6)
+        m = len(running)
+        local_rows = np.arange(m)
+
+        for step in range(6):
+            slot = order[:, step]
+            side = slot // 3
+            pos = slot % 3
+            enemy = 1 - side
+
+            # The OC must have been alive when the turn started and must still be alive now.
+            can_act = acts[local_rows, slot] & (run_HP[local_rows, side, pos] > 0)
+            target = targets[local_rows, side, pos]
+            enemy_alive = run_HP[local_rows, enemy] > 0
+
+            # Retarget if the target is already defeated. A retarget to the frontline or to nothing is dropped.
+            target_down = ~enemy_alive[local_rows, np.maximum(target, 0)] | (target < 0)
+            retarget = _random_alive(enemy_alive, rng)
+            target = np.where(target_down, retarget, target)
+            hits = can_act & ~(target_down & (retarget <= 0))
+
+            hit_rows = local_rows[hits]
+            hit_enemy = enemy[hits]
+            hit_target = target[hits]
+            damage = ATK[running[hit_rows], side[hits], pos[hits]]
+            run_HP[hit_rows, hit_enemy, hit_target] = np.maximum(0, run_HP[hit_rows, hit_enemy, hit_target] - damage)
+        HP[running] = run_HP
+
+        # Check for a winner, party A first like the battle loop.
+        A_defeated = ~(run_HP[:, 0] > 0).any(axis=1)
+        B_defeated = ~(run_HP[:, 1] > 0).any(axis=1)
+        winners[running[A_defeated]] = WINNER_B
+        winners[running[~A_defeated & B_defeated]] = WINNER_A
+
+        # Party.update: swap a defeated frontline with back1, or with back2 if back1 is also defeated.
+        for party in range(2):
+            front_down = run_HP[:, party, 0] <= 0
+            back1_up = run_HP[:, party, 1] > 0
+            back2_up = run_HP[:, party, 2] > 0
+            for swap_pos, swap in ((1, front_down & back1_up), (2, front_down & ~back1_up & back2_up)):
+                swap_rows = running[swap]
+                if len(swap_rows) == 0:
+                    continue
+                for column in (HP, ATK, SPD, LUCK, coins, IDs):
+                    front = column[swap_rows, party, 0].copy()
+                    column[swap_rows, party, 0] = column[swap_rows, party, swap_pos]
+                    column[swap_rows, party, swap_pos] = front
+
+    return SimulationResult(winners, turns, HP, IDs)
@@ -0,0 +1,146 @@
+"""
+Compact snapshots of in-progress battles, so battles can be resumed after the bot restarts.
+
+A snapshot is a small JSON document:
+    {
+        "v": 1,                   # Snapshot format version
+        "channel": 123,           # Discord channel ID
+        "player": 456,            # Discord ID of the player
+        "parties": [              # Party A then party B
+            [owner nickname, owner ID, [[OC ID, HP, active, target], ...]]  # OCs in position order
+        ],
+        "actions": [[party, position, target index, turns left, ability ID], ...],  # The battlefield action queue
+        "rng": {"seed": 789, "draws": 42},  # The battle's random stream
+        "coins": [0.5, ...],      # Turn order coin flips of party A then party B, in the same order as "parties"
+        "log": {"turn": 3, "action": 17, "events": [[...], ...]}  # The battle log, see BattleLog.get_state
+    }
+
+With the random stream, the coins and the log, a resumed battle continues exactly as it would have without the
+restart, including its turn numbers.
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import json
+import os
+import tempfile
+import logging
+
+from modules.mechanics.oc import OC
+from modules.mechanics.party import Party
+from modules.mechanics.battlefield import Battlefield
+from modules.mechanics.action import Action
+from modules.mechanics.rng import BattleRNG
+from modules.mechanics.events import BattleLog
+
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_battle(field: Battlefield, channel_ID: int, player_ID: int) -> Dict:
+    """Captures the state of a battle.
+
+    :param field: The battlefield of the battle.
+    :param channel_ID: The Discord ID of the channel the battle is in.
+    :param player_ID: The Discord ID of the player.
+    :return: The snapshot, ready to be written as JSON.
+    """
+    parties = []
+    positions = {}  # id(OC) -> (party, position), to reference the users of queued actions
+    for party_index in range(2):
+        party = field.get_party(party_index)
+        ocs = []
+        for position, oc in enumerate(party.get_OCs()):
+            ocs.append([oc.ID, oc.HP, oc.active, oc.target])
+            positions[id(oc)] = (party_index, position)
+        parties.append([party.get_owner_nickname(), party.get_owner_ID(), ocs])
+
+    actions = []
+    for action in field.action_queue:
+        party_index, position = positions[id(action.user)]
+        actions.append([party_index, position, action.target_index, action.num_turns, action.ability_ID])
+    return {'v': SNAPSHOT_VERSION, 'channel': channel_ID, 'player': player_ID, 'parties': parties, 'actions': actions,
+            'rng': field.rng.get_state(), 'coins': field.get_coins(), 'log': field.log.get_state()}
+
+
+def restore_battle(state: Dict, table: 'data_processing.OCTable') -> Battlefield:
+    """Rebuilds a battle from a snapshot.
+
+    :param state: The snapshot from snapshot_battle.
+    :param table: The OC table to build the OCs from.
+    :return: The battlefield, with both parties, the action queue, the random stream, the turn order and the log restored.
+    """
+    if state.get('v') != SNAPSHOT_VERSION:
+        raise ValueError('ERROR: Unsupported battle snapshot version ' + str(state.get('v')) + '!')
+    parties = []
+    for owner_nickname, owner_ID, oc_states in state['parties']:
+        ocs = []
+        for oc_ID, HP, active, target in oc_states:
+            oc = OC(table, oc_ID)
+            oc.HP = HP
+            oc.active = active
+            oc.target = target
+            ocs.append(oc)
+        parties.append(Party(ocs, owner_nickname, owner_ID))
+    field = Battlefield(table, parties[0], parties[1], BattleRNG.from_state(state['rng']), state['coins'])
+    field.log = BattleLog.from_state(state['log'])
+
+    for party_index, position, target_index, num_turns, ability_ID in state['actions']:
+        action = Action(field, parties[party_index].get_OCs()[position], target_index, ability_ID)
+        action.num_turns = num_turns
+        field.add(action)
+    return field
+
+
+def get_snapshot_path(directory: str, channel_ID: int, player_ID: int) -> str:
+    """Builds the path of the snapshot file for a battle.
+    :return: The snapshot file path.
+    """
+    return os.path.join(directory, str(channel_ID) + '_' + str(player_ID) + '.json')
+
+
+def save_snapshot(state: Dict, directory: str):
+    """Writes a snapshot to disk. The snapshot is written to a temp file and renamed into place,
+    so a crash mid-write leaves the previous snapshot intact.
+
+    :param state: The snapshot from snapshot_battle.
+    :param directory: The directory that snapshots are stored in.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(temp_path, get_snapshot_path(directory, state['channel'], state['player']))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def delete_snapshot(directory: str, channel_ID: int, player_ID: int):
+    """Removes the snapshot of a battle that has finished.
+    :param directory: The directory that snapshots are stored in.
+    """
+    try:
+        os.remove(get_snapshot_path(directory, channel_ID, player_ID))
+    except FileNotFoundError:
+        pass
+
+
+def load_snapshots(directory: str) -> List[Dict]:
+    """Reads every saved snapshot. Snapshots that cannot be read are skipped.
+    :param directory: The directory that snapshots are stored in.
+    :return: A list of snapshots.
+    """
+    if not os.path.isdir(directory):
+        return []
+    states = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, file_name)) as f:
+                states.append(json.load(f))
+        except (OSError, ValueError) as e:
+            log.warning('Unable to read battle snapshot', extra={'file': file_name, 'error': str(e)})
+    return states
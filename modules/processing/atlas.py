@@ -0,0 +1,184 @@
+"""
+Builds and loads the card art atlas: every card's art normalized to a single resolution and channel layout
+and packed into one raw array file. The renderer memory-maps the atlas so card art is available without
+decoding a PNG, and every worker process shares the same pages of the file.
+
+Build the atlas from the base directory after adding or changing card art with:
+    python -m modules.processing.atlas
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import json
+import os
+import tempfile
+import numpy as np
+import cv2
+
+
+CARD_SIZE = (597, 869)  # (width, height) that every card is normalized to
+ATLAS_PATH = 'cache/card_atlas.npy'
+ATLAS_INDEX_PATH = 'cache/card_atlas.json'
+
+
+def normalize_card(card_img: np.ndarray, size: Tuple[int, int] = CARD_SIZE) -> np.ndarray:
+    """Converts a decoded card image to the atlas resolution and BGRA channel layout.
+
+    :param card_img: The decoded card image (grayscale, BGR or BGRA).
+    :param size: The (width, height) to resize the art to.
+    :return: The normalized card image.
+    """
+    if card_img.ndim == 2:
+        card_img = cv2.cvtColor(card_img, cv2.COLOR_GRAY2BGRA)
+    elif card_img.shape[2] == 3:
+        card_img = cv2.cvtColor(card_img, cv2.COLOR_BGR2BGRA)
+    if (card_img.shape[1], card_img.shape[0]) != size:
+        card_img = cv2.resize(card_img, size, interpolation=cv2.INTER_AREA)
+    return card_img
+
+
+def build_atlas(data_path: str = 'data/oc_data.json', atlas_path: str = ATLAS_PATH,
+                index_path: str = ATLAS_INDEX_PATH, size: Tuple[int, int] = CARD_SIZE) -> int:
+    """Reads the art of every OC in the data file, normalizes it and writes the packed atlas and its index.
+    Both files are written to temp files and renamed into place, the index last, so a running bot that has the old
+    atlas mapped keeps reading the old file and picks up the new one once the new index is in place.
+
+    :param data_path: Where to load in the OC JSON file.
+    :param atlas_path: Where to write the raw atlas array.
+    :param index_path: Where to write the atlas index (art path to atlas row).
+    :param size: The (width, height) that every card is normalized to.
+    :return: The number of cards written to the atlas.
+    """
+    with open(data_path) as json_file:
+        oc_data = json.load(json_file)['ocs']
+
+    # Collect every distinct art path once, in card ID order.
+    art_paths = []
+    for oc in sorted(oc_data, key=lambda x: x['cardID']):
+        if oc['artPath'] not in art_paths:
+            art_paths.append(oc['artPath'])
+
+    # Write the cards straight into a memory-mapped .npy file so the whole atlas never has to sit in memory.
+    # The file being mapped by readers is never truncated or rewritten in place, only replaced.
+    atlas_temp = _make_temp_path(atlas_path, '.npy')
+    index_temp = _make_temp_path(index_path, '.json')
+    try:
+        atlas = np.lib.format.open_memmap(atlas_temp, mode='w+', dtype=np.uint8, shape=(len(art_paths), size[1], size[0], 4))
+        index = {'width': size[0], 'height': size[1], 'cards': {}}
+        for row, art_path in enumerate(art_paths):
+            card_img = cv2.imread(art_path, cv2.IMREAD_UNCHANGED)
+            if card_img is None:
+                raise FileNotFoundError('ERROR: Unable to load card art from ' + str(art_path) + '!')
+            atlas[row] = normalize_card(card_img, size)
+            index['cards'][art_path] = {'row': row, 'mtime': os.path.getmtime(art_path)}
+        atlas.flush()
+        del atlas
+        with open(index_temp, 'w') as f:
+            json.dump(index, f, indent=4)
+
+        os.replace(atlas_temp, atlas_path)
+        os.replace(index_temp, index_path)
+    finally:
+        for temp_path in (atlas_temp, index_temp):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return len(art_paths)
+
+
+def _make_temp_path(file_path: str, suffix: str) -> str:
+    """Creates an empty temp file next to a file, so it can be renamed over the file.
+    :return: The temp file path.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.atlas-', suffix=suffix)
+    os.close(fd)
+    return temp_path
+
+
+class Atlas:
+    """Class to represent a memory-mapped card art atlas. The atlas is re-opened when it is rebuilt.
+    The index and the array are published together as one tuple, so a render thread reading a card while another
+    thread re-opens the atlas always sees a matching index and array.
+    """
+
+
+    def __init__(self, atlas_path: str = ATLAS_PATH, index_path: str = ATLAS_INDEX_PATH):
+        """Memory-maps the atlas. Nothing is read from the array until a card is requested.
+
+        :param atlas_path: Where the raw atlas array is stored.
+        :param index_path: Where the atlas index is stored.
+        """
+        self.atlas_path = atlas_path
+        self.index_path = index_path
+        self._open()
+
+
+    def _open(self):
+        """Reads the index and memory-maps the atlas array. The index is replaced last when the atlas is rebuilt,
+        so once the new index is seen the new array is already in place."""
+        index_mtime = os.path.getmtime(self.index_path)
+        with open(self.index_path) as f:
+            index = json.load(f)
+        array = np.load(self.atlas_path, mmap_mode='r')
+        self._state = ((index['width'], index['height']), index['cards'], array, index_mtime)
+
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """The (width, height) of every card in the atlas."""
+        return self._state[0]
+
+
+    @property
+    def index_mtime(self) -> float:
+        """The modification time of the index when the atlas was opened."""
+        return self._state[3]
+
+
+    def refresh(self) -> bool:
+        """Re-opens the atlas if it has been rebuilt since it was opened. The old mapping stays valid until then.
+        :return: True if the atlas was re-opened.
+        """
+        try:
+            if os.path.getmtime(self.index_path) != self.index_mtime:
+                self._open()
+                return True
+        except OSError:  # The atlas was removed, so keep serving the mapped copy.
+            pass
+        return False
+
+
+    def get(self, art_path: str) -> Optional[np.ndarray]:
+        """Retrieves the normalized art for a card. Art that has changed on disk since the atlas was built is skipped.
+
+        :param art_path: The path to the card art.
+        :return: A read-only view of the card inside the atlas, or None if the card is not in the atlas or is stale.
+        """
+        self.refresh()
+        _, cards, array, _ = self._state
+        card = cards.get(art_path)
+        if card is None:
+            return None
+        try:
+            if os.path.getmtime(art_path) != card['mtime']:
+                return None
+        except OSError:  # The source art is gone but the atlas copy is still usable.
+            pass
+        return array[card['row']]
+
+
+def load_atlas(atlas_path: str = ATLAS_PATH, index_path: str = ATLAS_INDEX_PATH) -> Optional[Atlas]:
+    """Memory-maps the atlas if it has been built.
+
+    :param atlas_path: Where the raw atlas array is stored.
+    :param index_path: Where the atlas index is stored.
+    :return: The atlas, or None if it has not been built.
+    """
+    if not (os.path.exists(atlas_path) and os.path.exists(index_path)):
+        return None
+    return Atlas(atlas_path, index_path)
+
+
+# Build the atlas when run as a script.
+if __name__ == "__main__":
+    num_cards = build_atlas()
+    print('Wrote ' + str(num_cards) + ' cards to ' + ATLAS_PATH + '.')
@@ -1,12 +1,26 @@
 from typing import List, Set, Dict, Tuple, Optional
+import asyncio
 import json
+import os
+import time
+import bisect
+import difflib
+import re
+import logging
+import numpy as np
 
+from modules.abilities import registry
 
-def load_json(file_path: str = 'data/oc_data.json') -> Dict:
+
+log = logging.getLogger(__name__)
+
+
+def load_json(file_path: str = 'data/oc_data.json', load_lore: bool = True) -> Dict:
     """This loads in the OC data from a json file and returns it as a dictionary.
     You can navigate the dictionary using oc_data[ID]
     
     :param file_path: Where to load in the OC JSON file.
+    :param load_lore: Whether to read every lore file now. The catalogue skips this and reads lore on first use.
     :return: A dictionary with all of the OC data in a usable format.
     """
     # Load in data from the .json file
@@ -15,10 +29,352 @@ def load_json(file_path: str = 'data/oc_data.json') -> Dict:
     oc_data = oc_data['ocs']  # Pull down one level
     
     # Populate the lore strings
-    for i in range(len(oc_data)):
+    if load_lore:
+        for i in range(len(oc_data)):
+            oc_data[i]['lore'] += read_lore(oc_data[i]['lorePath'])
+    return oc_data
+
+
+def read_lore(lore_path: str) -> str:
+    """Reads an OC lore file.
+    :param lore_path: The path to the lore file.
+    :return: The lore text, or an empty string if the file cannot be read.
+    """
+    try:
+        with open(lore_path) as f:
+            return f.read()
+    except OSError as e:  # Skip populating if invalid path.
+        log.warning('Unable to read lore file', extra={'path': str(lore_path), 'error': str(e)})
+        return ''
+
+
+class OCTable:
+    """Class to represent the base OC data as a table of columns indexed by card ID.
+    Battle OCs read their base stats and information from here instead of keeping their own copy.
+    """
+
+
+    def __init__(self, data: List[Dict]):
+        """Builds the columns from the OC data.
+
+        :param data: The OC data from load_json.
+        """
+        size = max([oc['cardID'] for oc in data], default=-1) + 1
+        self.valid = [False] * size  # Whether a card exists for the ID
+
+        # Quantitative stats
+        self.HP = [0] * size
+        self.ATK = [0] * size
+        self.SPD = [0] * size
+        self.LUCK = [0] * size
+
+        # Qualitative information
+        self.name = [''] * size
+        self.stars = [0] * size
+        self.art_path = [''] * size
+        self.lore_path = [''] * size
+        self.base_lore = [''] * size  # Lore text stored in the JSON file, the lore file is appended to it
+        self._lore_cache = {}          # cardID -> (lore file mtime, full lore text)
+        self.ability1 = [0] * size
+        self.ability2 = [0] * size
+        self.abilities = [None] * size  # (ability 1, ability 2) compiled from the ability registry
+
+        for oc in data:
+            i = oc['cardID']
+            self.valid[i] = True
+            self.HP[i] = oc['baseHP']
+            self.ATK[i] = oc['baseAttack']
+            self.SPD[i] = oc['baseSpeed']
+            self.LUCK[i] = oc['baseLuck']
+            self.name[i] = oc['name']
+            self.stars[i] = oc['baseStars']
+            self.art_path[i] = oc['artPath']
+            self.lore_path[i] = oc['lorePath']
+            self.base_lore[i] = oc['lore']
+            self.ability1[i] = oc['ability1']
+            self.ability2[i] = oc['ability2']
+            self.abilities[i] = (registry.resolve(oc['ability1']), registry.resolve(oc['ability2']))
+
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+
+    def get_lore(self, id: int) -> str:
+        """Retrieves the lore for an OC. The lore file is read on first use and read again only if it has changed.
+        :param id: The ID for the OC.
+        :return: The full lore text.
+        """
+        lore_path = self.lore_path[id]
+        try:
+            mtime = os.path.getmtime(lore_path)
+        except OSError:
+            mtime = None
+        cached = self._lore_cache.get(id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        lore = self.base_lore[id] + (read_lore(lore_path) if mtime is not None else '')
+        self._lore_cache[id] = (mtime, lore)
+        return lore
+
+
+    def __contains__(self, id: int) -> bool:
+        return isinstance(id, int) and 0 <= id < len(self.valid) and self.valid[id]
+
+
+    def check(self, id: int):
+        """Checks that an OC exists for the given ID.
+        :param id: The ID for the OC.
+        """
+        if id not in self:
+            raise IndexError('ERROR: No OC found for ID ' + str(id) + '!')
+
+
+    def as_arrays(self) -> Dict[str, np.ndarray]:
+        """Returns the quantitative stat columns as NumPy arrays, for vectorized code such as the simulator.
+        :return: A dictionary of 'HP', 'ATK', 'SPD' and 'LUCK' arrays indexed by card ID.
+        """
+        return {
+            'HP':   np.array(self.HP, dtype=np.int32),
+            'ATK':  np.array(self.ATK, dtype=np.int32),
+            'SPD':  np.array(self.SPD, dtype=np.int32),
+            'LUCK': np.array(self.LUCK, dtype=np.int32)
+        }
+
+
+def normalize_name(name: str) -> str:
+    """Normalizes an OC name for searching: lowercase with punctuation removed and single spaces.
+    :param name: The name to normalize.
+    :return: The normalized name.
+    """
+    return ' '.join(re.sub(r"[^a-z0-9 ]+", ' ', name.lower()).split())
+
+
+class OCCatalogue:
+    """Class to represent the indexed catalogue of every OC card.
+    Cards are indexed by card ID, by name (prefix and fuzzy search), by base stars and by ability ID.
+    """
+
+
+    def __init__(self, data: List[Dict]):
+        """Builds the indexes from the OC data.
+
+        :param data: The OC data from load_json.
+        """
+        self.data = data
+        self.table = OCTable(data)
+        self.by_ID = {}       # cardID -> OC data
+        self.by_stars = {}    # baseStars -> sorted list of cardIDs
+        self.by_ability = {}  # ability ID -> sorted list of cardIDs with that ability
+        self._exact_names = {}  # normalized full name -> cardID
+        self._name_keys = []    # sorted (normalized name or name word, cardID) pairs for prefix search
+
+        for oc in sorted(data, key=lambda x: x['cardID']):
+            oc_ID = oc['cardID']
+            self.by_ID[oc_ID] = oc
+            self.by_stars.setdefault(oc['baseStars'], []).append(oc_ID)
+            for ability_ID in {oc['ability1'], oc['ability2']}:
+                self.by_ability.setdefault(ability_ID, []).append(oc_ID)
+
+            # Index the full name as well as each word, so that "tia" and "butcher" both find "Tia, Butcher of Souls".
+            name = normalize_name(oc['name'])
+            self._exact_names.setdefault(name, oc_ID)
+            self._name_keys.append((name, oc_ID))
+            words = name.split()
+            for i in range(1, len(words)):
+                self._name_keys.append((' '.join(words[i:]), oc_ID))
+        self._name_keys.sort()
+        self._fuzzy_names = sorted(set(key for key, _ in self._name_keys))
+
+
+    def __len__(self) -> int:
+        return len(self.by_ID)
+
+
+    def __contains__(self, oc_ID: int) -> bool:
+        return oc_ID in self.by_ID
+
+
+    def get(self, oc_ID: int) -> Optional[Dict]:
+        """Retrieves the data for an OC by card ID.
+        :param oc_ID: The card ID.
+        :return: The OC data, or None if no card has that ID.
+        """
+        return self.by_ID.get(oc_ID)
+
+
+    def get_IDs(self) -> List[int]:
+        """Getter function for every card ID in the catalogue.
+        :return: A sorted list of card IDs.
+        """
+        return list(self.by_ID)
+
+
+    def get_by_stars(self, stars: int) -> List[int]:
+        """Retrieves every card of a given rarity.
+        :param stars: The number of base stars.
+        :return: A sorted list of card IDs.
+        """
+        return self.by_stars.get(stars, [])
+
+
+    def get_by_ability(self, ability_ID: int) -> List[int]:
+        """Retrieves every card that has a given ability as either of its abilities.
+        :param ability_ID: The ability ID.
+        :return: A sorted list of card IDs.
+        """
+        return self.by_ability.get(ability_ID, [])
+
+
+    def search(self, query: str, limit: int = 5) -> List[int]:
+        """Searches for OCs by name. An exact name match comes first, followed by names (or words of names)
+        that start with the query. If nothing matches, close spellings are returned instead.
+
+        :param query: The name or partial name to search for.
+        :param limit: The maximum number of results.
+        :return: A list of card IDs, best match first.
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+        results = []
+        if query in self._exact_names:
+            results.append(self._exact_names[query])
+
+        # Prefix search over the sorted name keys.
+        i = bisect.bisect_left(self._name_keys, (query, -1))
+        while i < len(self._name_keys) and self._name_keys[i][0].startswith(query) and len(results) < limit:
+            oc_ID = self._name_keys[i][1]
+            if oc_ID not in results:
+                results.append(oc_ID)
+            i += 1
+
+        # Fall back to fuzzy matching to catch typos.
+        if not results:
+            for name in difflib.get_close_matches(query, self._fuzzy_names, n=limit, cutoff=0.6):
+                i = bisect.bisect_left(self._name_keys, (name, -1))
+                oc_ID = self._name_keys[i][1]
+                if oc_ID not in results:
+                    results.append(oc_ID)
+        return results[:limit]
+
+
+    def find(self, query: str) -> Optional[int]:
+        """Finds a single OC by card ID or name.
+        :param query: A card ID or a (partial) name.
+        :return: The best matching card ID, or None if nothing matches.
+        """
+        if query.isnumeric():
+            return int(query) if int(query) in self.by_ID else None
+        results = self.search(query, limit=1)
+        return results[0] if results else None
+
+
+    def is_valid_deck(self, deck: List[int]) -> bool:
+        """Checks that every card in a deck exists in the catalogue.
+        :param deck: A list of card IDs.
+        :return: True if every card exists, False otherwise.
+        """
+        return all(oc_ID in self.by_ID for oc_ID in deck)
+
+
+def load_catalogue(file_path: str = 'data/oc_data.json') -> OCCatalogue:
+    """This loads in the OC data from a json file and builds the indexed catalogue. Lore is read on first use.
+
+    :param file_path: Where to load in the OC JSON file.
+    :return: The OC catalogue.
+    """
+    return OCCatalogue(load_json(file_path, load_lore=False))
+
+
+class CatalogueLoader:
+    """Class to represent the live OC catalogue. The JSON file is checked for changes and reloaded,
+    so new cards show up without restarting the bot. Battles that are already running keep the catalogue
+    they started with. On the event loop, the file is checked and parsed on a worker thread and the new catalogue
+    is swapped in once it is complete, so a reload never blocks the bot.
+    """
+
+
+    def __init__(self, file_path: str = 'data/oc_data.json', check_interval: float = 1.0):
+        """Loads the catalogue.
+
+        :param file_path: Where to load in the OC JSON file.
+        :param check_interval: Minimum number of seconds between checks of the file modification time.
+        """
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self.mtime = os.path.getmtime(file_path)
+        self.catalogue = load_catalogue(file_path)
+        self._last_check = time.monotonic()
+        self._reload_task = None  # Background reload in progress on the event loop, if any
+
+
+    def get(self) -> OCCatalogue:
+        """Getter function for the current catalogue. If the check interval has passed, the JSON file is checked
+        for changes: in the background when called on the event loop, so the current catalogue is returned
+        straight away, and before returning otherwise.
+        :return: The OC catalogue.
+        """
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.reload()
+            else:
+                if self._reload_task is None or self._reload_task.done():
+                    self._reload_task = loop.create_task(self.reload_async())
+        return self.catalogue
+
+
+    def _load(self, force: bool) -> Optional[Tuple[float, Optional[OCCatalogue]]]:
+        """Loads the catalogue if the JSON file has changed. This does not touch the current catalogue,
+        so it can run on a worker thread.
+        :param force: Load even if the file has not changed.
+        :return: None if the file has not changed, otherwise the file modification time and the new catalogue,
+                 which is None if the file cannot be loaded.
+        """
         try:
-            with open(oc_data[i]['lorePath']) as f: 
-                oc_data[i]['lore'] += f.read()
-        except:  # Skip populating if invalid path.
-            pass
-    return oc_data
\ No newline at end of file
+            mtime = os.path.getmtime(self.file_path)
+            if not force and mtime == self.mtime:
+                return None
+        except OSError as e:
+            log.warning('Unable to reload the OC catalogue', extra={'path': str(self.file_path), 'error': str(e)})
+            return None
+        try:
+            return mtime, load_catalogue(self.file_path)
+        except (OSError, ValueError, KeyError) as e:
+            log.warning('Unable to reload the OC catalogue', extra={'path': str(self.file_path), 'error': str(e)})
+            return mtime, None
+
+
+    def _apply(self, loaded: Optional[Tuple[float, Optional[OCCatalogue]]]) -> bool:
+        """Swaps in a catalogue from _load. A broken file is only retried once it has been changed again.
+        :return: True if the catalogue was replaced, False otherwise.
+        """
+        if loaded is None:
+            return False
+        self.mtime, catalogue = loaded
+        if catalogue is None:
+            return False
+        self.catalogue = catalogue
+        return True
+
+
+    def reload(self, force: bool = False) -> bool:
+        """Reloads the catalogue if the JSON file has changed. If the new file cannot be loaded, the current catalogue is kept.
+        :param force: Reload even if the file has not changed.
+        :return: True if the catalogue was reloaded, False otherwise.
+        """
+        return self._apply(self._load(force))
+
+
+    async def reload_async(self, force: bool = False) -> bool:
+        """Reloads the catalogue like reload, reading and indexing the file on a worker thread so the event loop
+        is not blocked. The new catalogue replaces the current one in a single step once it is complete.
+        :param force: Reload even if the file has not changed.
+        :return: True if the catalogue was reloaded, False otherwise.
+        """
+        loaded = await asyncio.get_running_loop().run_in_executor(None, self._load, force)
+        return self._apply(loaded)
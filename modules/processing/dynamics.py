@@ -1,38 +1,363 @@
 from typing import List, Set, Dict, Tuple, Optional
+from collections import OrderedDict
+import threading
+import io
 import numpy as np
 import cv2
 import os
 
+from modules.processing import atlas
 
-def create_party_image(party: Tuple['oc.OC', 'oc.OC', 'oc.OC'], save_path: str = 'cache/party_cache.png'):
-    """This function dynamically generates the party lineup image based on the current status of the party.
-    
-    :param party: The list containing the OC card lineup to generate for.
-    :save_path: The temporary cache to save this image to. The image is replaced with each iteration. 
-    :return: The path that the image is saved to.
+
+class LRUCache:
+    """Class to represent a bounded, thread-safe cache that evicts the least recently used entry when full."""
+
+
+    def __init__(self, max_size: int):
+        """Initializes the cache.
+
+        :param max_size: The maximum number of entries kept before evicting.
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key):
+        """Retrieves an entry and marks it as recently used.
+
+        :param key: The key of the entry.
+        :return: The cached value, or None on a cache miss.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+
+    def put(self, key, value):
+        """Stores an entry, evicting the least recently used entries if the cache is full.
+
+        :param key: The key of the entry.
+        :param value: The value to store.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Process-wide caches shared by every battle.
+# Card art is keyed by (art_path, target size) and holds (normal image, defeated image) pairs.
+# Lineups are keyed by a tuple of (art path, defeated) per slot and hold the encoded PNG bytes.
+ART_CACHE_SIZE = 64      # Maximum number of (art_path, size) entries kept
+LINEUP_CACHE_SIZE = 256  # Maximum number of rendered lineups kept
+
+# Battle board layout. Party cards are drawn at BOARD_CARD_SIZE and the turn order strip at TURN_CARD_SIZE,
+# so that a strip of six turn order cards is exactly as wide as a party of three.
+BOARD_CARD_SIZE = (298, 434)  # (width, height)
+TURN_CARD_SIZE = (149, 217)   # (width, height)
+BOARD_MARGIN = 8              # Gap in pixels between the rows of the board
+HP_BAR_HEIGHT = 28
+_board_buffers = threading.local()  # Preallocated board canvases, one per render thread
+
+# The memory-mapped card art atlas, loaded once per process on first use. False means no atlas has been built.
+_atlas = None
+_art_cache = LRUCache(ART_CACHE_SIZE)
+_lineup_cache = LRUCache(LINEUP_CACHE_SIZE)
+
+
+def _tint_defeated(card_img: np.ndarray) -> np.ndarray:
+    """Creates the red tinted version of a card image used for defeated OCs.
+
+    :param card_img: The decoded card image (BGR or BGRA).
+    :return: A new image with the blue and green channels zeroed out.
+    """
+    tinted = card_img.copy()
+    tinted[:, :, 0] = 0
+    tinted[:, :, 1] = 0
+    return tinted
+
+
+def get_atlas() -> Optional[atlas.Atlas]:
+    """Getter function for the card art atlas. The atlas is memory-mapped on first use if it has been built.
+    If the atlas has been rebuilt since, it is re-opened and the caches are cleared, so no render of the old art
+    survives the rebuild.
+
+    :return: The atlas, or None if it has not been built.
+    """
+    global _atlas
+    if _atlas is None:
+        _atlas = atlas.load_atlas() or False
+    elif _atlas and _atlas.refresh():
+        clear_caches()
+    return _atlas or None
+
+
+def reload_atlas():
+    """Drops the loaded atlas and the decoded art so that a freshly built atlas is picked up."""
+    global _atlas
+    _atlas = None
+    clear_caches()
+
+
+def load_card_art(art_path: str, size: Optional[Tuple[int, int]] = None, defeated: bool = False) -> np.ndarray:
+    """Retrieves a decoded card image from the art cache, reading it from the atlas (or decoding it if there is no
+    atlas) and resizing it on a cache miss.
+    The returned array is shared between callers and is read-only, so copy it before modifying it.
+
+    :param art_path: The path to the card art.
+    :param size: The (width, height) to resize the art to. None keeps the original resolution.
+    :param defeated: Whether to return the red tinted (defeated) version of the art.
+    :return: The decoded card image.
+    """
+    key = (art_path, size)
+    card_atlas = get_atlas()  # Checked first, since a rebuilt atlas clears the cache
+    entry = _art_cache.get(key)
+    if entry is None:
+
+        # Read the art from the atlas if it has been built, and only decode the PNG as a fallback.
+        # This is done outside of the cache lock so other renders are not blocked on the disk.
+        card_img = card_atlas.get(art_path) if card_atlas is not None else None
+        if card_img is None:
+            card_img = cv2.imread(art_path, cv2.IMREAD_UNCHANGED)
+            if card_img is None:
+                raise FileNotFoundError('ERROR: Unable to load card art from ' + str(art_path) + '!')
+        elif size is None:
+            card_img = np.array(card_img)  # Copy the card out of the atlas so it is not tied to the memory map
+        if size is not None and (card_img.shape[1], card_img.shape[0]) != size:
+            card_img = cv2.resize(card_img, size)
+        tinted_img = _tint_defeated(card_img)
+        card_img.flags.writeable = False
+        tinted_img.flags.writeable = False
+        entry = (card_img, tinted_img)
+        _art_cache.put(key, entry)
+    return entry[1] if defeated else entry[0]
+
+
+def clear_caches():
+    """Empties the card art and lineup caches. Useful after the card art on disk has been changed."""
+    _art_cache.clear()
+    _lineup_cache.clear()
+
+
+def get_lineup_slots(party: Tuple['oc.OC', 'oc.OC', 'oc.OC']) -> Tuple[Tuple[str, bool], ...]:
+    """Reduces a lineup to the plain data needed to render it, so it can be handed to a worker process.
+    The slots are also the lineup's cache key. They hold the art path rather than the OC ID, so a catalogue reload
+    that changes a card's art never serves the old render.
+
+    :param party: The list containing the OC card lineup.
+    :return: A tuple of (art path, defeated) for each slot, in order.
+    """
+    return tuple((card.art_path, card.is_defeated()) for card in party)
+
+
+def compose_lineup_image(slots: Tuple[Tuple[str, bool], ...]) -> np.ndarray:
+    """This function composites a lineup image from the art path and defeated status of each slot.
+
+    :param slots: A tuple of (art path, defeated) for each slot, in order.
+    :return: The lineup image as an array.
     """
     party_imgs = []
-    
-    # Go through each OC card in the party list and create an image from there.
-    for card in party:
-        card_img = cv2.imread(card.art_path, cv2.IMREAD_UNCHANGED)
-        
+
+    # Go through each OC card in the lineup and create an image from there.
+    for art_path, defeated in slots:
+
         # Take on the resolution of the first image. (Probably should change this to a different metric)
-        if party_imgs:  
-            card_img = cv2.resize(card_img, (party_imgs[0].shape[1], party_imgs[0].shape[0]))
-            
-        # Tint red if OC card is defeated.
-        if card.is_defeated():
-            card_img[:, :, 0] = 0
-            card_img[:, :, 1] = 0
-            
+        size = None
+        if party_imgs:
+            size = (party_imgs[0].shape[1], party_imgs[0].shape[0])
+
+        # Use the red tinted art if OC card is defeated.
+        card_img = load_card_art(art_path, size, defeated)
         party_imgs.append(card_img)
-    party_imgs = np.hstack(party_imgs)
-    
+    return np.hstack(party_imgs)
+
+
+def compose_party_image(party: Tuple['oc.OC', 'oc.OC', 'oc.OC']) -> np.ndarray:
+    """This function composites the party lineup image based on the current status of the party.
+
+    :param party: The list containing the OC card lineup to generate for.
+    :return: The lineup image as an array.
+    """
+    return compose_lineup_image(get_lineup_slots(party))
+
+
+def get_cached_lineup(key: Tuple) -> Optional[bytes]:
+    """Retrieves previously rendered PNG bytes for a lineup or battle board.
+
+    :param key: The slots from get_lineup_slots, or the key from get_board_key.
+    :return: The encoded PNG bytes, or None if the lineup has not been rendered yet.
+    """
+    get_atlas()
+    return _lineup_cache.get(key)
+
+
+def cache_lineup(key: Tuple, png_bytes: bytes):
+    """Stores the rendered PNG bytes for a lineup or battle board.
+
+    :param key: The slots from get_lineup_slots, or the key from get_board_key.
+    :param png_bytes: The encoded PNG bytes.
+    """
+    _lineup_cache.put(key, png_bytes)
+
+
+def get_board_slots(player_party: Tuple['oc.OC', 'oc.OC', 'oc.OC'], AI_party: Tuple['oc.OC', 'oc.OC', 'oc.OC'],
+                    turn_order: List['oc.OC']) -> Tuple[Tuple, Tuple, Tuple]:
+    """Reduces the state of a battle turn to the plain data needed to render the battle board.
+
+    :param player_party: The player's OC lineup.
+    :param AI_party: The opponent's OC lineup.
+    :param turn_order: The OCs in order of who moves first.
+    :return: A tuple of (player slots, AI slots, turn order slots). Party slots are (art path, defeated, HP, MaxHP)
+             and turn order slots are (art path, defeated).
+    """
+    player_slots = tuple((card.art_path, card.is_defeated(), card.HP, card.max_HP) for card in player_party)
+    AI_slots = tuple((card.art_path, card.is_defeated(), card.HP, card.max_HP) for card in AI_party)
+    return player_slots, AI_slots, get_lineup_slots(turn_order)
+
+
+def get_board_key(player_party: Tuple['oc.OC', 'oc.OC', 'oc.OC'], AI_party: Tuple['oc.OC', 'oc.OC', 'oc.OC'],
+                  turn_order: List['oc.OC']) -> Tuple:
+    """Builds the key that identifies how a battle board is rendered.
+
+    :param player_party: The player's OC lineup.
+    :param AI_party: The opponent's OC lineup.
+    :param turn_order: The OCs in order of who moves first.
+    :return: A hashable tuple describing every card on the board, by art path like get_lineup_slots.
+    """
+    return ('board',) + get_board_slots(player_party, AI_party, turn_order)
+
+
+def _get_board_buffer(shape: Tuple[int, int, int]) -> np.ndarray:
+    """Retrieves the preallocated board canvas for the current thread, allocating it on first use.
+
+    :param shape: The (height, width, channels) of the board.
+    :return: A cleared canvas of the given shape.
+    """
+    canvas = getattr(_board_buffers, 'canvas', None)
+    if canvas is None or canvas.shape != shape:
+        canvas = np.zeros(shape, dtype=np.uint8)
+        _board_buffers.canvas = canvas
+    else:
+        canvas.fill(0)
+    return canvas
+
+
+def _draw_HP_bar(canvas: np.ndarray, x: int, y: int, HP: int, max_HP: int):
+    """Draws an HP bar and HP text along the bottom of a card on the board.
+
+    :param canvas: The board canvas to draw on.
+    :param x: The left edge of the card.
+    :param y: The top edge of the card.
+    :param HP: The current HP of the OC.
+    :param max_HP: The maximum HP of the OC.
+    """
+    card_w, card_h = BOARD_CARD_SIZE
+    left, right = x + BOARD_MARGIN, x + card_w - BOARD_MARGIN
+    bottom = y + card_h - BOARD_MARGIN
+    top = bottom - HP_BAR_HEIGHT
+    ratio = max(0.0, min(1.0, HP / max_HP)) if max_HP > 0 else 0.0
+
+    # Green when healthy, yellow when hurt and red when close to defeat (colours are BGRA).
+    if ratio > 0.5:
+        colour = (0, 200, 0, 255)
+    elif ratio > 0.25:
+        colour = (0, 200, 255, 255)
+    else:
+        colour = (0, 0, 255, 255)
+    cv2.rectangle(canvas, (left, top), (right, bottom), (40, 40, 40, 255), thickness=-1)
+    if ratio > 0:
+        cv2.rectangle(canvas, (left, top), (left + int((right - left) * ratio), bottom), colour, thickness=-1)
+    cv2.putText(canvas, str(HP) + '/' + str(max_HP), (left + 6, bottom - 7), cv2.FONT_HERSHEY_SIMPLEX,
+                0.6, (255, 255, 255, 255), 2, cv2.LINE_AA)
+
+
+def compose_board_image(player_slots: Tuple, AI_slots: Tuple, turn_slots: Tuple) -> np.ndarray:
+    """This function composites the whole battle board for a turn onto a single canvas: the player's party on top,
+    the opponent's party in the middle and the turn order strip along the bottom. HP bars are drawn on the party cards.
+    Card art is copied straight into the canvas, so no intermediate lineup images are created. Art without an alpha
+    channel (decoded from a PNG when there is no atlas) is converted to BGRA first.
+
+    :param player_slots: A tuple of (art path, defeated, HP, MaxHP) for each of the player's slots.
+    :param AI_slots: A tuple of (art path, defeated, HP, MaxHP) for each of the opponent's slots.
+    :param turn_slots: A tuple of (art path, defeated) for each OC in turn order.
+    :return: The board image as an array. The array is reused by the next board rendered on this thread.
+    """
+    card_w, card_h = BOARD_CARD_SIZE
+    turn_w, turn_h = TURN_CARD_SIZE
+    width = max(len(player_slots) * card_w, len(AI_slots) * card_w, len(turn_slots) * turn_w)
+    height = 2 * card_h + turn_h + 2 * BOARD_MARGIN
+    canvas = _get_board_buffer((height, width, 4))
+
+    # Draw both parties with their HP bars.
+    for row, slots in enumerate((player_slots, AI_slots)):
+        y = row * (card_h + BOARD_MARGIN)
+        for i, (art_path, defeated, HP, max_HP) in enumerate(slots):
+            x = i * card_w
+            card_img = load_card_art(art_path, BOARD_CARD_SIZE, defeated)
+            canvas[y:y + card_h, x:x + card_w] = atlas.normalize_card(card_img, BOARD_CARD_SIZE)
+            _draw_HP_bar(canvas, x, y, HP, max_HP)
+
+    # Draw the turn order strip.
+    y = 2 * (card_h + BOARD_MARGIN)
+    for i, (art_path, defeated) in enumerate(turn_slots):
+        x = i * turn_w
+        card_img = load_card_art(art_path, TURN_CARD_SIZE, defeated)
+        canvas[y:y + turn_h, x:x + turn_w] = atlas.normalize_card(card_img, TURN_CARD_SIZE)
+    return canvas
+
+
+def encode_image(img: np.ndarray, extension: str = '.png') -> io.BytesIO:
+    """Encodes an image in memory so that it can be attached to a message without touching the disk.
+
+    :param img: The image array to encode.
+    :param extension: The image format to encode to.
+    :return: A buffer holding the encoded image, rewound to the start.
+    """
+    success, encoded = cv2.imencode(extension, img)
+    if not success:
+        raise Exception('ERROR: Unable to encode image as ' + extension + '!')
+    return io.BytesIO(encoded.tobytes())
+
+
+def create_party_image(party: Tuple['oc.OC', 'oc.OC', 'oc.OC'], save_path: str = 'cache/party_cache.png',
+                       in_memory: bool = False):
+    """This function dynamically generates the party lineup image based on the current status of the party.
+
+    :param party: The list containing the OC card lineup to generate for.
+    :param save_path: The temporary cache to save this image to. The image is replaced with each iteration.
+    :param in_memory: If True, the image is encoded in memory and nothing is written to save_path.
+    :return: The path that the image is saved to, or a PNG buffer if in_memory is set.
+    """
+    if in_memory:
+
+        # Reuse the encoded lineup if the same OCs in the same state have been rendered before.
+        key = get_lineup_slots(party)
+        png_bytes = get_cached_lineup(key)
+        if png_bytes is None:
+            png_bytes = encode_image(compose_lineup_image(key)).getvalue()
+            _lineup_cache.put(key, png_bytes)
+        return io.BytesIO(png_bytes)
+
+    party_img = compose_party_image(party)
+
     # Make a directory if the directory doesn't exist.
     try:
         os.mkdir('cache/')
     except OSError:
         pass
-    cv2.imwrite(save_path, party_imgs)
-    return save_path
\ No newline at end of file
+    cv2.imwrite(save_path, party_img)
+    return save_path
@@ -0,0 +1,80 @@
+"""
+Structured logging for the bot. Modules log through the standard logging module with a short event name and
+their fields passed as extra, e.g. log.debug('Battle command', extra={'player': ID}). This module formats those
+records either as key=value text for the console or as one JSON object per line for log collectors.
+
+Logging below the configured level costs one level check. Hot paths that build fields for debug records check
+log.isEnabledFor(logging.DEBUG) first, so nothing is built when debugging is off.
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import json
+import logging
+import time
+
+
+# The loggers the bot writes to. Other libraries (such as discord.py) keep their own logging setup.
+# A module run as a script (python bot.py, python -m benchmarks.load) logs through getLogger(__name__) as '__main__'.
+LOGGER_NAMES = ('bot', 'modules', 'benchmarks', '__main__')
+
+# Attributes every log record has. Anything else on a record was passed as extra and is logged as a field.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def get_fields(record: logging.LogRecord) -> Dict:
+    """Collects the fields that were passed to a log call as extra.
+    :param record: The log record.
+    :return: A dictionary of field name -> value.
+    """
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Class to represent a formatter that writes a log record and its fields on one line, as text or JSON."""
+
+
+    def __init__(self, as_json: bool = False):
+        """Initializes the formatter.
+        :param as_json: If True, every record is written as a JSON object. Otherwise it is written as text.
+        """
+        super().__init__()
+        self.as_json = as_json
+
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Formats a record, e.g. "2024-05-01T12:00:00 INFO bot Battle ended player=12 result=finished".
+        :return: The formatted line.
+        """
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+        fields = get_fields(record)
+        if record.exc_info:
+            fields['exception'] = self.formatException(record.exc_info)
+        if self.as_json:
+            entry = {'time': timestamp, 'level': record.levelname, 'logger': record.name, 'event': record.getMessage()}
+            entry.update(fields)
+            return json.dumps(entry, default=str)
+        parts = [timestamp, record.levelname, record.name, record.getMessage()]
+        for key, value in fields.items():
+            if isinstance(value, (dict, list, tuple)):
+                value = json.dumps(value, default=str)
+            parts.append(key + '=' + str(value))
+        return ' '.join(parts)
+
+
+def configure(level: str = 'INFO', log_format: str = 'text'):
+    """Sets up the bot's loggers. Calling it again replaces the previous setup.
+
+    :param level: The lowest level that is logged: DEBUG, INFO, WARNING or ERROR.
+    :param log_format: Either 'text' or 'json'.
+    """
+    if log_format not in ('text', 'json'):
+        raise Exception('ERROR: Unknown log format ' + str(log_format) + ', use text or json!')
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(as_json=log_format == 'json'))
+    for name in LOGGER_NAMES:
+        logger = logging.getLogger(name)
+        for old_handler in list(logger.handlers):
+            if isinstance(old_handler.formatter, StructuredFormatter):
+                logger.removeHandler(old_handler)
+        logger.addHandler(handler)
+        logger.setLevel(level.upper())
+        logger.propagate = False
@@ -0,0 +1,311 @@
+"""
+In-process metrics for the bot's hot paths: command latencies, render, encode and upload timings, battle and session
+counts, user store flushes and event loop lag. Metrics are kept in memory and are cheap to record, and they are
+exposed in the Prometheus text format from a small local HTTP endpoint and as a periodic structured log line.
+
+Metrics are recorded from the event loop thread. Work done on the render pool is timed inside the worker and
+recorded once the result is back on the event loop, so process pools are measured as well.
+"""
+from typing import List, Set, Dict, Tuple, Optional, Callable
+import asyncio
+import bisect
+import contextlib
+import logging
+import math
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets in seconds, from a millisecond up to a whole battle.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# How often the event loop lag is sampled, in seconds.
+LAG_INTERVAL = 0.5
+
+# The metrics the bot records, with their help text. Metrics not listed here are still exported, without help text.
+HELP = {
+    'oc_command_seconds': 'Time to handle a command, by command. A battle command lasts the whole battle.',
+    'oc_command_errors_total': 'Commands whose handler raised an exception, by command.',
+    'oc_battle_turn_seconds': 'Time from the player\'s last target until the turn results are sent.',
+    'oc_ai_decision_seconds': 'Time the AI opponent spends choosing its targets for a turn.',
+    'oc_battles_active': 'Battles currently being played.',
+    'oc_battles_total': 'Battles that have ended, by result.',
+    'oc_battle_sessions': 'Registered battle sessions.',
+    'oc_render_seconds': 'Time to produce an image on the render pool, including queueing, by image.',
+    'oc_render_compose_seconds': 'Time a render worker spends compositing an image, by image.',
+    'oc_render_encode_seconds': 'Time a render worker spends encoding an image to PNG, by image.',
+    'oc_render_cache_total': 'Image requests served from the render cache or rendered, by image and result.',
+    'oc_rate_limit_wait_seconds': 'Time spent waiting for a channel\'s send budget.',
+    'oc_upload_seconds': 'Time to send a message to Discord, by whether it has attachments.',
+    'oc_user_flush_seconds': 'Time to write dirty user records.',
+    'oc_user_flush_records_total': 'User records written.',
+    'oc_user_flush_errors_total': 'User store flushes that failed.',
+    'oc_event_loop_lag_seconds': 'How late the event loop wakes up a sleeping task.'
+}
+
+
+class Histogram:
+    """Class to represent the distribution of a timing, as counts in fixed buckets like a Prometheus histogram."""
+
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """Initializes an empty histogram.
+        :param buckets: The sorted upper bounds of the buckets. Larger values go in an implicit +Inf bucket.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+    def observe(self, value: float):
+        """Records a value.
+        :param value: The value, e.g. a duration in seconds.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+
+    def get_quantile(self, q: float) -> float:
+        """Estimates a quantile by interpolating within its bucket, like Prometheus' histogram_quantile.
+
+        :param q: The quantile, between 0 and 1.
+        :return: The estimate, or NaN if nothing has been recorded. It is never above the largest recorded value.
+        """
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count > 0:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return min(self.max, lower + (self.buckets[i] - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+# Recorded metrics, keyed by (name, labels) where labels is a sorted tuple of (label, value) pairs.
+_histograms = {}
+_counters = {}
+_gauges = {}
+_gauge_callbacks = {}  # Name -> function returning the current value, read at export time
+
+
+def _get_key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple]:
+    """Builds the key of a metric with labels."""
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def observe(name: str, value: float, **labels: str):
+    """Records a value in a histogram, creating it on first use.
+
+    :param name: The metric name.
+    :param value: The value, e.g. a duration in seconds.
+    :param labels: Labels that split the metric, e.g. command='dex'. Keep their values to a small fixed set.
+    """
+    key = _get_key(name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = Histogram()
+        _histograms[key] = histogram
+    histogram.observe(value)
+
+
+def increment(name: str, amount: float = 1, **labels: str):
+    """Adds to a counter, creating it on first use.
+
+    :param name: The metric name, ending in _total by convention.
+    :param amount: How much to add.
+    :param labels: Labels that split the metric.
+    """
+    key = _get_key(name, labels)
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels: str):
+    """Sets a gauge to a value.
+
+    :param name: The metric name.
+    :param value: The current value.
+    :param labels: Labels that split the metric.
+    """
+    _gauges[_get_key(name, labels)] = value
+
+
+def add_gauge(name: str, amount: float, **labels: str):
+    """Adds to a gauge, e.g. 1 when a battle starts and -1 when it ends.
+
+    :param name: The metric name.
+    :param amount: How much to add.
+    :param labels: Labels that split the metric.
+    """
+    key = _get_key(name, labels)
+    _gauges[key] = _gauges.get(key, 0) + amount
+
+
+def register_gauge(name: str, func: Callable[[], float]):
+    """Registers a gauge whose value is read from a function whenever the metrics are exported.
+
+    :param name: The metric name.
+    :param func: A function returning the current value, e.g. the number of sessions.
+    """
+    _gauge_callbacks[name] = func
+
+
+@contextlib.contextmanager
+def timer(name: str, **labels: str):
+    """Times a block and records the duration in a histogram, even if the block raises.
+
+    :param name: The metric name.
+    :param labels: Labels that split the metric.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def reset():
+    """Clears every recorded metric. Registered gauge functions are kept."""
+    _histograms.clear()
+    _counters.clear()
+    _gauges.clear()
+
+
+def _get_gauges() -> Dict[Tuple[str, Tuple], float]:
+    """Collects the set gauges and the values of the registered gauge functions."""
+    gauges = dict(_gauges)
+    for name, func in _gauge_callbacks.items():
+        try:
+            gauges[(name, ())] = func()
+        except Exception as e:
+            log.warning('Unable to read gauge', extra={'gauge': name, 'error': str(e)})
+    return gauges
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    """Formats labels in the Prometheus text format, e.g. {command="dex"}."""
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    values = []
+    for label, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        values.append(label + '="' + value + '"')
+    return '{' + ','.join(values) + '}'
+
+
+def _format_value(value: float) -> str:
+    """Formats a sample value in the Prometheus text format."""
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Renders every metric in the Prometheus text exposition format (version 0.0.4).
+    :return: The metrics text.
+    """
+    families = {}  # Name -> (type, list of sample lines)
+    for (name, labels), histogram in sorted(_histograms.items()):
+        lines = families.setdefault(name, ('histogram', []))[1]
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+            cumulative += count
+            lines.append(name + '_bucket' + _format_labels(labels, (('le', _format_value(bound)),)) + ' ' + str(cumulative))
+        lines.append(name + '_sum' + _format_labels(labels) + ' ' + _format_value(histogram.sum))
+        lines.append(name + '_count' + _format_labels(labels) + ' ' + str(histogram.count))
+    for (name, labels), value in sorted(_counters.items()):
+        families.setdefault(name, ('counter', []))[1].append(name + _format_labels(labels) + ' ' + _format_value(value))
+    for (name, labels), value in sorted(_get_gauges().items()):
+        families.setdefault(name, ('gauge', []))[1].append(name + _format_labels(labels) + ' ' + _format_value(value))
+
+    output = []
+    for name, (kind, lines) in families.items():
+        if name in HELP:
+            output.append('# HELP ' + name + ' ' + HELP[name].replace('\\', '\\\\'))
+        output.append('# TYPE ' + name + ' ' + kind)
+        output.extend(lines)
+    return '\n'.join(output) + '\n'
+
+
+def get_summary() -> Dict[str, Dict]:
+    """Summarizes every metric for a structured log line. Histogram quantiles are estimated from the buckets.
+    :return: A dictionary of metric name (with labels) -> value or histogram summary (count, sum, p50, p99, max).
+    """
+    summary = {}
+    for (name, labels), histogram in sorted(_histograms.items()):
+        summary[name + _format_labels(labels)] = {
+            'count': histogram.count,
+            'sum': round(histogram.sum, 6),
+            'p50': round(histogram.get_quantile(0.5), 6),
+            'p99': round(histogram.get_quantile(0.99), 6),
+            'max': round(histogram.max, 6)
+        }
+    for (name, labels), value in sorted(_counters.items()):
+        summary[name + _format_labels(labels)] = value
+    for (name, labels), value in sorted(_get_gauges().items()):
+        summary[name + _format_labels(labels)] = value
+    return summary
+
+
+async def monitor_loop_lag(interval: float = LAG_INTERVAL):
+    """Samples how late the event loop wakes up a sleeping task until cancelled. A busy loop delays every command.
+    :param interval: The number of seconds between samples.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        observe('oc_event_loop_lag_seconds', max(0.0, loop.time() - start - interval))
+
+
+async def run_periodic_log(interval: float = 60.0):
+    """Logs a summary of every metric every interval seconds until cancelled.
+    :param interval: The number of seconds between log lines.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        log.info('metrics', extra={'metrics': get_summary()})
+
+
+async def _handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Answers one HTTP request to the metrics endpoint. GET /metrics returns the Prometheus text."""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5.0)
+        while (await asyncio.wait_for(reader.readline(), 5.0)) not in (b'\r\n', b'\n', b''):
+            pass  # The headers are not needed
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/metrics', '/'):
+            status, body = '200 OK', render_prometheus().encode()
+        else:
+            status, body = '404 Not Found', b'Not found\n'
+        writer.write(('HTTP/1.1 ' + status + '\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                      'Content-Length: ' + str(len(body)) + '\r\nConnection: close\r\n\r\n').encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port: int, host: str = '127.0.0.1') -> asyncio.AbstractServer:
+    """Starts the local HTTP endpoint that Prometheus scrapes.
+
+    :param port: The port to listen on.
+    :param host: The address to listen on. Defaults to the local machine only.
+    :return: The server. Close it to stop serving.
+    """
+    server = await asyncio.start_server(_handle_request, host, port)
+    log.info('Serving metrics', extra={'host': host, 'port': port})
+    return server
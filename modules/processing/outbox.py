@@ -0,0 +1,224 @@
+"""
+Outbound message layer. Text written during a battle turn is merged into as few Discord messages as possible,
+with files attached to them, and every channel's sends are paced to stay under Discord's per-channel rate limit
+instead of running into 429 responses.
+"""
+from typing import List, Set, Dict, Tuple, Optional
+from collections import deque
+import asyncio
+import time
+import logging
+
+from modules.processing import metrics
+
+
+log = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 2000  # Discord's limit on characters per message
+MAX_FILES = 10             # Discord's limit on attachments per message
+
+# Discord allows about 5 messages per 5 seconds in a channel.
+RATE_LIMIT_MESSAGES = 5
+RATE_LIMIT_PERIOD = 5.0
+
+# Idle limiters are dropped once this many channels have one, so the registry does not grow with every channel seen.
+MAX_LIMITERS = 1000
+
+
+class RateLimiter:
+    """Class to represent the send budget of one channel, as a sliding window of recent sends.
+    Senders wait their turn in order when the budget is used up.
+    """
+
+
+    def __init__(self, messages: int = RATE_LIMIT_MESSAGES, period: float = RATE_LIMIT_PERIOD):
+        """Initializes the limiter.
+
+        :param messages: How many messages can be sent within one period.
+        :param period: The length of the window in seconds.
+        """
+        self.messages = messages
+        self.period = period
+        self.sent = deque()  # Monotonic times of the sends within the last period
+        self.lock = asyncio.Lock()
+
+
+    async def acquire(self):
+        """Waits until a message can be sent, then records the send."""
+        async with self.lock:
+            now = time.monotonic()
+            while self.sent and now - self.sent[0] >= self.period:
+                self.sent.popleft()
+            if len(self.sent) >= self.messages:
+                await asyncio.sleep(self.period - (now - self.sent[0]))
+                self.sent.popleft()
+            self.sent.append(time.monotonic())
+
+
+    def is_idle(self) -> bool:
+        """Checks if the limiter can be dropped: nobody is waiting and no send is left in the window.
+        :return: True if a new limiter for the channel would behave the same.
+        """
+        return not self.lock.locked() and (not self.sent or time.monotonic() - self.sent[-1] >= self.period)
+
+
+# One limiter per channel, shared by everything that sends to the channel.
+_limiters = {}
+_prune_at = MAX_LIMITERS  # Registry size at which idle limiters are dropped next
+
+
+def get_limiter(channel_ID: int) -> RateLimiter:
+    """Getter function for the rate limiter of a channel. Idle limiters of other channels are dropped
+    whenever the registry grows past MAX_LIMITERS, or twice the number of busy channels if that is more.
+
+    :param channel_ID: The Discord ID of the channel.
+    :return: The channel's rate limiter.
+    """
+    global _prune_at
+    limiter = _limiters.get(channel_ID)
+    if limiter is None:
+        if len(_limiters) >= _prune_at:
+            for idle_ID in [ID for ID, other in _limiters.items() if other.is_idle()]:
+                del _limiters[idle_ID]
+            _prune_at = max(MAX_LIMITERS, 2 * len(_limiters))
+        limiter = RateLimiter()
+        _limiters[channel_ID] = limiter
+    return limiter
+
+
+def split_text(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Splits text into chunks that fit in one message, preferring to split between lines.
+
+    :param text: The text to split.
+    :param limit: The maximum length of a chunk.
+    :return: A list of chunks.
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class ChannelOutbox:
+    """Class to represent a buffer of outgoing text and files for one channel.
+    Text is merged until the outbox is flushed, either explicitly or after it has been idle for the linger time.
+    """
+
+
+    def __init__(self, channel: 'discord.abc.Messageable', linger: Optional[float] = None):
+        """Initializes the outbox.
+
+        :param channel: The channel to send to.
+        :param linger: If set, pending text is flushed automatically this many seconds after the last write.
+        """
+        self.channel = channel
+        self.linger = linger
+        self.lines = []  # Pending text, joined with newlines on flush
+        self.files = []  # Pending attachments
+        self._flush_lock = asyncio.Lock()
+        self._linger_handle = None
+        self._linger_task = None  # The last flush started by the idle timer
+
+
+    def write(self, text: str):
+        """Adds text to the pending message.
+        :param text: The text to add.
+        """
+        if text:
+            self.lines.append(text.rstrip('\n'))
+            self._schedule_linger()
+
+
+    def attach(self, file: 'discord.File'):
+        """Attaches a file to the pending message.
+        :param file: The file to attach.
+        """
+        self.files.append(file)
+        self._schedule_linger()
+
+
+    def _schedule_linger(self):
+        """Restarts the idle timer that flushes the pending message."""
+        if self.linger is None:
+            return
+        if self._linger_handle is not None:
+            self._linger_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._linger_handle = loop.call_later(self.linger, self._start_linger_flush)
+
+
+    def _start_linger_flush(self):
+        """Flushes the pending message once the idle timer runs out. Nobody awaits this flush, so a failure is logged."""
+        self._linger_handle = None
+        self._linger_task = asyncio.ensure_future(self.flush())
+        self._linger_task.add_done_callback(self._log_linger_failure)
+
+
+    def _log_linger_failure(self, task: asyncio.Task):
+        """Logs the exception of a flush started by the idle timer."""
+        if task is self._linger_task:
+            self._linger_task = None
+        if not task.cancelled() and task.exception() is not None:
+            log.error('Unable to send battle text', exc_info=task.exception(), extra={'channel': self.channel.id})
+
+
+    async def flush(self) -> int:
+        """Sends everything pending, using as few messages as possible.
+        :return: The number of messages sent.
+        """
+        if self._linger_handle is not None:
+            self._linger_handle.cancel()
+            self._linger_handle = None
+        async with self._flush_lock:
+            lines, files = self.lines, self.files
+            self.lines, self.files = [], []
+            chunks = split_text('\n'.join(lines))
+
+            # Files go on the last text chunk, and on extra messages if there are too many for one.
+            file_groups = [files[i:i + MAX_FILES] for i in range(0, len(files), MAX_FILES)]
+            messages = [(chunk, []) for chunk in chunks]
+            for group in file_groups:
+                if messages and not messages[-1][1]:
+                    messages[-1] = (messages[-1][0], group)
+                else:
+                    messages.append((None, group))
+
+            # The limiter is looked up on every flush, since idle limiters can be dropped from the registry.
+            limiter = get_limiter(self.channel.id)
+            for content, group in messages:
+                start = time.perf_counter()
+                await limiter.acquire()
+                sent = time.perf_counter()
+                metrics.observe('oc_rate_limit_wait_seconds', sent - start)
+                if len(group) == 1:
+                    await self.channel.send(content, file=group[0])
+                elif group:
+                    await self.channel.send(content, files=group)
+                else:
+                    await self.channel.send(content)
+                metrics.observe('oc_upload_seconds', time.perf_counter() - sent, attachments='yes' if group else 'no')
+            return len(messages)
+
+
+    async def send(self, text: str = None, file: 'discord.File' = None) -> int:
+        """Adds text and a file to the pending message, then flushes it.
+        :return: The number of messages sent.
+        """
+        if text:
+            self.write(text)
+        if file is not None:
+            self.attach(file)
+        return await self.flush()
+
+
+    def close(self):
+        """Stops the idle timer. Anything still pending is discarded."""
+        if self._linger_handle is not None:
+            self._linger_handle.cancel()
+            self._linger_handle = None
@@ -0,0 +1,126 @@
+from typing import List, Set, Dict, Tuple, Optional, Callable
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import io
+import time
+
+from modules.processing import dynamics
+from modules.processing import metrics
+
+
+# The executor that battle renders are run on. Created lazily on first use.
+_executor = None
+
+
+def configure(max_workers: Optional[int] = None, use_processes: bool = False):
+    """Sets up the worker pool used for rendering. Any previously configured pool is shut down.
+
+    :param max_workers: The number of render workers. None lets the executor pick a default.
+    :param use_processes: If True, renders run in a process pool instead of a thread pool.
+    """
+    global _executor
+    shutdown()
+    if use_processes:
+        _executor = ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+
+
+def get_executor() -> Executor:
+    """Getter function for the render pool. Creates a default thread pool if none has been configured.
+    :return: The executor that renders are submitted to.
+    """
+    if _executor is None:
+        configure()
+    return _executor
+
+
+def shutdown(wait: bool = True):
+    """Shuts down the render pool.
+    :param wait: Whether to wait for pending renders to finish.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def _render_png(compose: Callable, *slots: Tuple) -> Tuple[bytes, float, float]:
+    """Composites and encodes an image, timing both steps. This is the unit of work run by the render pool, so the
+    timings are measured in the worker and returned with the image.
+
+    :param compose: The function that composites the image from the slots, e.g. dynamics.compose_board_image.
+    :param slots: The arguments of the compose function.
+    :return: A tuple of (PNG bytes, compose seconds, encode seconds).
+    """
+    start = time.perf_counter()
+    img = compose(*slots)
+    composed = time.perf_counter()
+    png_bytes = dynamics.encode_image(img).getvalue()
+    return png_bytes, composed - start, time.perf_counter() - composed
+
+
+async def _render(image: str, compose: Callable, *slots: Tuple) -> bytes:
+    """Renders an image on the render pool and records how long it took.
+
+    :param image: The kind of image for the metrics, e.g. 'board'.
+    :param compose: The function that composites the image from the slots.
+    :param slots: The arguments of the compose function.
+    :return: The encoded PNG bytes.
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    png_bytes, compose_time, encode_time = await loop.run_in_executor(get_executor(), _render_png, compose, *slots)
+    metrics.observe('oc_render_seconds', time.perf_counter() - start, image=image)
+    metrics.observe('oc_render_compose_seconds', compose_time, image=image)
+    metrics.observe('oc_render_encode_seconds', encode_time, image=image)
+    return png_bytes
+
+
+async def render_party_image(party: Tuple['oc.OC', 'oc.OC', 'oc.OC']) -> io.BytesIO:
+    """Renders a party lineup image on the render pool without blocking the event loop.
+    Lineups that have been rendered before are served straight from the lineup cache.
+
+    :param party: The list containing the OC card lineup to generate for.
+    :return: A PNG buffer ready to attach to a message.
+    """
+    # The state of the OCs is read here, on the event loop, so the workers never touch live battle objects.
+    key = dynamics.get_lineup_slots(party)
+    png_bytes = dynamics.get_cached_lineup(key)
+    if png_bytes is None:
+        metrics.increment('oc_render_cache_total', image='lineup', result='miss')
+        png_bytes = await _render('lineup', dynamics.compose_lineup_image, key)
+        dynamics.cache_lineup(key, png_bytes)
+    else:
+        metrics.increment('oc_render_cache_total', image='lineup', result='hit')
+    return io.BytesIO(png_bytes)
+
+
+async def render_party_images(*parties: Tuple['oc.OC', 'oc.OC', 'oc.OC']) -> List[io.BytesIO]:
+    """Renders several party lineup images concurrently.
+
+    :param parties: The lineups to render.
+    :return: A list of PNG buffers in the same order as the given lineups.
+    """
+    return list(await asyncio.gather(*[render_party_image(party) for party in parties]))
+
+
+async def render_board_image(player_party: Tuple['oc.OC', 'oc.OC', 'oc.OC'], AI_party: Tuple['oc.OC', 'oc.OC', 'oc.OC'],
+                             turn_order: List['oc.OC']) -> io.BytesIO:
+    """Renders the single battle board image for a turn on the render pool without blocking the event loop.
+
+    :param player_party: The player's OC lineup.
+    :param AI_party: The opponent's OC lineup.
+    :param turn_order: The OCs in order of who moves first.
+    :return: A PNG buffer ready to attach to a message.
+    """
+    key = dynamics.get_board_key(player_party, AI_party, turn_order)
+    png_bytes = dynamics.get_cached_lineup(key)
+    if png_bytes is None:
+        metrics.increment('oc_render_cache_total', image='board', result='miss')
+        slots = dynamics.get_board_slots(player_party, AI_party, turn_order)
+        png_bytes = await _render('board', dynamics.compose_board_image, *slots)
+        dynamics.cache_lineup(key, png_bytes)
+    else:
+        metrics.increment('oc_render_cache_total', image='board', result='hit')
+    return io.BytesIO(png_bytes)
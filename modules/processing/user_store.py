@@ -0,0 +1,444 @@
+"""
+In-memory user store with write-back persistence. User records (name, deck and points) are loaded once
+and served from memory. Changes mark a record as dirty, and dirty records are written out in batches by
+flush(), which the bot calls periodically and on shutdown.
+
+Two backends are available:
+    - UserStore keeps users in a JSON file and rewrites it atomically (write to a temp file, then rename).
+    - SQLiteUserStore keeps users in an SQLite database and only writes the dirty rows, for large user counts.
+"""
+from typing import List, Set, Dict, Tuple, Optional
+import asyncio
+import contextlib
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+
+from modules.processing import metrics
+
+
+log = logging.getLogger(__name__)
+
+MAX_CACHED_USERS = 10000  # Users the SQLite backend keeps in memory
+
+
+class UserStore:
+    """Class to represent the user store, backed by a JSON file."""
+
+
+    def __init__(self, file_path: str = 'users.json'):
+        """Loads every user from the JSON file.
+
+        :param file_path: Where the users are stored.
+        """
+        self.file_path = file_path
+        self.users = {}     # User ID -> {'name': str, 'deck': List[int], 'points': int}
+        self.dirty = set()  # IDs of users changed since the last flush
+        self._write_lock = threading.Lock()
+        self._load()
+
+
+    def _load(self):
+        """Loads the users into memory."""
+        try:
+            with open(self.file_path) as f:
+                self.users = json.load(f)
+        except FileNotFoundError:
+            self.users = {}
+        self._persisted = copy.deepcopy(self.users)  # Last written state, only touched while writing
+
+
+    def __contains__(self, user_ID: str) -> bool:
+        return str(user_ID) in self.users
+
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+
+    def get(self, user_ID: str) -> Optional[Dict]:
+        """Retrieves a user record. Call mark_dirty after changing the returned record directly.
+        :param user_ID: The Discord ID of the user.
+        :return: The user record, or None if the user does not exist.
+        """
+        return self.users.get(str(user_ID))
+
+
+    async def get_async(self, user_ID: str) -> Optional[Dict]:
+        """Retrieves a user record without blocking the event loop. Backends that load users lazily read them
+        on a worker thread. Afterwards the user is in memory, so get, add and the other methods do not touch the disk.
+
+        :param user_ID: The Discord ID of the user.
+        :return: The user record, or None if the user does not exist.
+        """
+        return self.get(user_ID)
+
+
+    async def count_async(self) -> int:
+        """Counts the users without blocking the event loop.
+        :return: The number of users, including new users that are not saved yet.
+        """
+        return len(self)
+
+
+    def add(self, user_ID: str, name: str) -> Dict:
+        """Adds a new user with an empty deck and no points.
+        :param user_ID: The Discord ID of the user.
+        :param name: The Discord name of the user.
+        :return: The new user record.
+        """
+        user = {'name': name, 'deck': [], 'points': 0}
+        self.users[str(user_ID)] = user
+        self.mark_dirty(user_ID)
+        return user
+
+
+    async def add_async(self, user_ID: str, name: str) -> Optional[Dict]:
+        """Adds a new user unless the user already exists, without blocking the event loop. Nothing else runs on
+        the event loop between the final check and the add, so concurrent calls for the same user add it only once.
+
+        :param user_ID: The Discord ID of the user.
+        :param name: The Discord name of the user.
+        :return: The new user record, or None if the user already exists.
+        """
+        if await self.get_async(user_ID) is not None or str(user_ID) in self.users:
+            return None
+        return self.add(user_ID, name)
+
+
+    def set_deck(self, user_ID: str, deck: List[int]):
+        """Sets the deck of a user.
+        :param user_ID: The Discord ID of the user.
+        :param deck: A list of card IDs.
+        """
+        self.users[str(user_ID)]['deck'] = list(deck)
+        self.mark_dirty(user_ID)
+
+
+    def add_points(self, user_ID: str, points: int) -> int:
+        """Adds (or removes, if negative) gacha points for a user.
+        :param user_ID: The Discord ID of the user.
+        :param points: The number of points to add.
+        :return: The new point total.
+        """
+        user = self.users[str(user_ID)]
+        user['points'] += points
+        self.mark_dirty(user_ID)
+        return user['points']
+
+
+    def mark_dirty(self, user_ID: str):
+        """Marks a user record as changed so that it is written on the next flush.
+        :param user_ID: The Discord ID of the user.
+        """
+        self.dirty.add(str(user_ID))
+
+
+    def _take_dirty(self) -> Dict[str, Dict]:
+        """Takes a snapshot of every dirty record and clears the dirty set.
+        :return: A copy of every dirty record, keyed by user ID.
+        """
+        records = {user_ID: copy.deepcopy(self.users[user_ID]) for user_ID in self.dirty if user_ID in self.users}
+        self.dirty = set()
+        return records
+
+
+    def _write(self, records: Dict[str, Dict]):
+        """Writes a batch of records. The whole file is written to a temp file and renamed over the old one,
+        so a crash mid-write never leaves a partially written file behind.
+
+        :param records: The changed records, keyed by user ID.
+        """
+        with self._write_lock:
+            self._persisted.update(records)
+            directory = os.path.dirname(os.path.abspath(self.file_path))
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.users-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._persisted, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.file_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+
+    def _written(self, records: Dict[str, Dict]):
+        """Called on the event loop thread after a batch of records was written.
+        :param records: The written records, keyed by user ID.
+        """
+        pass
+
+
+    def flush(self) -> int:
+        """Writes every dirty record.
+        :return: The number of records written.
+        """
+        records = self._take_dirty()
+        if not records:
+            return 0
+        start = time.perf_counter()
+        try:
+            self._write(records)
+        except Exception:
+            self.dirty.update(records)  # Retry on the next flush
+            metrics.increment('oc_user_flush_errors_total')
+            raise
+        self._written(records)
+        self._record_flush(len(records), time.perf_counter() - start)
+        return len(records)
+
+
+    async def flush_async(self) -> int:
+        """Writes every dirty record on a worker thread so the event loop is not blocked by the disk.
+        :return: The number of records written.
+        """
+        records = self._take_dirty()
+        if not records:
+            return 0
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, records)
+        except Exception:
+            self.dirty.update(records)  # Retry on the next flush
+            metrics.increment('oc_user_flush_errors_total')
+            raise
+        self._written(records)  # Back on the event loop, so the in-memory state is only changed from one thread
+        self._record_flush(len(records), time.perf_counter() - start)
+        return len(records)
+
+
+    def _record_flush(self, records: int, seconds: float):
+        """Records the metrics of a successful flush."""
+        metrics.observe('oc_user_flush_seconds', seconds)
+        metrics.increment('oc_user_flush_records_total', records)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Flushed users', extra={'records': records, 'seconds': round(seconds, 6)})
+
+
+    async def run_periodic_flush(self, interval: float = 5.0):
+        """Flushes dirty records every interval seconds until cancelled.
+        :param interval: The number of seconds between flushes.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush_async()
+            except Exception as e:
+                log.warning('Unable to save users', extra={'error': str(e)})
+
+
+    def close(self):
+        """Releases the backend. Flush first, since dirty records are not written."""
+        pass
+
+
+class SQLiteUserStore(UserStore):
+    """Class to represent the user store, backed by an SQLite database. Users are loaded on first access
+    and only dirty rows are written. The store keeps one connection, which the worker threads share under _write_lock.
+    At most max_cached users are kept in memory. The least recently used users that have no unsaved changes are
+    evicted, and loaded again on their next access.
+    """
+
+
+    def __init__(self, file_path: str = 'users.db', max_cached: int = MAX_CACHED_USERS):
+        """Opens (and creates if needed) the user database.
+
+        :param file_path: Where the database is stored.
+        :param max_cached: How many users to keep in memory.
+        """
+        self.max_cached = max(1, max_cached)
+        super().__init__(file_path)
+
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Locks the shared connection and commits on success (or rolls back on failure) afterwards.
+        :return: The connection.
+        """
+        with self._write_lock, self._connection:
+            yield self._connection
+
+
+    def _load(self):
+        """Opens the database and creates the user table if it does not exist. Users are loaded lazily by get."""
+        self._missing = set()  # IDs already looked up and not found
+        self._flushing = set()  # IDs of the records being written by a flush
+        self._connection = sqlite3.connect(self.file_path, check_same_thread=False)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, name TEXT, deck TEXT, points INTEGER)')
+
+
+    def _select(self, user_ID: str) -> Optional[Dict]:
+        """Reads a user from the database. Safe to call from a worker thread, since it does not change the store.
+        :param user_ID: The Discord ID of the user.
+        :return: The stored user record, or None if the user is not in the database.
+        """
+        with self._connect() as connection:
+            row = connection.execute('SELECT name, deck, points FROM users WHERE id = ?', (user_ID,)).fetchone()
+        if row is None:
+            return None
+        return {'name': row[0], 'deck': json.loads(row[1]), 'points': row[2]}
+
+
+    def _get_new(self) -> Set[str]:
+        """Getter function for the new users that may not be in the database yet: dirty or being written, and not
+        found by an earlier lookup.
+        :return: The set of user IDs.
+        """
+        return {user_ID for user_ID in self._missing if user_ID in self.dirty or user_ID in self._flushing}
+
+
+    def _count(self, new: Set[str]) -> int:
+        """Counts the users in the database plus the new users that are not written yet. The rows are counted under
+        the same lock as the writes, so a new user is counted once whether or not its flush has committed.
+        Safe to call from a worker thread.
+
+        :param new: The IDs from _get_new.
+        :return: The number of users.
+        """
+        with self._connect() as connection:
+            stored = connection.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+            written = sum(1 for user_ID in new
+                          if connection.execute('SELECT 1 FROM users WHERE id = ?', (user_ID,)).fetchone() is not None)
+        return stored + len(new) - written
+
+
+    def _cache(self, user_ID: str, user: Optional[Dict]) -> Optional[Dict]:
+        """Keeps the result of a lookup in memory, unless the user was added while the lookup was running.
+        :param user_ID: The Discord ID of the user.
+        :param user: The stored user record, or None if the user is not in the database.
+        :return: The user record in memory, or None if the user does not exist.
+        """
+        if user_ID in self.users:
+            return self._touch(user_ID)
+        if user is None:
+            self._missing.add(user_ID)
+        else:
+            self.users[user_ID] = user
+            self._evict()
+        return user
+
+
+    def _touch(self, user_ID: str) -> Dict:
+        """Marks a user in memory as the most recently used.
+        :param user_ID: The Discord ID of the user.
+        :return: The user record.
+        """
+        user = self.users.pop(user_ID)
+        self.users[user_ID] = user  # Dictionaries keep insertion order, so the oldest users come first
+        return user
+
+
+    def _evict(self):
+        """Drops the least recently used users from memory until at most max_cached are left. Users with unsaved
+        changes are kept. Forgotten missing IDs are also dropped once there are more than max_cached of them.
+        """
+        if len(self.users) > self.max_cached:
+            for user_ID in list(self.users):
+                if len(self.users) <= self.max_cached:
+                    break
+                if user_ID not in self.dirty and user_ID not in self._flushing:
+                    del self.users[user_ID]
+        if len(self._missing) > self.max_cached:
+            self._missing = self._get_new()
+
+
+    def _fetch(self, user_ID: str) -> Optional[Dict]:
+        """Loads a user from the database into memory.
+        :param user_ID: The Discord ID of the user.
+        :return: The user record, or None if the user does not exist.
+        """
+        if user_ID in self.users:
+            return self._touch(user_ID)
+        if user_ID in self._missing:
+            return None
+        return self._cache(user_ID, self._select(user_ID))
+
+
+    async def get_async(self, user_ID: str) -> Optional[Dict]:
+        user_ID = str(user_ID)
+        if user_ID in self.users:
+            return self._touch(user_ID)
+        if user_ID in self._missing:
+            return None
+        user = await asyncio.get_running_loop().run_in_executor(None, self._select, user_ID)
+        return self._cache(user_ID, user)
+
+
+    async def count_async(self) -> int:
+        return await asyncio.get_running_loop().run_in_executor(None, self._count, self._get_new())
+
+
+    def __contains__(self, user_ID: str) -> bool:
+        return self._fetch(str(user_ID)) is not None
+
+
+    def __len__(self) -> int:
+        return self._count(self._get_new())
+
+
+    def get(self, user_ID: str) -> Optional[Dict]:
+        return self._fetch(str(user_ID))
+
+
+    def add(self, user_ID: str, name: str) -> Dict:
+        self._fetch(str(user_ID))  # Records whether the user is new, for __len__
+        return super().add(user_ID, name)
+
+
+    def set_deck(self, user_ID: str, deck: List[int]):
+        self._fetch(str(user_ID))
+        super().set_deck(user_ID, deck)
+
+
+    def add_points(self, user_ID: str, points: int) -> int:
+        self._fetch(str(user_ID))
+        return super().add_points(user_ID, points)
+
+
+    def _write(self, records: Dict[str, Dict]):
+        """Writes a batch of records in a single transaction.
+        :param records: The changed records, keyed by user ID.
+        """
+        rows = [(user_ID, user['name'], json.dumps(user['deck']), user['points']) for user_ID, user in records.items()]
+        with self._connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO users (id, name, deck, points) VALUES (?, ?, ?, ?)', rows)
+
+
+    def _take_dirty(self) -> Dict[str, Dict]:
+        records = super()._take_dirty()
+        self._flushing.update(records)
+        return records
+
+
+    def _written(self, records: Dict[str, Dict]):
+        self._missing.difference_update(records)
+        self._flushing.difference_update(records)
+        self._evict()
+
+
+    def close(self):
+        with self._write_lock:
+            self._connection.close()
+
+
+def open_store(backend: str = 'json', file_path: Optional[str] = None) -> UserStore:
+    """Opens the user store with the given backend.
+
+    :param backend: Either 'json' or 'sqlite'.
+    :param file_path: Where the users are stored. Defaults to users.json or users.db.
+    :return: The user store.
+    """
+    if backend == 'json':
+        return UserStore(file_path or 'users.json')
+    elif backend == 'sqlite':
+        return SQLiteUserStore(file_path or 'users.db')
+    else:  # Invalid input
+        raise Exception('ERROR: Invalid user store backend ' + str(backend) + '!')
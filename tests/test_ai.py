@@ -0,0 +1,60 @@
+import time
+
+from modules.mechanics.oc import OC
+from modules.mechanics.party import Party
+from modules.mechanics.battlefield import Battlefield
+from modules.mechanics.rng import BattleRNG
+from modules.mechanics import ai
+from modules.processing import data_processing
+
+
+TABLE = data_processing.load_catalogue('data/oc_data.json').table
+
+
+def make_oc(oc_ID, hp, atk, spd, coin=0.5):
+    """Compact state tuple of an OC: (OC ID, HP, max HP, ATK, SPD, LUCK, coin)."""
+    return (oc_ID, hp, max(hp, 1), atk, spd, 0, coin)
+
+
+def test_picks_the_lethal_target():
+    # The player's OCs are slower, so a choice that defeats the whole party this turn wins. Only the AI's strong
+    # front OC can defeat the player's back OC, which leaves the player's weakened front OC to its back OC.
+    player = (make_oc(4, 1, 100, 1), make_oc(3, 5, 100, 1), make_oc(0, 0, 1, 1))
+    AI = (make_oc(5, 10, 5, 50), make_oc(8, 10, 1, 40), make_oc(2, 0, 1, 1))
+    state = (player, AI)
+    player_targets = (0, 1, None)
+
+    AI_player = ai.ExpectimaxAI(TABLE, depth=1, time_budget=10)
+    choices = AI_player.search(state, player_targets, 1)
+    assert choices == [ai.BACK, ai.FRONT, None]
+    assert AI_player._option_value(state, tuple(choices), player_targets, 1) == ai.WIN_VALUE
+    assert AI_player.last_depth == 1
+
+
+def test_takes_out_the_attacker_that_would_win():
+    # The AI acts first. Hitting the front OC lets the player's back OC defeat the AI's last OC.
+    player = (make_oc(4, 50, 1, 1), make_oc(3, 5, 100, 1), make_oc(0, 0, 1, 1))
+    AI = (make_oc(5, 10, 5, 50), make_oc(8, 0, 1, 1), make_oc(2, 0, 1, 1))
+    choices = ai.ExpectimaxAI(TABLE, depth=1, time_budget=10).search((player, AI), (0, 0, None), 1)
+    assert choices == [ai.BACK, None, None]
+
+
+def test_respects_the_time_budget():
+    party_A = Party([OC(TABLE, ID) for ID in (5, 8, 2)], 'Player', '1')
+    party_B = Party([OC(TABLE, ID) for ID in (4, 3, 0)], 'AI', 'AI')
+    field = Battlefield(TABLE, party_A, party_B, BattleRNG(1))
+    field.calculate_turns()
+    for oc in party_A.get_OCs():
+        oc.set_target(0)
+
+    AI_player = ai.ExpectimaxAI(TABLE, depth=50, time_budget=0.02)
+    start = time.perf_counter()
+    choices = AI_player.choose_targets(field, 1)
+    assert time.perf_counter() - start < 0.02 + 0.1  # One turn of search past the deadline at most
+    assert len(choices) == 3 and all(choice in (ai.FRONT, ai.BACK) for choice in choices)
+    assert AI_player.last_depth < 50
+
+    # With no budget left it falls back to the first option without searching.
+    AI_player = ai.ExpectimaxAI(TABLE, time_budget=0)
+    assert AI_player.choose_targets(field, 1) == [ai.FRONT] * 3
+    assert AI_player.last_depth == 0
@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+import cv2
+
+from modules.processing import atlas
+
+
+SIZE = (8, 12)
+
+
+def write_data(tmp_path, art_paths):
+    data_path = tmp_path / 'oc_data.json'
+    ocs = [{'cardID': i, 'artPath': art_path} for i, art_path in enumerate(art_paths)]
+    data_path.write_text(json.dumps({'ocs': ocs}))
+    return str(data_path)
+
+
+def write_art(tmp_path, name, value):
+    art_path = str(tmp_path / name)
+    cv2.imwrite(art_path, np.full((24, 16, 4), value, dtype=np.uint8))
+    return art_path
+
+
+def test_rebuild_replaces_the_files_and_reopens(tmp_path):
+    atlas_path, index_path = str(tmp_path / 'atlas.npy'), str(tmp_path / 'atlas.json')
+    first = write_art(tmp_path, 'a.png', 10)
+    atlas.build_atlas(write_data(tmp_path, [first]), atlas_path, index_path, SIZE)
+    card_atlas = atlas.Atlas(atlas_path, index_path)
+    old_card = card_atlas.get(first)
+    assert old_card.shape == (SIZE[1], SIZE[0], 4)
+    old_inode = os.stat(atlas_path).st_ino
+
+    second = write_art(tmp_path, 'b.png', 200)
+    atlas.build_atlas(write_data(tmp_path, [second, first]), atlas_path, index_path, SIZE)
+    os.utime(index_path, ns=(0, os.stat(index_path).st_mtime_ns + 10 ** 9))  # Coarse file systems share mtimes
+
+    assert os.stat(atlas_path).st_ino != old_inode  # Replaced, not rewritten under the old mapping
+    assert int(old_card[0, 0, 0]) == 10  # The old mapping is still readable
+    assert int(card_atlas.get(second)[0, 0, 0]) == 200
+    assert int(card_atlas.get(first)[0, 0, 0]) == 10
+    assert [name for name in os.listdir(tmp_path) if name.startswith('.atlas-')] == []
+
+
+def test_rebuild_clears_the_render_caches(tmp_path, monkeypatch):
+    from modules.processing import dynamics
+
+    atlas_path, index_path = str(tmp_path / 'atlas.npy'), str(tmp_path / 'atlas.json')
+    first = write_art(tmp_path, 'a.png', 10)
+    atlas.build_atlas(write_data(tmp_path, [first]), atlas_path, index_path, SIZE)
+    monkeypatch.setattr(dynamics, '_atlas', atlas.Atlas(atlas_path, index_path))
+    dynamics.clear_caches()
+    assert int(dynamics.load_card_art(first)[0, 0, 0]) == 10
+    dynamics.cache_lineup(('lineup',), b'old')
+
+    atlas.build_atlas(write_data(tmp_path, [first]), atlas_path, index_path, SIZE)
+    os.utime(index_path, ns=(0, os.stat(index_path).st_mtime_ns + 10 ** 9))
+    assert dynamics.get_cached_lineup(('lineup',)) is None
+    assert len(dynamics._art_cache) == 0
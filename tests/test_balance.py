@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from modules.abilities import registry
+from modules.mechanics import balance
+from modules.mechanics import simulator
+from modules.processing import data_processing
+
+
+TABLE = data_processing.load_catalogue('data/oc_data.json').table
+IDS = [0, 2, 3, 5]
+
+
+def counts(report):
+    return np.stack([report.wins_A, report.wins_B, report.draws])
+
+
+def test_matchups_do_not_depend_on_the_cache_or_grouping(tmp_path, monkeypatch):
+    full = balance.analyze(TABLE, IDS, battles=20, seed=4, workers=1, cache_path=None)
+
+    cache_path = str(tmp_path / 'balance.db')
+    balance.analyze(TABLE, IDS[:3], battles=20, seed=4, workers=1, cache_path=cache_path)
+    monkeypatch.setattr(balance, 'BATTLES_PER_TASK', 400)
+    partly_cached = balance.analyze(TABLE, IDS, battles=20, seed=4, workers=1, cache_path=cache_path)
+    assert np.array_equal(counts(full), counts(partly_cached))
+
+    reseeded = balance.analyze(TABLE, IDS, battles=20, seed=5, workers=1, cache_path=None)
+    assert not np.array_equal(counts(full), counts(reseeded))
+
+
+def test_card_hashes_cover_the_abilities():
+    table = data_processing.load_catalogue('data/oc_data.json').table
+    stats = simulator.get_stat_columns(table)
+    before = balance.get_card_hashes(table, stats)
+    table.ability2[3] = 7
+    after = balance.get_card_hashes(table, stats)
+    assert [ID for ID in range(len(before)) if before[ID] != after[ID]] == [3]
+
+
+def test_cards_without_a_plain_attack_are_rejected():
+    table = data_processing.load_catalogue('data/oc_data.json').table
+    table.abilities[2] = (registry.Ability(99, {'name': 'Quick Strike', 'effect': 'attack', 'priority': 1}),) * 2
+    with pytest.raises(Exception, match='Quick Strike'):
+        balance.analyze(table, IDS, battles=2, workers=1, cache_path=None)
@@ -0,0 +1,56 @@
+from modules.processing import data_processing
+
+
+def make_oc(oc_ID: int, name: str, stars: int = 3, abilities: tuple = (0, 0)) -> dict:
+    return {'cardID': oc_ID, 'name': name, 'ability1': abilities[0], 'ability2': abilities[1], 'baseHP': 30,
+            'baseStars': stars, 'baseAttack': 3, 'baseSpeed': 3, 'baseLuck': 3, 'artPath': '', 'lorePath': '', 'lore': ''}
+
+
+CATALOGUE = data_processing.OCCatalogue([
+    make_oc(0, 'Inflation Alex', stars=5),
+    make_oc(1, 'Axela', stars=5),
+    make_oc(2, 'Tia, Butcher of Souls', abilities=(0, 1)),
+    make_oc(3, 'Alexander'),
+    make_oc(5, "Sun's Chosen")
+])
+
+
+def test_normalize_name():
+    assert data_processing.normalize_name("  Tia,  BUTCHER of Souls! ") == 'tia butcher of souls'
+
+
+def test_search_exact_match_comes_first():
+    assert CATALOGUE.search('axela') == [1]
+    assert CATALOGUE.search('Alexander')[0] == 3
+
+
+def test_search_matches_name_and_word_prefixes():
+    assert CATALOGUE.search('tia') == [2]
+    assert CATALOGUE.search('butcher') == [2]
+    assert set(CATALOGUE.search('alex')) == {0, 3}
+    assert CATALOGUE.search("sun's") == [5]
+
+
+def test_search_falls_back_to_close_spellings():
+    assert CATALOGUE.search('axelaa') == [1]
+    assert CATALOGUE.search('zzzz') == []
+    assert CATALOGUE.search('') == []
+
+
+def test_search_limit():
+    assert len(CATALOGUE.search('a', limit=2)) == 2
+
+
+def test_find_by_ID_or_name():
+    assert CATALOGUE.find('5') == 5
+    assert CATALOGUE.find('4') is None
+    assert CATALOGUE.find('butcher') == 2
+    assert CATALOGUE.find('zzzz') is None
+
+
+def test_indexes():
+    assert CATALOGUE.get_IDs() == [0, 1, 2, 3, 5]
+    assert CATALOGUE.get_by_stars(5) == [0, 1]
+    assert CATALOGUE.get_by_ability(1) == [2]
+    assert CATALOGUE.is_valid_deck([0, 5]) and not CATALOGUE.is_valid_deck([0, 4])
+    assert 4 not in CATALOGUE.table and 5 in CATALOGUE.table
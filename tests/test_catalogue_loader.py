@@ -0,0 +1,50 @@
+import asyncio
+import json
+import os
+
+from modules.processing import data_processing
+
+
+def write_catalogue(path, name: str, mtime: int):
+    with open('data/oc_data.json') as f:
+        data = json.load(f)
+    data['ocs'][0]['name'] = name
+    path.write_text(json.dumps(data))
+    os.utime(path, (mtime, mtime))
+
+
+def test_reload_runs_in_the_background_on_the_event_loop(tmp_path):
+    path = tmp_path / 'oc_data.json'
+    write_catalogue(path, 'First Name', 1000)
+    loader = data_processing.CatalogueLoader(str(path), check_interval=0)
+    old = loader.get()
+    write_catalogue(path, 'Second Name', 2000)
+
+    async def run():
+        assert loader.get() is old  # The check is scheduled, not run on the loop
+        await loader._reload_task
+        return loader.get()
+
+    new = asyncio.run(run())
+    assert new is not old
+    assert new.get(0)['name'] == 'Second Name'
+
+
+def test_broken_file_keeps_the_current_catalogue(tmp_path):
+    path = tmp_path / 'oc_data.json'
+    write_catalogue(path, 'First Name', 1000)
+    loader = data_processing.CatalogueLoader(str(path), check_interval=0)
+    old = loader.get()
+    path.write_text('{')
+    os.utime(path, (2000, 2000))
+    assert asyncio.run(loader.reload_async()) is False
+    assert loader.get() is old
+    assert loader.mtime == 2000  # Not retried until the file changes again
+
+
+def test_reload_without_an_event_loop(tmp_path):
+    path = tmp_path / 'oc_data.json'
+    write_catalogue(path, 'First Name', 1000)
+    loader = data_processing.CatalogueLoader(str(path), check_interval=0)
+    write_catalogue(path, 'Second Name', 2000)
+    assert loader.get().get(0)['name'] == 'Second Name'
@@ -0,0 +1,51 @@
+import asyncio
+import types
+
+import pytest
+
+import bot
+from modules.mechanics import snapshot
+
+
+def resolve(content):
+    return bot.OC_Client.resolve_command(content, bot.parse_command(content))
+
+
+def test_exact_commands():
+    assert resolve('!oc dex 5') == 'dex'
+    assert resolve('!oc battle') == 'battle'
+    assert resolve('!hello') == '!hello'
+
+
+def test_prefixed_commands_match_like_the_original_handlers():
+    assert resolve('!hello!') == '!hello'
+    assert resolve('!hellothere') == '!hello'
+    assert resolve('!oc helpme') == 'help'
+    assert resolve('!oc tally2') == 'tally'
+
+
+def test_other_messages_are_not_commands():
+    assert resolve('hello') is None
+    assert resolve('!oc') is None
+    assert resolve('!oc unknown') is None
+    assert resolve('') is None
+
+
+def test_battle_snapshot_is_removed_unless_cancelled(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, 'SNAPSHOT_DIR', str(tmp_path))
+    channel, author = types.SimpleNamespace(id=1), types.SimpleNamespace(id=2, name='player')
+    client = object.__new__(bot.OC_Client)
+
+    async def play(error):
+        async def run_AI_battle(*args):
+            snapshot.save_snapshot({'channel': 1, 'player': 2}, str(tmp_path))
+            raise error
+        monkeypatch.setattr(client, 'run_AI_battle', run_AI_battle, raising=False)
+        await client.play_AI_battle(channel, author, bot.SESSIONS.start(1, 2))
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(play(asyncio.CancelledError()))
+    assert snapshot.load_snapshots(str(tmp_path)) == [{'channel': 1, 'player': 2}]
+    with pytest.raises(KeyError):
+        asyncio.run(play(KeyError('broken')))
+    assert snapshot.load_snapshots(str(tmp_path)) == []
@@ -0,0 +1,27 @@
+from fractions import Fraction
+
+import numpy as np
+
+from modules.dice import Dice, success_probability
+
+
+# (sides, threshold, roll modifier), including checks that always pass or never pass
+CHECKS = [(20, 10, 0), (20, 15, 3), (20, 12, -4), (20, 1, 0), (20, 20, 0), (20, 21, 0), (20, 5, 30), (20, 30, -5),
+          (6, 4, 1), (6, 0, 0), (6, 7, 0), (100, 50, 7), (1, 1, 0), (1, 2, 0)]
+
+
+def brute_force(n, threshold, roll_modifier):
+    return Fraction(sum(1 for roll in range(1, n + 1) if roll + roll_modifier >= threshold), n)
+
+
+def test_table_matches_brute_force():
+    for n, threshold, roll_modifier in CHECKS:
+        assert success_probability(n, threshold, roll_modifier) == float(brute_force(n, threshold, roll_modifier))
+
+
+def test_table_matches_brute_force_for_arrays():
+    thresholds = np.arange(-3, 26)
+    for roll_modifier in (-6, 0, 4):
+        expected = [float(brute_force(20, threshold, roll_modifier)) for threshold in thresholds]
+        assert success_probability(20, thresholds, roll_modifier).tolist() == expected
+        assert Dice(20).probability(thresholds, roll_modifier).tolist() == expected
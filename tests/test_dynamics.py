@@ -0,0 +1,30 @@
+import numpy as np
+import cv2
+
+from modules.mechanics.oc import OC
+from modules.processing import data_processing
+from modules.processing import dynamics
+
+
+def test_render_keys_follow_the_card_art():
+    table = data_processing.load_catalogue('data/oc_data.json').table
+    party = [OC(table, ID) for ID in (5, 8, 2)]
+    lineup_key = dynamics.get_lineup_slots(party)
+    board_key = dynamics.get_board_key(party, party, party)
+
+    # A catalogue reload can point a card at new art without changing its ID.
+    table.art_path[5] = 'assets/changed.png'
+    assert dynamics.get_lineup_slots(party) != lineup_key
+    assert dynamics.get_board_key(party, party, party) != board_key
+
+
+def test_board_accepts_art_without_alpha(tmp_path, monkeypatch):
+    monkeypatch.setattr(dynamics, '_atlas', False)  # Decode the PNGs, as without a built atlas
+    dynamics.clear_caches()
+    art_path = str(tmp_path / 'bgr.png')
+    cv2.imwrite(art_path, np.full((40, 30, 3), 90, dtype=np.uint8))
+    slots = tuple((art_path, False, 10, 20) for _ in range(3))
+    board = dynamics.compose_board_image(slots, slots, tuple((art_path, True) for _ in range(6)))
+    assert board.shape[2] == 4
+    assert tuple(board[0, 0]) == (90, 90, 90, 255)
+    dynamics.clear_caches()
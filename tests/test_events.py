@@ -0,0 +1,80 @@
+from modules.mechanics.oc import OC
+from modules.mechanics.party import Party
+from modules.mechanics.battlefield import Battlefield
+from modules.mechanics.action import Action
+from modules.mechanics.rng import BattleRNG
+from modules.mechanics import events
+from modules.processing import data_processing
+
+
+TABLE = data_processing.load_catalogue('data/oc_data.json').table
+
+
+def make_party(IDs, owner, HPs, ATK, SPDs):
+    ocs = []
+    for ID, HP, SPD in zip(IDs, HPs, SPDs):
+        oc = OC(TABLE, ID)
+        oc.set('MaxHP', 100)
+        oc.set('HP', HP)
+        oc.set('ATK', ATK)
+        oc.set('SPD', SPD)
+        ocs.append(oc)
+    return Party(ocs, owner, owner)
+
+
+def play_turn(field, targets):
+    """Plays one turn where each party's OCs attack the given positions of the other party."""
+    turn_order = field.calculate_turns()
+    for party_index in range(2):
+        for oc, target in zip(field.get_party(party_index).get_OCs(), targets[party_index]):
+            oc.set_target(target)
+    for oc in turn_order:
+        if not oc.is_defeated():
+            field.add(Action(field, oc, oc.target))
+    text = field.evaluate()
+    field.get_party(0).update()
+    field.get_party(1).update()
+    return text
+
+
+def new_field():
+    # Party A always moves first and hits hard. Party B's front OC goes down to the second hit of turn 1.
+    party_A = make_party((5, 8, 2), 'A', (100, 100, 100), 15, (100, 90, 80))
+    party_B = make_party((4, 3, 0), 'B', (20, 50, 60), 1, (10, 9, 8))
+    return Battlefield(TABLE, party_A, party_B, BattleRNG(1))
+
+
+def test_turn_records_every_attack():
+    field = new_field()
+    text = play_turn(field, ((0, 0, 1), (0, 0, 0)))
+    log = field.log
+
+    assert log.turn == 1 and len(log) == 5
+    # Every action gets a number, even one that does nothing because its OC was defeated earlier in the turn.
+    assert [event.action for event in log] == [1, 2, 3, 5, 6]
+    assert all(event.turn == 1 and event.kind == events.ATTACK for event in log)
+    assert [(event.actor_party, event.actor_ID, event.target_party, event.target_ID) for event in log] == \
+           [(0, 5, 1, 4), (0, 8, 1, 4), (0, 2, 1, 3), (1, 3, 0, 5), (1, 0, 0, 5)]
+    assert [(event.amount, event.HP_before, event.HP_after, event.defeated) for event in log] == \
+           [(15, 20, 5, False), (15, 5, 0, True), (15, 50, 35, False), (1, 100, 99, False), (1, 99, 98, False)]
+    assert log.events[0].actor_HP == 100 and log.events[0].target_max_HP == 100
+
+    # The Discord text is rendered from the same events.
+    assert text == events.render_events(log.events, field)
+    assert text.count(' strikes ') == 4 and text.count(' defeats ') == 1
+
+
+def test_turns_continue_the_numbering():
+    field = new_field()
+    play_turn(field, ((0, 0, 1), (0, 0, 0)))
+    play_turn(field, ((0, 0, 0), (0, 0, 0)))  # Party B's back OC moved up to the front
+
+    second = field.log.get_turn(2)
+    assert field.log.turn == 2 and len(field.log) == 9
+    actions = [event.action for event in second]
+    assert actions == sorted(set(actions)) and actions[0] > field.log.events[4].action
+    assert [(event.target_ID, event.HP_before, event.HP_after) for event in second[:3]] == \
+           [(3, 35, 20), (3, 20, 5), (3, 5, 0)]
+    assert second[2].defeated and not second[1].defeated
+    assert field.log.get_turn(1) == field.log.events[:5]
+    assert field.log.get_turn(3) == []
@@ -0,0 +1,25 @@
+import logging
+
+import pytest
+
+from modules.processing import logs
+
+
+@pytest.fixture
+def restore_loggers():
+    saved = {name: (list(logging.getLogger(name).handlers), logging.getLogger(name).level,
+                    logging.getLogger(name).propagate) for name in logs.LOGGER_NAMES}
+    yield
+    for name, (handlers, level, propagate) in saved.items():
+        logger = logging.getLogger(name)
+        logger.handlers[:] = handlers
+        logger.setLevel(level)
+        logger.propagate = propagate
+
+
+@pytest.mark.parametrize('name', ['bot', '__main__', 'modules.processing.user_store'])
+def test_script_and_module_loggers_are_configured(name, restore_loggers, capsys):
+    logs.configure('INFO', 'text')
+    logging.getLogger(name).info('Battle ended', extra={'player': 12})
+    line = capsys.readouterr().err.strip()
+    assert line.endswith(' INFO ' + name + ' Battle ended player=12')
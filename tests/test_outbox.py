@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+
+from modules.processing import outbox
+
+
+class Channel:
+    """Records what is sent to it, or fails every send."""
+
+    def __init__(self, channel_ID, fail=False):
+        self.id = channel_ID
+        self.fail = fail
+        self.sent = []
+
+    async def send(self, content=None, file=None, files=None):
+        if self.fail:
+            raise ConnectionError('send failed')
+        self.sent.append((content, [file] if file is not None else list(files or [])))
+
+
+def test_split_text_prefers_line_breaks():
+    assert outbox.split_text('') == []
+    assert outbox.split_text('short') == ['short']
+    assert outbox.split_text('aaaa\nbbbb\ncc', limit=10) == ['aaaa\nbbbb', 'cc']
+    assert outbox.split_text('a' * 25, limit=10) == ['a' * 10, 'a' * 10, 'a' * 5]
+    assert all(len(chunk) <= 10 for chunk in outbox.split_text('xyz\n' * 40, limit=10))
+
+
+def test_files_go_on_the_last_chunk_and_extra_messages():
+    channel = Channel(-1)
+    out = outbox.ChannelOutbox(channel)
+    outbox.get_limiter(channel.id).messages = 10 ** 9
+    out.write('a' * outbox.MAX_MESSAGE_LENGTH)
+    out.write('b')
+    for i in range(outbox.MAX_FILES + 1):
+        out.attach('file' + str(i))
+    assert asyncio.run(out.flush()) == 3
+    assert [len(files) for _, files in channel.sent] == [0, outbox.MAX_FILES, 1]
+    assert channel.sent[1][0] == 'b' and channel.sent[2][0] is None
+
+
+def test_rate_limiter_waits_for_the_window():
+    async def run():
+        limiter = outbox.RateLimiter(messages=2, period=0.2)
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.19
+
+
+def test_idle_limiters_are_dropped(monkeypatch):
+    monkeypatch.setattr(outbox, '_limiters', {})
+    monkeypatch.setattr(outbox, '_prune_at', 3)
+    monkeypatch.setattr(outbox, 'MAX_LIMITERS', 3)
+    busy = outbox.get_limiter(1)
+    busy.sent.append(time.monotonic())
+    outbox.get_limiter(2)
+    outbox.get_limiter(3)
+    outbox.get_limiter(4)
+    assert sorted(outbox._limiters) == [1, 4]
+    assert outbox.get_limiter(1) is busy
+
+
+def test_linger_flush_failures_are_logged():
+    async def run():
+        out = outbox.ChannelOutbox(Channel(-2, fail=True), linger=0.01)
+        outbox.get_limiter(-2).messages = 10 ** 9
+        out.write('hello')
+        await asyncio.sleep(0.05)
+        return out
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger(outbox.__name__)
+    logger.addHandler(handler)
+    try:
+        out = asyncio.run(run())
+    finally:
+        logger.removeHandler(handler)
+    assert out._linger_task is None
+    assert [record.getMessage() for record in records] == ['Unable to send battle text']
+    assert records[0].exc_info[0] is ConnectionError
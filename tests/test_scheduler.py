@@ -0,0 +1,60 @@
+from modules.mechanics.oc import OC
+from modules.mechanics.party import Party
+from modules.mechanics.battlefield import Battlefield
+from modules.mechanics.rng import BattleRNG
+from modules.mechanics.scheduler import TurnScheduler
+from modules.processing import data_processing
+from modules.abilities import registry
+
+
+TABLE = data_processing.load_catalogue('data/oc_data.json').table
+
+
+def new_field(seed: int) -> Battlefield:
+    party_A = Party([OC(TABLE, ID) for ID in (5, 8, 2)], 'Player', '1')
+    party_B = Party([OC(TABLE, ID) for ID in (4, 3, 0)], 'AI', 'AI')
+    return Battlefield(TABLE, party_A, party_B, BattleRNG(seed))
+
+
+def test_coins_do_not_consume_the_battle_stream():
+    field = new_field(7)
+    field.calculate_turns()
+    assert field.rng.draws == 0
+
+
+def test_coins_are_derived_from_the_seed():
+    assert new_field(7).get_coins() == new_field(7).get_coins()
+    assert new_field(7).get_coins() != new_field(8).get_coins()
+
+
+def test_coins_settle_ties():
+    ocs = [OC(TABLE, 0), OC(TABLE, 0), OC(TABLE, 0)]
+    scheduler = TurnScheduler(ocs, [0.5, 0.1, 0.9])
+    assert scheduler.get_order() == [ocs[1], ocs[0], ocs[2]]
+    assert scheduler.get_coins(ocs) == [0.5, 0.1, 0.9]
+
+
+def test_priority_goes_first():
+    ocs = [OC(TABLE, 0), OC(TABLE, 0)]
+    scheduler = TurnScheduler(ocs, [0.1, 0.9])
+    scheduler.refresh(ocs, lambda oc: 1 if oc is ocs[1] else 0)
+    assert scheduler.get_order() == [ocs[1], ocs[0]]
+
+
+
+def make_oc(oc_ID, speed, ability):
+    return {'cardID': oc_ID, 'name': 'OC ' + str(oc_ID), 'ability1': ability, 'ability2': ability, 'baseHP': 30,
+            'baseStars': 3, 'baseAttack': 3, 'baseSpeed': speed, 'baseLuck': 3, 'artPath': '', 'lorePath': '', 'lore': ''}
+
+
+def test_ability_priority_goes_before_speed(monkeypatch):
+    monkeypatch.setattr(registry, '_abilities', dict(registry._abilities))
+    registry.register(99, {'name': 'Quick Strike', 'effect': 'attack', 'priority': 1})
+    table = data_processing.OCTable([make_oc(0, 9, 0), make_oc(1, 1, 99), make_oc(2, 5, 0)])
+    party_A = Party([OC(table, 0), OC(table, 1), OC(table, 2)], 'Player', '1')
+    party_B = Party([OC(table, 2), OC(table, 0), OC(table, 0)], 'AI', 'AI')
+    field = Battlefield(table, party_A, party_B, BattleRNG(3))
+
+    order = field.calculate_turns()
+    assert order[0] is party_A.get_OCs()[1]  # Slowest, but its ability has priority
+    assert [oc.SPD for oc in order[1:]] == [9, 9, 9, 5, 5]
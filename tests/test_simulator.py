@@ -0,0 +1,48 @@
+import numpy as np
+
+from modules.mechanics.oc import OC
+from modules.mechanics.party import Party
+from modules.mechanics.battlefield import Battlefield
+from modules.mechanics.action import Action
+from modules.mechanics.rng import BattleRNG
+from modules.mechanics import simulator
+from modules.processing import data_processing
+
+
+TABLE = data_processing.load_catalogue('data/oc_data.json').table
+LINEUP_A = (5, 8, 2)
+LINEUP_B = (4, 3, 0)
+
+
+def play_battle(seed: int) -> tuple:
+    """Plays a battle on the Battlefield with both parties targeting like the simulator's random policy.
+    Returns the winner and the number of turns."""
+    party_A = Party([OC(TABLE, ID) for ID in LINEUP_A], 'Player', '1')
+    party_B = Party([OC(TABLE, ID) for ID in LINEUP_B], 'AI', 'AI')
+    field = Battlefield(TABLE, party_A, party_B, BattleRNG(seed))
+    for turn in range(1, 101):
+        turn_order = field.calculate_turns()
+        for party, enemy in ((party_A, party_B), (party_B, party_A)):
+            for oc in party.get_OCs():
+                oc.set_target(enemy.get_random())  # A position, or None if every enemy is defeated
+        for oc in turn_order:
+            if not oc.is_defeated():
+                field.add(Action(field, oc, oc.target))
+        field.evaluate(render=False)
+        if party_A.is_defeated():
+            return simulator.WINNER_B, turn
+        if party_B.is_defeated():
+            return simulator.WINNER_A, turn
+        party_A.update()
+        party_B.update()
+    return simulator.NO_WINNER, 100
+
+
+def test_simulator_matches_the_battlefield():
+    winners, turns = np.array([play_battle(seed) for seed in range(3000)]).T
+    result = simulator.simulate(simulator.get_stat_columns(TABLE), LINEUP_A, LINEUP_B, n=100000, seed=1)
+
+    # Both sample the same distributions (a win rate of about 0.95), so they agree to within a few standard errors.
+    assert abs(np.mean(winners == simulator.WINNER_A) - result.win_rate()) < 0.015
+    assert abs(np.mean(turns) - np.mean(result.turns)) < 4 * np.std(turns) / np.sqrt(len(turns))
+    assert 0.9 < result.win_rate() < 0.99
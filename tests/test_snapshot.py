@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from modules.mechanics.oc import OC
+from modules.mechanics.party import Party
+from modules.mechanics.battlefield import Battlefield
+from modules.mechanics.action import Action
+from modules.mechanics.rng import BattleRNG
+from modules.mechanics import snapshot
+from modules.processing import data_processing
+
+
+TABLE = data_processing.load_catalogue('data/oc_data.json').table
+MAX_TURNS = 50
+
+
+def new_field(seed: int) -> Battlefield:
+    party_A = Party([OC(TABLE, ID) for ID in (5, 8, 2)], 'Player', '1')
+    party_B = Party([OC(TABLE, ID) for ID in (4, 3, 0)], 'AI', 'AI')
+    return Battlefield(TABLE, party_A, party_B, BattleRNG(seed))
+
+
+def play_turn(field: Battlefield) -> str:
+    """Plays one turn like the battle loop, with every target drawn from the battle stream."""
+    turn_order = field.calculate_turns()
+    for party_index in range(2):
+        enemy = field.get_party(1 - party_index)
+        for oc in field.get_party(party_index).get_OCs():
+            oc.set_target(0 if field.rng.random() < 0.5 else enemy.get_random_backline())
+    for oc in turn_order:
+        if not oc.is_defeated():
+            field.add(Action(field, oc, oc.target))
+    text = field.evaluate()
+    field.get_party(0).update()
+    field.get_party(1).update()
+    return text
+
+
+def is_over(field: Battlefield) -> bool:
+    return field.get_party(0).is_defeated() or field.get_party(1).is_defeated()
+
+
+def play(field: Battlefield, turns: int = MAX_TURNS) -> list:
+    texts = []
+    while len(texts) < turns and not is_over(field):
+        texts.append(play_turn(field))
+    return texts
+
+
+def round_trip(field: Battlefield) -> Battlefield:
+    state = json.loads(json.dumps(snapshot.snapshot_battle(field, 1, 2)))
+    return snapshot.restore_battle(state, TABLE)
+
+
+def test_rng_state_round_trip():
+    rng = BattleRNG(42)
+    for _ in range(300):
+        rng.random()
+    restored = BattleRNG.from_state(json.loads(json.dumps(rng.get_state())))
+    assert [restored.random() for _ in range(600)] == [rng.random() for _ in range(600)]
+
+
+def test_rng_random_many_continues_the_stream():
+    single, batched = BattleRNG(3), BattleRNG(3)
+    expected = [single.random() for _ in range(1000)]
+    values = [batched.random()] + batched.random_many(700).tolist() + [batched.random() for _ in range(299)]
+    assert values == expected
+    assert batched.draws == single.draws
+
+
+def test_resumed_battle_matches_uninterrupted_battle():
+    differing = 0
+    for seed in range(200):
+        expected = play(new_field(seed))
+        field = new_field(seed)
+        split = 1 + seed % 4  # Resume after a few different turns, including after frontline swaps
+        texts = play(field, turns=split)
+        if not is_over(field):
+            texts += play(round_trip(field), turns=MAX_TURNS - split)
+        differing += texts != expected
+    assert differing == 0
+
+
+def test_snapshot_keeps_the_turn_order_coins():
+    field = new_field(11)
+    play(field, turns=2)
+    assert round_trip(field).get_coins() == field.get_coins()
+
+
+def test_snapshot_keeps_the_battle_log():
+    field = new_field(9)
+    play(field, turns=3)
+    restored = round_trip(field)
+    assert restored.log.events == field.log.events
+    assert restored.log.turn == 3
+    play_turn(restored)
+    assert restored.log.events[-1].turn == 4
+
+
+def test_unknown_snapshot_version_is_rejected():
+    state = snapshot.snapshot_battle(new_field(5), 1, 2)
+    state['v'] = 99
+    with pytest.raises(ValueError):
+        snapshot.restore_battle(state, TABLE)
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from modules.processing import user_store
+
+
+def test_json_store_round_trip(tmp_path):
+    path = str(tmp_path / 'users.json')
+    store = user_store.UserStore(path)
+    store.add('1', 'alice')
+    store.set_deck('1', [5, 8, 2])
+    store.add_points('1', 3)
+    assert store.flush() == 1
+    assert store.flush() == 0
+
+    reopened = user_store.UserStore(path)
+    assert reopened.get('1') == {'name': 'alice', 'deck': [5, 8, 2], 'points': 3}
+
+
+def test_failed_json_write_keeps_the_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'users.json')
+    store = user_store.UserStore(path)
+    store.add('1', 'alice')
+    store.flush()
+
+    store.add('2', 'bob')
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(json, 'dump', fail)
+    with pytest.raises(OSError):
+        store.flush()
+    monkeypatch.undo()
+
+    # The old file is untouched, no temp file is left behind and the change is retried on the next flush.
+    with open(path) as f:
+        assert list(json.load(f)) == ['1']
+    assert os.listdir(str(tmp_path)) == ['users.json']
+    assert store.dirty == {'2'}
+    assert store.flush() == 1
+    assert user_store.UserStore(path).get('2')['name'] == 'bob'
+
+
+def test_sqlite_store_round_trip(tmp_path):
+    path = str(tmp_path / 'users.db')
+    store = user_store.SQLiteUserStore(path)
+    store.add('1', 'alice')
+    assert len(store) == 1
+    store.add_points('1', 4)
+    assert store.flush() == 1
+    assert len(store) == 1
+    store.close()
+
+    reopened = user_store.SQLiteUserStore(path)
+    assert reopened.get('1') == {'name': 'alice', 'deck': [], 'points': 4}
+    assert reopened.get('2') is None
+    reopened.close()
+
+
+def test_sqlite_store_async_lookups(tmp_path):
+    path = str(tmp_path / 'users.db')
+    store = user_store.SQLiteUserStore(path)
+    store.add('1', 'alice')
+    store.flush()
+    store.close()
+
+    async def run():
+        store = user_store.SQLiteUserStore(path)
+        assert (await store.get_async('1'))['name'] == 'alice'
+        assert await store.get_async('2') is None
+        store.add('2', 'bob')
+        assert await store.count_async() == 2
+        assert await store.flush_async() == 1
+        assert '2' not in store._missing
+        assert await store.count_async() == 2
+        store.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_count_includes_users_being_written(tmp_path):
+    store = user_store.SQLiteUserStore(str(tmp_path / 'users.db'))
+    store.add('1', 'alice')
+    store.flush()
+    write = store._write
+    steps = []
+
+    def slow_write(records):
+        steps[0].wait()
+        write(records)
+        steps[1].set()
+        steps[2].wait()
+
+    async def run():
+        steps.extend(threading.Event() for _ in range(3))
+        store._write = slow_write
+        assert store.get('2') is None
+        store.add('2', 'bob')
+        flush = asyncio.create_task(store.flush_async())
+        await asyncio.sleep(0.01)
+        assert store.dirty == set()
+        assert await store.count_async() == 2  # Taken from the dirty set, not written yet
+        steps[0].set()
+        await asyncio.get_running_loop().run_in_executor(None, steps[1].wait)
+        assert await store.count_async() == 2  # Written, but the flush has not finished
+        steps[2].set()
+        assert await flush == 1
+        assert await store.count_async() == 2 and len(store) == 2
+
+    asyncio.run(run())
+    store.close()
+
+
+def test_sqlite_store_evicts_clean_users(tmp_path):
+    store = user_store.SQLiteUserStore(str(tmp_path / 'users.db'), max_cached=2)
+    for user_ID in '123':
+        store.add(user_ID, 'user ' + user_ID)
+    assert len(store.users) == 3  # Unsaved users are never evicted
+    store.flush()
+    assert list(store.users) == ['2', '3']
+
+    store.get('2')  # Now the most recently used
+    store.set_deck('1', [4])
+    assert list(store.users) == ['2', '1']
+    store.flush()
+    store.users.clear()
+    assert store.get('1')['deck'] == [4] and store.get('3')['name'] == 'user 3'
+    assert len(store) == 3
+    store.close()
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_concurrent_adds_create_the_user_once(tmp_path, backend):
+    async def run():
+        store = user_store.open_store(backend, str(tmp_path / 'users'))
+        added = await asyncio.gather(*[store.add_async('1', 'alice') for _ in range(3)])
+        assert [user is not None for user in added].count(True) == 1
+        assert await store.add_async('1', 'alice') is None
+        assert await store.count_async() == 1
+        store.close()
+
+    asyncio.run(run())